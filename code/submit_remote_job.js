@@ -4,7 +4,7 @@ const path = require('path')
 const { execSync } = require('child_process')
 
 function usage() {
-  console.error('Usage: submit_remote_job.js <absolute-audio-path> [--model htdemucs_ft] [--two-stems vocals] [--jobs 4] [--shifts 4] [--segments 0] [--clip-mode rescale]')
+  console.error('Usage: submit_remote_job.js <absolute-audio-path> [--model htdemucs_ft] [--two-stems vocals] [--jobs 4] [--shifts 4] [--segments 0] [--clip-mode rescale] [--target latency|balanced|quality]')
   process.exit(2)
 }
 
@@ -23,9 +23,15 @@ function getArg(flag, def) {
 
 const model = getArg('--model', 'htdemucs_ft')
 const twoStems = getArg('--two-stems', 'vocals')
-const jobs = parseInt(getArg('--jobs', '4'), 10)
-const shifts = parseInt(getArg('--shifts', '4'), 10)
-const segments = parseFloat(getArg('--segments', '0'))
+// With --target the watcher picks jobs/shifts/segments for its hardware ("auto")
+const target = getArg('--target', '')
+function numArg(flag, def, parse) {
+  const v = getArg(flag, target ? 'auto' : def)
+  return v === 'auto' ? 'auto' : parse(v)
+}
+const jobs = numArg('--jobs', '4', v => parseInt(v, 10))
+const shifts = numArg('--shifts', '4', v => parseInt(v, 10))
+const segments = numArg('--segments', '0', parseFloat)
 const clipMode = getArg('--clip-mode', 'rescale')
 
 const filename = path.basename(audioPath)
@@ -57,6 +63,7 @@ const job = {
   clip_mode: clipMode,
   source_url: url,
 }
+if (target) job.target = target
 
 const repoRoot = path.resolve(__dirname, '..')
 const feedPath = path.join(repoRoot, 'remote_jobs.jsonl')
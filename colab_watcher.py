@@ -1,5 +1,18 @@
 import json, time, pathlib, threading, datetime, subprocess, traceback, os, sys, urllib.request
+import urllib.parse
+import urllib.error
+import http.client
 import shutil
+import queue
+from concurrent.futures import ThreadPoolExecutor
+import re
+import hashlib
+import tempfile
+from collections import OrderedDict
+from contextlib import contextmanager
+import socket
+import uuid
+import logging
 
 # Allow overriding the root (e.g., Kaggle). Defaults to Colab MyDrive.
 ROOT = pathlib.Path(os.environ.get('DSU_ROOT', '/content/drive/MyDrive/M4L-Demucs'))
@@ -7,9 +20,27 @@ SITE = ROOT / '.venv' / 'site-packages'
 MODEL_CACHE = ROOT / 'model-cache'
 os.environ.setdefault('XDG_CACHE_HOME', str(MODEL_CACHE))
 os.environ.setdefault('DEMUCS_CACHE', str(MODEL_CACHE))
+# Checkpoints are loaded from fast local disk; ModelCache fills it from
+# MODEL_CACHE on Drive, the Kaggle dataset or the Demucs CDN (torch.hub
+# looks in $TORCH_HOME/hub/checkpoints).
+LOCAL_MODELS = pathlib.Path(os.environ.get('DSU_LOCAL_MODELS', os.path.join(tempfile.gettempdir(), 'dsu-models')))
+os.environ.setdefault('TORCH_HOME', str(LOCAL_MODELS))
 if SITE.exists():
     if str(SITE) not in sys.path:
         sys.path.insert(0, str(SITE))
+# Helpers shared with the HF Space (result-cache keys, output formats,
+# chunking, silence skipping, metrics, autotune tables) are imported from
+# hf_space/ next to this file, so both sides run the same code.
+SHARED = pathlib.Path(__file__).resolve().parent / 'hf_space'
+if str(SHARED) not in sys.path:
+    sys.path.insert(0, str(SHARED))
+from autotune import MAX_RTF as AUTOTUNE_MAX_RTF, MODEL_SHAPES, SEGMENT_GB_PER_S, TARGETS, meminfo_gb
+from chunking import split_audio, stitch_stems
+from metrics import Registry
+from output import ENCODE_WORKERS, FORMATS, HIRES, encode_stem, normalize_format
+from result_cache import ResultCache, cache_key, file_sha256
+import silence
+from silence import SILENCE_DB, expand as expand_silence
 JOBS = ROOT / 'jobs'
 AUDIO = JOBS / 'audio'
 OUT   = ROOT / 'out'
@@ -20,73 +51,1024 @@ for p in [ROOT, JOBS, AUDIO, OUT]:
 
 HEARTBEAT = ROOT / 'heartbeat.json'
 REMOTE_JOBS_URL = os.environ.get('DSU_REMOTE_JOBS_URL')
+# 'inprocess' keeps models loaded in a long-lived worker thread; 'subprocess'
+# runs `python -m demucs.separate` per job as before.
+ENGINE_MODE = os.environ.get('DSU_ENGINE_MODE', 'inprocess').strip().lower()
+# 'stub' swaps Demucs for a deterministic split of the input (benchmarks of
+# the orchestration itself, see tools/bench_pipeline.py)
+SEPARATOR = os.environ.get('DSU_SEPARATOR', 'demucs').strip().lower()
+# How many models the worker keeps resident on the GPU (LRU).
+GPU_MODELS = max(1, int(os.environ.get('DSU_GPU_MODELS', '2')))
+# Content-addressed separation results (same layout as the HF Space's cache)
+RESULT_CACHE_DIR = ROOT / 'result-cache'
+CACHE_MAX_MB = float(os.environ.get('DSU_CACHE_MAX_MB', '4096'))
+CACHE_ENABLED = os.environ.get('DSU_RESULT_CACHE', '1') not in ('0', 'false', 'no')
+# Minimum seconds between progress-only rewrites of status.json
+STATUS_INTERVAL_S = float(os.environ.get('DSU_STATUS_INTERVAL_S', '2'))
+# Prometheus text file next to heartbeat.json (node_exporter textfile collector format)
+METRICS_FILE = ROOT / 'metrics.prom'
+METRICS = Registry()
+METRICS.counter('dsu_jobs_total', 'Finished jobs by status')
+METRICS.counter('dsu_bytes_in_total', 'Downloaded input bytes')
+METRICS.counter('dsu_bytes_out_total', 'Stem bytes published to out/')
+METRICS.histogram('dsu_phase_seconds', 'Duration of job spans (download, separate, encode, ...)')
+METRICS.histogram('dsu_model_load_seconds', 'Cold model loads by model')
+
+def _stage_util(field):
+    if PIPELINE is None:
+        return None
+    return {'label': 'stage', 'values': {k: v[field] for k, v in PIPELINE.utilization().items()}}
+
+METRICS.gauge('dsu_cache_lookups', 'Result cache lookups by result',
+              lambda: {'label': 'result', 'values': {'hit': RESULT_CACHE.hits, 'miss': RESULT_CACHE.misses}})
+METRICS.gauge('dsu_jobs_in_flight', 'Jobs admitted to the pipeline',
+              lambda: len(PIPELINE.in_flight) if PIPELINE else 0)
+METRICS.gauge('dsu_queue_pending', 'Unfinished jobs seen by the last scan', lambda: WATCH_STATS.get('pending'))
+METRICS.gauge('dsu_pickup_latency_seconds', 'Average time from job file to pickup',
+              lambda: WATCH_STATS.get('pickup_latency_s_avg'))
+METRICS.gauge('dsu_scan_seconds', 'Average duration of one queue scan',
+              lambda: (WATCH_STATS.get('scan_ms_avg') or 0) / 1000)
+METRICS.gauge('dsu_stage_utilization', 'Busy share of each pipeline stage', lambda: _stage_util('util'))
+METRICS.gauge('dsu_stage_busy_seconds', 'Busy seconds of each pipeline stage', lambda: _stage_util('busy_s'))
+
+def write_metrics():
+    tmp = METRICS_FILE.with_name(f'.{METRICS_FILE.name}.tmp')
+    tmp.write_text(METRICS.render())
+    os.replace(tmp, METRICS_FILE)
+
+# Assumed length of a job before any has finished here (same default as the Space)
+CAPACITY_JOB_S = 60.0
+WAITING_PHASES = ('queued', 'fetch', 'silence', 'split')
+RUNNING_PHASES = ('preview', 'prepare', 'separate')
+
+def capacity():
+    """Load and speed of this worker, for tools/dsu_router.py.
+
+    speed is audio seconds per second for one pass of each measured model,
+    wait_s the estimated time until a newly queued job reaches the GPU.
+    models_loaded is None in subprocess mode, where every run loads its model.
+    """
+    hw = AUTOTUNER.probe()
+    tasks = PIPELINE.tasks() if PIPELINE else []
+    current = []
+    waiting = 0
+    for t in tasks:
+        doc = t.st.doc
+        if doc['phase'] in RUNNING_PHASES:
+            current.append({'id': t.jid, 'model': t.params['model'], 'phase': doc['phase'],
+                            'progress': doc.get('progress'), 'eta_s': doc.get('eta_s')})
+        elif doc['phase'] in WAITING_PHASES:
+            waiting += 1
+    # Queued files the scan saw but the pipeline has not admitted yet
+    waiting += max(0, (WATCH_STATS.get('pending') or 0) - len(tasks))
+    sep = PIPELINE.stats['separate'] if PIPELINE else {'jobs': 0}
+    job_s = sep['busy_s'] / sep['jobs'] if sep['jobs'] else CAPACITY_JOB_S
+    speed = {}
+    for key, cost in dict(AUTOTUNER.costs).items():
+        device, _, model = key.partition(':')
+        if device == hw['device'] and cost > 0:
+            speed[model] = round(1 / (cost * MODEL_SHAPES.get(model, (1, 0))[0]), 3)
+    eta = sum(c['eta_s'] if c['eta_s'] is not None else job_s for c in current)
+    return {
+        'kind': 'watcher', 'device': hw['device'], 'gpu': hw['gpu'], 'cores': hw['cores'], 'slots': 1,
+        'queue_depth': waiting, 'running': len(current), 'current': current,
+        'models_loaded': WORKER.loaded() if engine_available() else None,
+        'speed': speed, 'job_s_avg': round(job_s, 1), 'wait_s': round(eta + waiting * job_s, 1),
+    }
 
 def beat():
     while True:
+        try:
+            cap = capacity()
+        except Exception as e:
+            # Never let the estimate cost the liveness signal
+            cap = {'error': f'{type(e).__name__}: {e}'}
         try:
             HEARTBEAT.write_text(json.dumps({
                 'alive': True,
-                'ts': datetime.datetime.now(datetime.timezone.utc).isoformat()
+                'ts': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                'cache': {'hits': RESULT_CACHE.hits, 'misses': RESULT_CACHE.misses},
+                'worker': WORKER_ID,
+                'watch': WATCH_STATS,
+                'pipeline': PIPELINE.utilization() if PIPELINE else None,
+                'capacity': cap,
             }))
+            write_metrics()
         except Exception:
             pass
         time.sleep(5)
 
+def atomic_write_json(path, data):
+    """Write via temp file + rename so readers (the Max device, Drive sync)
+    never see half-written JSON."""
+    tmp = path.with_name(f'.{path.name}.{os.getpid()}.tmp')
+    tmp.write_text(json.dumps(data))
+    os.replace(tmp, path)
+
 def write_status(job_id, **kw):
     sd = OUT / job_id
     sd.mkdir(parents=True, exist_ok=True)
-    (sd / 'status.json').write_text(json.dumps(kw))
+    atomic_write_json(sd / 'status.json', kw)
+
+def write_done(job_id, **kw):
+    """Write out/<id>/done.json and record the final state in the ledger."""
+    sd = OUT / job_id
+    sd.mkdir(parents=True, exist_ok=True)
+    atomic_write_json(sd / 'done.json', kw)
+    LEDGER.set(job_id, kw.get('status', 'done'))
+    METRICS.inc('dsu_jobs_total', status=kw.get('status', 'done'))
+
+class StatusWriter:
+    """Coalesced status.json for one job.
+
+    Progress updates are merged in memory and written at most every
+    STATUS_INTERVAL_S; status or phase changes are written immediately.
+    Publishes progress, eta_s, throughput (audio seconds per second) and the
+    seconds spent in each phase rather than raw log lines.
+    """
+
+    def __init__(self, jid, interval=None):
+        self.jid = jid
+        self.interval = STATUS_INTERVAL_S if interval is None else interval
+        self.doc = {'status': 'queued', 'phase': 'queued', 'progress': 0.0, 'eta_s': None, 'phases': {}, 'spans': []}
+        self.last_log = ''
+        self._t0 = time.time()
+        self._phase_t0 = time.time()
+        self._sep_t0 = None
+        self._written = 0.0
+        self._dirty = False
+
+    def _enter_phase(self, phase):
+        now = time.time()
+        prev = self.doc['phase']
+        if phase == prev:
+            return False
+        phases = self.doc['phases']
+        phases[prev] = round(phases.get(prev, 0.0) + now - self._phase_t0, 3)
+        self._phase_t0 = now
+        self.doc['phase'] = phase
+        if phase == 'separate' and self._sep_t0 is None:
+            self._sep_t0 = now
+        return True
+
+    def update(self, status=None, phase=None, **kw):
+        force = False
+        if status and status != self.doc['status']:
+            self.doc['status'] = status
+            force = True
+        if phase:
+            force = self._enter_phase(phase) or force
+        self.doc.update(kw)
+        self._dirty = True
+        if force or time.time() - self._written >= self.interval:
+            self.flush()
+
+    def add_span(self, name, start, end):
+        """Record a timed span (seconds from pickup) and feed dsu_phase_seconds."""
+        self.doc['spans'].append({'name': name, 'start_s': round(start - self._t0, 3), 'dur_s': round(end - start, 3)})
+        self._dirty = True
+        METRICS.observe('dsu_phase_seconds', end - start, phase=name)
+
+    @contextmanager
+    def span(self, name):
+        t0 = time.time()
+        try:
+            yield
+        finally:
+            self.add_span(name, t0, time.time())
+
+    def event(self, ev):
+        """Fold a run_demucs() event into the status."""
+        kw = {k: v for k, v in ev.items() if k not in ('phase', 'progress', 'log', 'track')}
+        if ev.get('log'):
+            self.last_log = ev['log']
+        progress = ev.get('progress')
+        if progress is not None:
+            progress = max(0.0, min(1.0, float(progress)))
+            kw['progress'] = round(progress, 4)
+            elapsed = time.time() - (self._sep_t0 or time.time())
+            if progress >= 0.02 and elapsed > 0:
+                kw['eta_s'] = round(elapsed * (1 - progress) / progress, 1)
+                audio_s = self.doc.get('audio_s') or ev.get('audio_s')
+                if audio_s:
+                    kw['throughput'] = round(audio_s * progress / elapsed, 3)
+        self.update(status='running', phase=ev.get('phase'), **kw)
+
+    def flush(self):
+        if not self._dirty:
+            return
+        doc = dict(self.doc)
+        doc['phases'] = dict(self.doc['phases'])
+        doc['phases'][doc['phase']] = round(doc['phases'].get(doc['phase'], 0.0) + time.time() - self._phase_t0, 3)
+        doc['updated'] = time.time()
+        try:
+            write_status(self.jid, **doc)
+        except OSError as e:
+            print(f"[Watcher] status write failed for {self.jid}: {e}")
+        self._written = time.time()
+        self._dirty = False
+
+# In-process downloader: keep-alive connections, parallel HTTP Range chunks,
+# resume from <dest>.part (+ .part.json listing finished chunks), size/sha256
+# verification, then an atomic rename into jobs/audio.
+DOWNLOAD_CONCURRENCY = max(1, int(os.environ.get('DSU_DOWNLOAD_CONCURRENCY', '2')))
+DOWNLOAD_PARTS = max(1, int(os.environ.get('DSU_DOWNLOAD_PARTS', '4')))
+DOWNLOAD_CHUNK_MB = max(1, int(os.environ.get('DSU_DOWNLOAD_CHUNK_MB', '8')))
+DOWNLOAD_RETRIES = max(0, int(os.environ.get('DSU_DOWNLOAD_RETRIES', '4')))
+DOWNLOAD_TIMEOUT_S = float(os.environ.get('DSU_DOWNLOAD_TIMEOUT_S', '30'))
+_DOWNLOAD_SLOTS = threading.BoundedSemaphore(DOWNLOAD_CONCURRENCY)
+_RANGE_POOL = ThreadPoolExecutor(DOWNLOAD_CONCURRENCY * DOWNLOAD_PARTS, thread_name_prefix='dsu-range')
+_CONNS = threading.local()
+
+def _conn(scheme, netloc, fresh=False):
+    """Per-thread keep-alive connection for (scheme, host)."""
+    pool = getattr(_CONNS, 'pool', None)
+    if pool is None:
+        pool = _CONNS.pool = {}
+    key = (scheme, netloc)
+    if fresh and key in pool:
+        pool.pop(key).close()
+    if key not in pool:
+        cls = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+        pool[key] = cls(netloc, timeout=DOWNLOAD_TIMEOUT_S)
+    return pool[key]
+
+def _open(url, headers=None, redirects=5):
+    """GET url on a pooled connection, following redirects.
+
+    Returns (response, final_url); the caller must read the body fully so
+    the connection can be reused.
+    """
+    for _ in range(redirects + 1):
+        u = urllib.parse.urlsplit(url)
+        path = (u.path or '/') + (f'?{u.query}' if u.query else '')
+        h = {'User-Agent': 'dsu-watcher', 'Accept-Encoding': 'identity', **(headers or {})}
+        try:
+            conn = _conn(u.scheme, u.netloc)
+            conn.request('GET', path, headers=h)
+            resp = conn.getresponse()
+        except (http.client.HTTPException, OSError):
+            # Stale keep-alive socket: retry once on a fresh connection
+            conn = _conn(u.scheme, u.netloc, fresh=True)
+            conn.request('GET', path, headers=h)
+            resp = conn.getresponse()
+        if resp.status in (301, 302, 303, 307, 308) and resp.getheader('Location'):
+            resp.read()
+            url = urllib.parse.urljoin(url, resp.getheader('Location'))
+            continue
+        if resp.status >= 400:
+            resp.read()
+            raise RuntimeError(f'HTTP {resp.status} {resp.reason} for {url}')
+        return resp, url
+    raise RuntimeError(f'too many redirects for {url}')
+
+def _copy_body(resp, f, expected=None):
+    n = 0
+    while True:
+        block = resp.read(1 << 18)
+        if not block:
+            break
+        f.write(block)
+        n += len(block)
+    if expected is not None and n != expected:
+        raise RuntimeError(f'short read: got {n} of {expected} bytes')
+    return n
+
+def _fetch_range(url, part, start, end, stats, lock):
+    """Fetch bytes [start, end] into part, retrying with backoff.
+
+    Runs on several part threads at once; stats is only updated under lock.
+    """
+    for attempt in range(DOWNLOAD_RETRIES + 1):
+        try:
+            resp, _ = _open(url, {'Range': f'bytes={start}-{end}'})
+            if resp.status != 206:
+                resp.read()
+                raise RuntimeError(f'expected 206 for range, got {resp.status}')
+            with open(part, 'r+b') as f:
+                f.seek(start)
+                return _copy_body(resp, f, end - start + 1)
+        except Exception:
+            if attempt >= DOWNLOAD_RETRIES:
+                raise
+            with lock:
+                stats['retries'] += 1
+            time.sleep(min(8, 0.5 * 2 ** attempt))
+
+def download_file(url, dest, expected_size=None, sha256=None):
+    """Download url to dest atomically; returns a stats dict.
+
+    Large files on servers that honour Range are fetched as parallel chunks
+    and resume from dest.part across failures and restarts. Otherwise the
+    body is streamed in one request.
+    """
+    dest = pathlib.Path(dest)
+    part = dest.with_name(dest.name + '.part')
+    meta_path = dest.with_name(dest.name + '.part.json')
+    stats = {'bytes': 0, 'resumed_bytes': 0, 'retries': 0, 'parts': 1, 'seconds': 0.0}
+    t0 = time.time()
+    for attempt in range(DOWNLOAD_RETRIES + 1):
+        try:
+            resp, final_url = _open(url, {'Range': 'bytes=0-0'})
+            break
+        except Exception:
+            if attempt >= DOWNLOAD_RETRIES:
+                raise
+            stats['retries'] += 1
+            time.sleep(min(8, 0.5 * 2 ** attempt))
+    crange = resp.getheader('Content-Range') or ''
+    if resp.status == 206 and '/' in crange and not crange.endswith('/*'):
+        resp.read()
+        size = int(crange.rsplit('/', 1)[1])
+        etag = resp.getheader('ETag') or ''
+        chunk = DOWNLOAD_CHUNK_MB * 1024 * 1024
+        chunks = [(i, min(i + chunk, size) - 1) for i in range(0, size, chunk)]
+        meta = {}
+        try:
+            meta = json.loads(meta_path.read_text())
+        except Exception:
+            pass
+        resumable = (part.exists() and meta.get('url') == url and meta.get('size') == size
+                     and meta.get('etag', '') == etag and part.stat().st_size == size)
+        done = set(meta.get('done', [])) if resumable else set()
+        if not resumable:
+            with open(part, 'wb') as f:
+                f.truncate(size)
+        stats['resumed_bytes'] = sum(chunks[i][1] - chunks[i][0] + 1 for i in done if i < len(chunks))
+        todo = [i for i in range(len(chunks)) if i not in done]
+        stats['parts'] = min(DOWNLOAD_PARTS, max(1, len(todo)))
+        lock = threading.Lock()
+
+        def _one(i):
+            n = _fetch_range(final_url, part, chunks[i][0], chunks[i][1], stats, lock)
+            with lock:
+                done.add(i)
+                stats['bytes'] += n
+                tmp = meta_path.with_suffix('.tmp')
+                tmp.write_text(json.dumps({'url': url, 'size': size, 'etag': etag, 'done': sorted(done)}))
+                os.replace(tmp, meta_path)
+
+        # Each submitted chunk is pulled by one of DOWNLOAD_PARTS concurrent lanes
+        lanes = [todo[k::stats['parts']] for k in range(stats['parts'])]
+        futures = [_RANGE_POOL.submit(lambda idxs: [_one(i) for i in idxs], lane) for lane in lanes]
+        for fut in futures:
+            fut.result()
+    else:
+        size = resp.getheader('Content-Length')
+        size = int(size) if size is not None and resp.status == 200 else None
+        if resp.status == 206:
+            # Range answered but without a usable total; fetch the whole body
+            resp.read()
+            resp, _ = _open(url)
+        with open(part, 'wb') as f:
+            stats['bytes'] = _copy_body(resp, f, size)
+        size = stats['bytes']
+    if expected_size is not None and int(expected_size) != size:
+        raise RuntimeError(f'size mismatch: expected {expected_size}, got {size}')
+    if part.stat().st_size != size:
+        raise RuntimeError(f'incomplete download: {part.stat().st_size} of {size} bytes')
+    if sha256 and file_sha256(part) != str(sha256).lower():
+        part.unlink()
+        meta_path.unlink(missing_ok=True)
+        raise RuntimeError('sha256 mismatch')
+    os.replace(part, dest)
+    meta_path.unlink(missing_ok=True)
+    stats['seconds'] = round(time.time() - t0, 3)
+    stats['mb_s'] = round(stats['bytes'] / 1e6 / max(stats['seconds'], 1e-6), 2)
+    stats['size'] = size
+    return stats
+
+def gdrive_url(file_id):
+    return f'https://drive.usercontent.google.com/download?id={urllib.parse.quote(file_id)}&export=download&confirm=t'
+
+def notify_input_ready(job):
+    # Best-effort ping so the submitter knows the input is in place
+    try:
+        notify = job.get('notify_url')
+        if notify:
+            urllib.request.urlopen(notify, timeout=2).read(0)
+    except Exception:
+        pass
 
 def download_input_if_needed(jid: str, job: dict):
+    """Make sure jobs/audio/<jid>.wav exists; returns download stats or None."""
     dest = AUDIO / f'{jid}.wav'
     if dest.exists():
         # If already present and notify_url is provided, best-effort notify
+        notify_input_ready(job)
+        return None
+    sources = []
+    if job.get('source_url'):
+        sources.append(('source_url', job['source_url']))
+    if job.get('gdrive_id'):
+        sources.append(('gdrive_id', gdrive_url(job['gdrive_id'])))
+    last_err = None
+    for kind, url in sources:
         try:
-            notify = job.get('notify_url')
-            if notify:
-                urllib.request.urlopen(notify, timeout=2).read(0)
-        except Exception:
-            pass
-        return
-    url = job.get('source_url')
-    gdrive_id = job.get('gdrive_id')
-    if url:
-        try:
-            print(f"[Watcher] FETCH {jid} from source_url {url}")
-            cmd = ['curl', '-L', '-o', str(dest), url]
-            subprocess.check_call(cmd)
-            print(f"[Watcher] FETCH OK {jid} -> {dest}")
-            try:
-                notify = job.get('notify_url')
-                if notify:
-                    urllib.request.urlopen(notify, timeout=2).read(0)
-            except Exception:
-                pass
+            print(f"[Watcher] FETCH {jid} from {kind} {url}")
+            with _DOWNLOAD_SLOTS:
+                info = download_file(url, dest, expected_size=job.get('size'), sha256=job.get('sha256'))
+            print(f"[Watcher] FETCH OK {jid} -> {dest} bytes={info['bytes']} resumed={info['resumed_bytes']} "
+                  f"parts={info['parts']} {info['mb_s']}MB/s retries={info['retries']} in {info['seconds']}s")
+            notify_input_ready(job)
+            return info
+        except Exception as e:
+            last_err = f'{type(e).__name__}: {e}'
+            print(f"[Watcher] FETCH failed {jid} from {kind}: {last_err}")
+    if job.get('gdrive_id') and shutil.which('gdown'):
+        # Last resort for Drive links the direct endpoint refuses (quota/virus-scan pages)
+        part = dest.with_name(dest.name + '.part')
+        try:
+            subprocess.check_call(['gdown', '--id', job['gdrive_id'], '-O', str(part)])
+            os.replace(part, dest)
+            print(f"[Watcher] FETCH OK {jid} -> {dest} (gdown)")
+            notify_input_ready(job)
+            return {'via': 'gdown'}
+        except Exception as e:
+            print(f"[Watcher] FETCH failed {jid} via gdown: {e}")
+    if last_err:
+        raise RuntimeError(f'Could not fetch input for {jid}: {last_err}')
+    raise RuntimeError('Input WAV missing and no valid source_url/gdrive_id to fetch it')
+
+# Where checkpoints may already exist, besides MODEL_CACHE on Drive
+MODEL_SOURCES = [pathlib.Path(p) for p in os.environ.get(
+    'DSU_MODEL_SOURCES', '/kaggle/input/dsu-cache/models').split(os.pathsep) if p]
+DEMUCS_CDN = 'https://dl.fbaipublicfiles.com/demucs/'
+
+class ModelCache:
+    """Copies Demucs checkpoints to local disk before a job needs them.
+
+    A model name resolves, through the yaml/files.txt shipped with demucs,
+    to checkpoint files named <sig>-<sha256 prefix>.th. Each file is taken
+    from the first source that has it (Drive MODEL_CACHE, the Kaggle
+    dataset's models/, else the CDN) and copied to LOCAL_MODELS while
+    hashing. It is only used if the hash matches the prefix. Downloads are
+    written back to Drive so the next runtime copies instead of downloading.
+    Models it cannot resolve are left to Demucs, with Drive's checkpoints
+    linked in and whatever Demucs downloads persisted afterwards.
+    """
+
+    def __init__(self, local=LOCAL_MODELS, drive=MODEL_CACHE, sources=MODEL_SOURCES):
+        self.dir = pathlib.Path(local) / 'hub' / 'checkpoints'
+        self.drive = pathlib.Path(drive)
+        self.keep = self.drive / 'torch' / 'hub' / 'checkpoints'
+        self.sources = [pathlib.Path(drive)] + list(sources)
+        self.stats = {'ready': [], 'copied': 0, 'downloaded': 0, 'bad_hash': 0, 'failed': 0,
+                      'bytes': 0, 'seconds': 0.0}
+        self._files = None
+        self._index = None
+        self._locks = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(1, thread_name_prefix='dsu-models')
+        self._queued = set()
+        self._persisted = set()
+
+    def _remote(self):
+        """(demucs 'remote' dir, {sig: relative url}), read without importing torch."""
+        if self._files is None:
+            import importlib.util
+            spec = importlib.util.find_spec('demucs')
+            remote = pathlib.Path(spec.origin).parent / 'remote' if spec and spec.origin else None
+            files = {}
+            if remote is not None and (remote / 'files.txt').exists():
+                root = ''
+                for line in (remote / 'files.txt').read_text().splitlines():
+                    line = line.strip()
+                    if not line or line.startswith('#'):
+                        continue
+                    if line.startswith('root:'):
+                        root = line.split(':', 1)[1].strip()
+                    else:
+                        files[line.split('-', 1)[0]] = root + line
+            self._files = (remote, files)
+        return self._files
+
+    def checkpoints(self, name):
+        """Relative CDN paths of the checkpoints behind a model name (or signature)."""
+        remote, files = self._remote()
+        if name in files:
+            return [files[name]]
+        if remote is None or not (remote / f'{name}.yaml').exists():
+            return []
+        m = re.search(r'models:\s*\[([^\]]*)\]', (remote / f'{name}.yaml').read_text())
+        sigs = re.findall(r"[0-9a-f]{8}", m.group(1)) if m else []
+        return [files[s] for s in sigs if s in files]
+
+    def _find(self, filename):
+        # Rebuilt on a miss: checkpoints may be added to the sources mid-session
+        if self._index is None or filename not in self._index:
+            index = {}
+            for src in self.sources:
+                if src.exists():
+                    for p in src.rglob('*.th'):
+                        index.setdefault(p.name, p)
+            self._index = index
+        return self._index.get(filename)
+
+    @staticmethod
+    def _sha256(path):
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(8 << 20), b''):
+                h.update(block)
+        return h.hexdigest()
+
+    @staticmethod
+    def _copy_hashed(src, dst):
+        h = hashlib.sha256()
+        tmp = dst.with_name(dst.name + '.part')
+        with open(src, 'rb') as fin, open(tmp, 'wb') as fout:
+            for block in iter(lambda: fin.read(8 << 20), b''):
+                h.update(block)
+                fout.write(block)
+        return tmp, h.hexdigest()
+
+    def ensure(self, name):
+        """Make every checkpoint of `name` available locally; True when all verified."""
+        rels = self.checkpoints(name) if SEPARATOR != 'stub' else []
+        if not rels:
+            if SEPARATOR != 'stub':
+                self.link_drive()  # unknown to this demucs build: let demucs resolve it
+            return False
+        with self._lock:
+            lock = self._locks.setdefault(name, threading.Lock())
+        with lock:
+            if name in self.stats['ready']:
+                return True
+            t0 = time.time()
+            self.dir.mkdir(parents=True, exist_ok=True)
+            ok = all(self._ensure_file(rel) for rel in rels)
+            self.stats['seconds'] = round(self.stats['seconds'] + time.time() - t0, 2)
+            if ok:
+                self.stats['ready'].append(name)
+                print(f"[Watcher] MODELS {name} ready locally ({len(rels)} checkpoints, {time.time() - t0:.1f}s)")
+            else:
+                self.link_drive()
+            return ok
+
+    def link_drive(self):
+        """Symlink Drive's checkpoints into the local dir for Demucs to resolve itself."""
+        try:
+            self.dir.mkdir(parents=True, exist_ok=True)
+            if not self.keep.exists():
+                return
+            for p in self.keep.glob('*.th'):
+                dst = self.dir / p.name
+                if not dst.exists() and not dst.is_symlink():
+                    dst.symlink_to(p)
+                    self._persisted.add(p.name)
+        except OSError as e:
+            print(f"[Watcher] MODELS could not link Drive checkpoints: {e}")
+
+    def persist(self):
+        """Copy checkpoints Demucs downloaded into the local dir back to Drive."""
+        if not self.dir.exists():
             return
-        except Exception as _e:
+        for p in self.dir.glob('*.th'):
+            if p.name in self._persisted or p.is_symlink():
+                continue
+            keep = self.keep / p.name
+            try:
+                if not keep.exists():
+                    self._save(p, keep)
+                    print(f"[Watcher] MODELS saved {p.name} to Drive")
+                self._persisted.add(p.name)
+            except OSError as e:
+                print(f"[Watcher] MODELS could not persist {p.name} to Drive: {e}")
+
+    @staticmethod
+    def _save(src, keep):
+        keep.parent.mkdir(parents=True, exist_ok=True)
+        tmp = keep.with_name(keep.name + '.part')
+        shutil.copyfile(src, tmp)
+        os.replace(tmp, keep)
+
+    def _ensure_file(self, rel):
+        filename = rel.rsplit('/', 1)[-1]
+        expected = filename.rsplit('.', 1)[0].split('-', 1)[-1]
+        dst = self.dir / filename
+        if dst.is_symlink():
+            dst.unlink()  # linked to Drive by link_drive(); replace with a verified local copy
+        if dst.exists():
+            # Left by an earlier session on this machine; trust it only once re-hashed
+            if self._sha256(dst).startswith(expected):
+                return True
+            dst.unlink()
+        src = self._find(filename)
+        if src is not None:
+            tmp, digest = self._copy_hashed(src, dst)
+            if digest.startswith(expected):
+                os.replace(tmp, dst)
+                self.stats['copied'] += 1
+                self.stats['bytes'] += dst.stat().st_size
+                return True
+            tmp.unlink()
+            self.stats['bad_hash'] += 1
+            print(f"[Watcher] MODELS hash mismatch for {src}; downloading instead")
+        try:
+            info = download_file(DEMUCS_CDN + rel, dst)
+            if not self._sha256(dst).startswith(expected):
+                dst.unlink()
+                raise ValueError(f'sha256 of {filename} does not match')
+        except Exception as e:
+            self.stats['failed'] += 1
+            print(f"[Watcher] MODELS could not fetch {filename}: {e}")
+            return False
+        self.stats['downloaded'] += 1
+        self.stats['bytes'] += info['bytes']
+        try:
+            # Persist on Drive for the next runtime
+            self._save(dst, self.keep / filename)
+            self._persisted.add(filename)
+        except OSError as e:
+            print(f"[Watcher] MODELS could not persist {filename} to Drive: {e}")
+        return True
+
+    def prefetch(self, name):
+        """Queue a background ensure(); cheap to call on every scan."""
+        with self._lock:
+            if not name or name in self._queued:
+                return
+            self._queued.add(name)
+        self._pool.submit(self._prefetch, name)
+
+    def _prefetch(self, name):
+        try:
+            self.ensure(name)
+        except Exception as e:
+            print(f"[Watcher] MODELS prefetch of {name} failed: {e}")
+
+MODELS = ModelCache()
+
+class _ProgressBars:
+    """Stand-in for the `tqdm` module inside demucs.apply.
+
+    apply_model() opens one progress bar per (model in bag) x (shift) pass and
+    iterates it chunk by chunk; we turn that into a 0..1 progress callback
+    instead of scraping the text bar from stdout.
+    """
+
+    def __init__(self):
+        self.callback = None
+        self.passes = 1
+        self.done = 0
+
+    def reset(self, passes, callback):
+        self.passes = max(1, passes)
+        self.done = 0
+        self.callback = callback
+
+    def tqdm(self, iterable, **_kw):
+        items = list(iterable)
+        total = max(1, len(items))
+        for i, item in enumerate(items):
+            yield item
+            if self.callback:
+                self.callback((self.done + (i + 1) / total) / self.passes)
+        self.done += 1
+
+
+# Autotune: a job can set "jobs", "segments" and/or "shifts" to "auto" (or
+# "auto": true for all three) plus "target": latency | balanced | quality.
+# DSU_AUTOTUNE=1 does the same for dropped files (DSU_AUTOTUNE_TARGET). The
+# hardware is probed once; per-model speed is measured from finished jobs
+# and kept in autotune.json, so later plans (and restarts) use real numbers.
+AUTOTUNE = os.environ.get('DSU_AUTOTUNE', '0') not in ('0', 'false', 'no')
+AUTOTUNE_TARGET = os.environ.get('DSU_AUTOTUNE_TARGET', 'quality').strip().lower()
+AUTOTUNE_STATE = ROOT / 'autotune.json'
+# balanced shifts budget (DSU_AUTOTUNE_MAX_RTF), model shapes and targets: hf_space/autotune.py
+
+class Autotuner:
+    """Hardware probe plus per-model cost table; plan() picks run settings."""
+
+    def __init__(self, state_path=AUTOTUNE_STATE):
+        self.state_path = state_path
+        self.hw = None
+        # '<device>:<model>' -> seconds of compute per audio second per pass (EMA)
+        self.costs = {}
+        self._lock = threading.Lock()
+
+    def probe(self):
+        with self._lock:
+            if self.hw is None:
+                self.hw = self._probe()
+                try:
+                    self.costs = json.loads(self.state_path.read_text()).get('costs', {})
+                except (OSError, ValueError):
+                    self.costs = {}
+                print(f"[Watcher] AUTOTUNE hardware {json.dumps(self.hw)}")
+            return self.hw
+
+    @staticmethod
+    def _probe():
+        try:
+            cores = len(os.sched_getaffinity(0))
+        except AttributeError:
+            cores = os.cpu_count() or 1
+        hw = {'device': 'cpu', 'cores': cores, 'ram_gb': round(meminfo_gb('MemAvailable') or 0, 1),
+              'gpu': None, 'vram_gb': None}
+        try:
+            import torch
+            if torch.cuda.is_available():
+                free, _total = torch.cuda.mem_get_info()
+                hw.update(device='cuda', gpu=torch.cuda.get_device_name(0), vram_gb=round(free / 1024 ** 3, 1))
+            return hw
+        except ImportError:
             pass
-    if gdrive_id:
-        # Try gdown if available
+        # No torch in this interpreter (subprocess mode): ask the driver
         try:
-            print(f"[Watcher] FETCH {jid} from gdrive_id {gdrive_id}")
-            cmd = ['gdown', '--id', gdrive_id, '-O', str(dest)]
-            subprocess.check_call(cmd)
-            print(f"[Watcher] FETCH OK {jid} -> {dest}")
-            try:
-                notify = job.get('notify_url')
-                if notify:
-                    urllib.request.urlopen(notify, timeout=2).read(0)
-            except Exception:
-                pass
+            out = subprocess.run(['nvidia-smi', '--query-gpu=name,memory.free', '--format=csv,noheader,nounits'],
+                                 capture_output=True, text=True, timeout=10)
+            if out.returncode == 0 and out.stdout.strip():
+                name, free = out.stdout.strip().splitlines()[0].rsplit(',', 1)
+                hw.update(device='cuda', gpu=name.strip(), vram_gb=round(float(free) / 1024, 1))
+        except (OSError, ValueError, subprocess.SubprocessError):
+            pass
+        return hw
+
+    def device(self):
+        return self.probe()['device']
+
+    def observe(self, model, audio_s, infer_s, shifts, device=None):
+        """Fold a finished separation into the model's cost."""
+        if not audio_s or not infer_s or audio_s <= 0:
             return
-        except Exception as _e:
+        bag = MODEL_SHAPES.get(model, (1, 0))[0]
+        cost = infer_s / (audio_s * bag * max(1, int(shifts or 0)))
+        key = f'{device or self.device()}:{model}'
+        with self._lock:
+            old = self.costs.get(key)
+            self.costs[key] = round(cost if old is None else 0.7 * old + 0.3 * cost, 5)
+            costs = dict(self.costs)
+        try:
+            atomic_write_json(self.state_path, {'hw': self.hw, 'costs': costs, 'updated': time.time()})
+        except OSError:
             pass
-    if not dest.exists():
-        raise RuntimeError('Input WAV missing and no valid source_url/gdrive_id to fetch it')
 
-def run_demucs(in_wav, out_dir, model='htdemucs', two_stems='', jobs=2, shifts=0, segments=0, clip_mode='rescale'):
-    # Force CUDA device on Colab GPU runtimes for best performance
-    cmd = [sys.executable, '-m', 'demucs.separate', '-n', model, '-d', 'cuda', '-o', str(out_dir)]
+    def plan(self, model, target='balanced'):
+        """Run settings for one job on this machine."""
+        hw = self.probe()
+        target = target if target in TARGETS else 'balanced'
+        gpu = hw['device'] == 'cuda'
+        bag, max_seg = MODEL_SHAPES.get(model, (1, 0))
+        mem_gb = (hw['vram_gb'] if gpu else hw['ram_gb']) or 0
+        segments = max_seg
+        if max_seg and mem_gb:
+            # Shorter segments when a full one would not fit next to the weights
+            segments = max(2, min(max_seg, int(mem_gb * 0.6 / SEGMENT_GB_PER_S)))
+        if gpu:
+            # -j only parallelizes CPU inference; on the GPU it just adds threads
+            jobs, threads = 0, hw['cores']
+        else:
+            per_worker = (segments or 7) * SEGMENT_GB_PER_S
+            fits = int(mem_gb * 0.6 / per_worker) if mem_gb else hw['cores']
+            jobs = max(1, min(hw['cores'], fits))
+            # Demucs workers share torch's intra-op pool: split the cores between them
+            threads = max(1, hw['cores'] // jobs)
+        cost = self.costs.get(f"{hw['device']}:{model}")
+        if target == 'latency':
+            shifts = 0
+        elif target == 'quality':
+            # The zero-config default; never below what jobs got before auto-tuning
+            shifts = 4
+        elif cost is not None:
+            shifts = next((n for n in (2, 1, 0) if cost * bag * max(1, n) <= AUTOTUNE_MAX_RTF), 0)
+        else:
+            shifts = 1 if gpu else 0
+        return {
+            'target': target, 'device': hw['device'], 'jobs': jobs, 'segments': segments, 'shifts': shifts,
+            'threads': threads,
+            'est_rtf': None if cost is None else round(cost * bag * max(1, shifts), 3),
+            'hw': {k: hw[k] for k in ('cores', 'ram_gb', 'gpu', 'vram_gb')},
+        }
+
+AUTOTUNER = Autotuner()
+
+class SeparationWorker:
+    """Long-lived worker that owns torch and keeps the last N models loaded.
+
+    process_job/process_audio_file submit requests; each request gets its own
+    queue of structured events ({'phase', 'progress', ...}) that ends with
+    {'phase': 'end'} (plus 'error' on failure).
+    """
+
+    def __init__(self, max_models=GPU_MODELS, device=None):
+        self.max_models = max_models
+        # None: whatever the probe found (cuda if present)
+        self.device = device
+        self._models = OrderedDict()
+        self._requests = queue.Queue()
+        self._bars = _ProgressBars()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='dsu-separation', daemon=True)
+            self._thread.start()
+        return self
+
+    def submit(self, req):
+        events = queue.Queue()
+        self.start()
+        self._requests.put((req, events))
+        return events
+
+    def loaded(self):
+        return list(self._models.keys())
+
+    def _run(self):
+        if self.device is None:
+            self.device = AUTOTUNER.device()
+        while True:
+            req, events = self._requests.get()
+            try:
+                self._separate(req, events.put)
+                events.put({'phase': 'end'})
+            except BaseException as e:
+                events.put({'phase': 'end', 'error': f'{type(e).__name__}: {e}', 'trace': traceback.format_exc()})
+
+    def _get_model(self, name):
+        if name in self._models:
+            self._models.move_to_end(name)
+            return self._models[name], 0.0
+        import torch
+        from demucs.pretrained import get_model
+        t0 = time.time()
+        model = get_model(name)
+        model.to(self.device)
+        model.eval()
+        self._models[name] = model
+        while len(self._models) > self.max_models:
+            old, _ = self._models.popitem(last=False)
+            print(f"[Watcher] ENGINE evicted model {old}")
+            if self.device == 'cuda':
+                torch.cuda.empty_cache()
+        return model, time.time() - t0
+
+    def _separate(self, req, emit):
+        import torch
+        import demucs.apply
+        from demucs.apply import apply_model, BagOfModels
+        from demucs.audio import save_audio
+        from demucs.htdemucs import HTDemucs
+        from demucs.separate import load_track
+
+        name = req['model']
+        if req.get('threads'):
+            torch.set_num_threads(int(req['threads']))
+        emit({'phase': 'load', 'model': name})
+        model, load_s = self._get_model(name)
+        emit({'phase': 'prepare', 'load_s': round(load_s, 3), 'cached_model': load_s == 0.0})
+        two_stems = req.get('two_stems') or ''
+        if two_stems and two_stems not in model.sources:
+            raise ValueError(f"stem {two_stems!r} is not in model {name} (sources: {', '.join(model.sources)})")
+        segment = req.get('segments') or None
+        if segment:
+            if isinstance(model, HTDemucs):
+                segment = min(float(segment), float(model.segment))
+            elif isinstance(model, BagOfModels):
+                segment = min(float(segment), model.max_allowed_segment)
+        try:
+            wav = load_track(pathlib.Path(req['in_wav']), model.audio_channels, model.samplerate)
+        except SystemExit:
+            raise RuntimeError(f"could not load audio file {req['in_wav']}")
+        ref = wav.mean(0)
+        wav = (wav - ref.mean()) / ref.std()
+        emit({'phase': 'prepare', 'audio_s': round(wav.shape[-1] / model.samplerate, 3)})
+
+        shifts = int(req.get('shifts') or 0)
+        passes = (len(model.models) if isinstance(model, BagOfModels) else 1) * max(1, shifts)
+        last = [-1.0]
+
+        def on_progress(frac):
+            # One event per whole percent is plenty for status.json
+            if frac - last[0] >= 0.01 or frac >= 1.0:
+                last[0] = frac
+                emit({'phase': 'separate', 'progress': round(min(frac, 1.0), 4)})
+
+        self._bars.reset(passes, on_progress)
+        demucs.apply.tqdm = self._bars
+        emit({'phase': 'separate', 'progress': 0.0})
+        t0 = time.time()
+        with torch.no_grad():
+            sources = apply_model(model, wav[None], device=self.device, shifts=shifts, split=True,
+                                  overlap=0.25, progress=True, num_workers=int(req.get('jobs') or 0),
+                                  segment=segment)[0]
+        sources = sources * ref.std() + ref.mean()
+        infer_s = time.time() - t0
+
+        emit({'phase': 'finalize', 'infer_s': round(infer_s, 3)})
+        out_dir = pathlib.Path(req['out_dir'])
+        out_dir.mkdir(parents=True, exist_ok=True)
+        clip = req.get('clip_mode') if req.get('clip_mode') in ('rescale', 'clamp') else 'rescale'
+        kwargs = {'samplerate': model.samplerate, 'clip': clip, 'bits_per_sample': 16}
+        if req.get('float32'):
+            kwargs.update(clip='none', bits_per_sample=32, as_float=True)
+        elif req.get('int24'):
+            kwargs.update(bits_per_sample=24)
+        sources = sources.cpu()
+        if two_stems:
+            rest = list(sources)
+            picked = rest.pop(model.sources.index(two_stems))
+            save_audio(picked, str(out_dir / f'{two_stems}.wav'), **kwargs)
+            save_audio(sum(rest), str(out_dir / f'no_{two_stems}.wav'), **kwargs)
+        else:
+            for source, stem in zip(sources, model.sources):
+                save_audio(source, str(out_dir / f'{stem}.wav'), **kwargs)
+
+
+WORKER = SeparationWorker()
+_ENGINE_OK = None
+
+def engine_available():
+    """True when torch + demucs import in this process (checked once)."""
+    global _ENGINE_OK
+    if _ENGINE_OK is None:
+        _ENGINE_OK = False
+        if ENGINE_MODE == 'inprocess' and SEPARATOR != 'stub':
+            try:
+                import torch  # noqa: F401
+                import demucs.apply  # noqa: F401
+                _ENGINE_OK = True
+            except Exception as e:
+                print(f"[Watcher] ENGINE in-process unavailable ({e}); using demucs subprocess")
+    return _ENGINE_OK
+
+def run_demucs(in_wav, out_dir, model='htdemucs', two_stems='', jobs=2, shifts=0, segments=0, clip_mode='rescale',
+               float32=False, int24=False, device=None, threads=0):
+    """Separate in_wav, yielding structured progress events.
+
+    The in-process worker writes stems straight into out_dir; the subprocess
+    fallback writes out_dir/<model>/<track>/ which flatten_stems() handles.
+    """
+    if engine_available():
+        events = WORKER.submit({
+            'in_wav': str(in_wav), 'out_dir': str(out_dir), 'model': model, 'two_stems': two_stems,
+            'jobs': jobs, 'shifts': shifts, 'segments': segments, 'clip_mode': clip_mode, 'float32': float32,
+            'int24': int24, 'threads': threads,
+        })
+        while True:
+            ev = events.get()
+            if ev['phase'] == 'end':
+                if ev.get('error'):
+                    raise RuntimeError(f"Demucs failed: {ev['error']}")
+                return
+            yield ev
+    else:
+        yield from run_demucs_subprocess(in_wav, out_dir, model, two_stems, jobs, shifts, segments, clip_mode, float32,
+                                         int24, device, threads)
+
+TQDM_RE = re.compile(r'(\d+(?:\.\d+)?)%\|[^|]*\|\s*([\d.]+)/([\d.]+)')
+BAG_RE = re.compile(r'bag of (\d+) models')
+
+STUB_SOURCES = {'htdemucs_6s': ('drums', 'bass', 'other', 'vocals', 'guitar', 'piano')}
+# Simulated compute for the stub, in seconds per audio second (0: as fast as I/O allows)
+STUB_RTF = float(os.environ.get('DSU_STUB_RTF', '0'))
+
+def run_stub_separator(in_wav, out_dir, model='htdemucs', two_stems='', float32=False, int24=False):
+    """Stand-in for the Demucs CLI: same layout, events and sample format.
+
+    Every stem is an equal share of the (stereo) input, so stems always sum
+    back to the mixture and output bytes match a real run of the same length.
+    """
+    import numpy as np
+    import soundfile as sf
+
+    sources = STUB_SOURCES.get(model, ('drums', 'bass', 'other', 'vocals'))
+    names = (two_stems, f'no_{two_stems}') if two_stems else sources
+    subtype = 'FLOAT' if float32 else ('PCM_24' if int24 else 'PCM_16')
+    yield {'phase': 'prepare', 'log': f'Selected model is a bag of 1 models. (stub {model})'}
+    for path in in_wav if isinstance(in_wav, (list, tuple)) else [in_wav]:
+        path = pathlib.Path(path)
+        yield {'phase': 'separate', 'log': f'Separating track {path}', 'track': path.stem}
+        info = sf.info(str(path))
+        track = pathlib.Path(out_dir) / model / path.stem
+        track.mkdir(parents=True, exist_ok=True)
+        outs = [sf.SoundFile(str(track / f'{n}.wav'), 'w', info.samplerate, 2, subtype=subtype, format='WAV')
+                for n in names]
+        try:
+            done = 0
+            with sf.SoundFile(str(path)) as src:
+                for block in src.blocks(blocksize=1 << 18, dtype='float32', always_2d=True):
+                    block = block[:, :2] if block.shape[1] >= 2 else np.repeat(block, 2, axis=1)
+                    for out in outs:
+                        out.write(block / len(outs))
+                    done += len(block)
+                    if STUB_RTF > 0:
+                        time.sleep(STUB_RTF * len(block) / info.samplerate)
+                    yield {'phase': 'separate', 'progress': done / max(1, info.frames),
+                           'audio_s': round(info.frames / info.samplerate, 2)}
+        finally:
+            for out in outs:
+                out.close()
+
+def run_demucs_subprocess(in_wav, out_dir, model='htdemucs', two_stems='', jobs=2, shifts=0, segments=0, clip_mode='rescale',
+                          float32=False, int24=False, device=None, threads=0):
+    if SEPARATOR == 'stub':
+        yield from run_stub_separator(in_wav, out_dir, model, two_stems, float32, int24)
+        return
+    # CUDA when the probe found a GPU (Colab/Kaggle GPU runtimes), else CPU
+    cmd = [sys.executable, '-m', 'demucs.separate', '-n', model, '-d', device or AUTOTUNER.device(), '-o', str(out_dir)]
     if two_stems:
         cmd += ['--two-stems', two_stems]
     if isinstance(jobs, int) and jobs > 0:
@@ -94,10 +1076,16 @@ def run_demucs(in_wav, out_dir, model='htdemucs', two_stems='', jobs=2, shifts=0
     if isinstance(shifts, int) and shifts > 0:
         cmd += ['--shifts', str(shifts)]
     if isinstance(segments, (int, float)) and segments:
-        cmd += ['--segment', str(segments)]
+        cmd += ['--segment', str(int(segments))]
+    if float32:
+        # The 4.0.1 CLI has no --clip-mode none; a chunk is only rescaled if it peaks above 0dBFS
+        cmd += ['--float32']
+    elif int24:
+        cmd += ['--int24']
     if clip_mode in ('rescale', 'clamp'):
         cmd += ['--clip-mode', clip_mode]
-    cmd.append(str(in_wav))
+    # One path, or a list of tracks separated in a single run (batching)
+    cmd += [str(x) for x in in_wav] if isinstance(in_wav, (list, tuple)) else [str(in_wav)]
 
     # Ensure the child Python sees Drive-installed site-packages
     child_env = os.environ.copy()
@@ -106,214 +1094,1513 @@ def run_demucs(in_wav, out_dir, model='htdemucs', two_stems='', jobs=2, shifts=0
         child_env['PYTHONPATH'] = (site_dir + os.pathsep + child_env.get('PYTHONPATH', ''))
     except Exception:
         pass
+    if threads:
+        child_env['OMP_NUM_THREADS'] = child_env['MKL_NUM_THREADS'] = str(int(threads))
     proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1, env=child_env)
     last_line = ''
+    # tqdm redraws with \r, which universal newlines splits into lines. One bar
+    # per (model in bag) x (shift) pass; a percentage drop means a new pass.
+    passes = max(1, shifts if isinstance(shifts, int) else 0)
+    done_passes = 0
+    last_pct = 0.0
     for line in proc.stdout:
         line = line.rstrip('\n')
-        if line:
-            last_line = line
-        if 'Separating' in line:
-            phase = 'separate'
+        if not line:
+            continue
+        last_line = line
+        m = TQDM_RE.search(line)
+        if m:
+            pct = float(m.group(1))
+            if pct < last_pct:
+                done_passes += 1
+            last_pct = pct
+            ev = {'phase': 'separate', 'progress': min(1.0, (done_passes + pct / 100) / passes)}
+            if m.group(3):
+                ev['audio_s'] = float(m.group(3))
+            yield ev
+            continue
+        bag = BAG_RE.search(line)
+        if bag:
+            passes = int(bag.group(1)) * max(1, shifts if isinstance(shifts, int) else 0)
+            yield {'phase': 'prepare', 'log': line}
+        elif line.startswith('Separating track '):
+            # Next track of a batch: its progress bars start from zero
+            done_passes, last_pct = 0, 0.0
+            yield {'phase': 'separate', 'log': line, 'track': pathlib.Path(line[len('Separating track '):].strip()).stem}
+        elif 'Separating' in line:
+            yield {'phase': 'separate', 'log': line}
         elif 'Loaded' in line or 'Using' in line:
-            phase = 'prepare'
-        elif 'done' in line.lower():
-            phase = 'finalize'
+            yield {'phase': 'prepare', 'log': line}
         else:
-            phase = 'run'
-        yield phase, line
+            yield {'log': line}
     proc.wait()
     if proc.returncode != 0:
         # Surface the last log line to upper layers for status.json
         raise RuntimeError(f'Demucs failed: {last_line}')
 
-def process_job(job_path: pathlib.Path):
-    job = json.loads(job_path.read_text())
-    jid = job['id']
-    in_wav = AUDIO / f'{jid}.wav'
-    stem_dir = OUT / jid
+def flatten_stems(stem_dir, model, jid):
+    """Move stems from Demucs' nested CLI layout into out/<jid>/ and drop the nesting.
 
-    print(f"[Watcher] QUEUED job {jid}")
-    write_status(jid, status='queued')
-    try:
-        print(f"[Watcher] RUN job {jid} using model={job.get('model','htdemucs')} two_stems={job.get('two_stems','')} jobs={job.get('jobs',2)}")
-        # Ensure input exists; if not, download using provided source_url/gdrive_id
+    Left in place, the nested WAVs would be synced to Drive next to the
+    encoded stems, and after silence skipping they hold the compacted audio.
+    """
+    for src_dir in (stem_dir / 'separated' / model / jid, stem_dir / model / jid):
         try:
-            download_input_if_needed(jid, job)
-        except Exception as fetch_err:
-            err = f'{type(fetch_err).__name__}: {fetch_err}'
-            (stem_dir / 'done.json').write_text(json.dumps({'status': 'error', 'error': err}))
-            print(f"[Watcher] ERROR job {jid}: {err}")
-            write_status(jid, status='error', error=err, trace=traceback.format_exc())
-            return
-        write_status(jid, status='running', phase='prepare')
-        for phase, logline in run_demucs(
-            in_wav,
-            stem_dir,
-            model=job.get('model', 'htdemucs'),
-            two_stems=job.get('two_stems', ''),
-            jobs=int(job.get('jobs', 2)),
-            shifts=int(job.get('shifts', 0)),
-            segments=float(job.get('segments', 0) or 0),
-            clip_mode=job.get('clip_mode', 'rescale'),
-        ):
-            write_status(jid, status='running', phase=phase, log=logline)
-        # Flatten Demucs output: copy stems from separated/<model>/<jid>/ into out/<jid>/
-        try:
-            model = job.get('model', 'htdemucs')
-            src_dir = stem_dir / 'separated' / model / jid
             if src_dir.exists():
                 for name in os.listdir(src_dir):
                     src = src_dir / name
                     if src.is_file():
-                        shutil.copy2(src, stem_dir / name)
-        except Exception as _e:
-            pass
-        (stem_dir / 'done.json').write_text(json.dumps({'status': 'done'}))
-        print(f"[Watcher] DONE job {jid}")
-        write_status(jid, status='done', phase='complete')
+                        os.replace(src, stem_dir / name)
+                shutil.rmtree(src_dir.parent)
+                top = src_dir.parent.parent
+                if top != stem_dir and not any(top.iterdir()):
+                    top.rmdir()  # separated/
+        except OSError as e:
+            print(f"[Watcher] WARNING could not flatten stems from {src_dir}: {e}")
+
+RESULT_CACHE = ResultCache(RESULT_CACHE_DIR, CACHE_MAX_MB)
+
+def restore_cached(stems_dir, stem_dir):
+    """Hardlink (or copy, e.g. on Drive) cached stems into out/<jid>/."""
+    stem_dir.mkdir(parents=True, exist_ok=True)
+    for src in stems_dir.iterdir():
+        dst = stem_dir / src.name
+        try:
+            if dst.exists():
+                dst.unlink()
+            os.link(src, dst)
+        except OSError:
+            shutil.copy2(src, dst)
+
+# Output format (job field output_format, or DSU_OUTPUT_FORMAT for every
+# job), with the Space's names and encoders: wav keeps the stems as
+# separated (16-bit); flac/opus shrink what goes through Drive sync.
+OUTPUT_FORMAT = os.environ.get('DSU_OUTPUT_FORMAT', 'wav').strip().lower()
+
+def encode_stems(stem_dir, fmt):
+    """Encode every stem of out/<jid>/ in place, in parallel; returns (bytes before, bytes after)."""
+    stems = sorted(stem_dir.glob('*.wav'))
+    before = sum(p.stat().st_size for p in stems)
+
+    def one(src):
+        dst = encode_stem(src, stem_dir, fmt)
+        if dst != src:
+            src.unlink()
+        return dst
+
+    with ThreadPoolExecutor(min(ENCODE_WORKERS, max(1, len(stems)))) as pool:
+        out = list(pool.map(one, stems))
+    return before, sum(p.stat().st_size for p in out)
+
+# Chunked mode (job field chunk_s, or DSU_CHUNK_S for every job): a long
+# input is split into overlapping chunk jobs that any worker can pick up,
+# and the parent is stitched with overlap-add crossfades once all are done
+# (the Space's chunking helpers; neighbours overlap by DSU_CHUNK_OVERLAP_S).
+CHUNK_S = float(os.environ.get('DSU_CHUNK_S', '0'))
+CHUNKS = JOBS / 'chunks'
+
+def chunk_id(jid, i):
+    return f'{jid}.c{i:03d}'
+
+def read_chunk_manifest(jid):
+    try:
+        return json.loads((OUT / jid / 'chunks.json').read_text())
+    except (OSError, ValueError):
+        return None
+
+def chunks_state(manifest):
+    """('pending'|'done'|'error', finished, total) for a split job."""
+    ids = manifest['ids']
+    finished = 0
+    for cid in ids:
+        try:
+            done = json.loads((OUT / cid / 'done.json').read_text())
+        except (OSError, ValueError):
+            continue
+        if done.get('status') == 'error':
+            return 'error', finished, len(ids)
+        finished += 1
+    return ('done' if finished == len(ids) else 'pending'), finished, len(ids)
+
+def split_job(task):
+    """Publish chunk jobs for task; returns the manifest, or None if it fits one chunk."""
+    chunk_s = float(task.params.get('chunk_s') or 0)
+    manifest = split_audio(task.in_path, CHUNKS / task.jid, chunk_s)
+    if manifest is None:
+        shutil.rmtree(CHUNKS / task.jid, ignore_errors=True)
+        return None
+    base = {k: v for k, v in task.params.items() if k != 'chunk_s'}
+    ids = []
+    for i, name in enumerate(manifest['chunks']):
+        cid = chunk_id(task.jid, i)
+        job = dict(base, id=cid, parent=task.jid, float32=True, chunk_s=0, output_format='wav', skip_silence=False,
+                   preview=False, input_path=str((CHUNKS / task.jid / name).relative_to(ROOT)))
+        atomic_write_json(JOBS / f'{cid}.json', job)
+        ids.append(cid)
+    manifest.update(ids=ids, params=task.params, cache_key=task.key, t0=task.t0)
+    (OUT / task.jid).mkdir(parents=True, exist_ok=True)
+    atomic_write_json(OUT / task.jid / 'chunks.json', manifest)
+    print(f"[Watcher] SPLIT {task.label} into {len(ids)} chunks of {chunk_s}s (overlap {manifest['overlap_s']}s)")
+    return manifest
+
+def stitch_job(task):
+    """Stitch a split job's chunk outputs into out/<jid>/ and clean up the chunks."""
+    m = task.stitch
+    stem_dir = OUT / task.jid
+    t0 = time.time()
+    subtype = 'PCM_24' if m['params'].get('output_format') in HIRES else 'PCM_16'
+    stems = stitch_stems([OUT / cid for cid in m['ids']], m, stem_dir, m['params'].get('clip_mode', 'rescale'), subtype)
+    print(f"[Watcher] STITCH {task.label} {len(m['ids'])} chunks -> {', '.join(stems)} in {time.time() - t0:.1f}s")
+    for cid in m['ids']:
+        shutil.rmtree(OUT / cid, ignore_errors=True)
+        (JOBS / f'{cid}.json').unlink(missing_ok=True)
+    shutil.rmtree(CHUNKS / task.jid, ignore_errors=True)
+    (stem_dir / 'chunks.json').unlink(missing_ok=True)
+
+_CHUNK_SEEN = {}
+
+def chunks_ready(jid, manifest):
+    """True once every chunk is done; mirrors chunk progress into the parent's status.json."""
+    state, finished, total = chunks_state(manifest)
+    if state == 'error':
+        write_done(jid, status='error', error='a chunk failed', chunks={'done': finished, 'total': total})
+        write_status(jid, status='error', phase='chunks', error='a chunk failed')
+        return False
+    if state == 'pending' and _CHUNK_SEEN.get(jid) != finished:
+        _CHUNK_SEEN[jid] = finished
+        write_status(jid, status='running', phase='chunks', progress=round(finished / total, 4),
+                     chunks={'done': finished, 'total': total}, updated=time.time())
+    return state == 'done'
+
+# Silence skipping (job field skip_silence, or DSU_SKIP_SILENCE for every
+# job): only the non-silent regions, padded, are separated; the stems are
+# spliced back onto the original timeline with digital silence in between.
+# Detection and splicing are the Space's (hf_space/silence.py, DSU_SILENCE_*).
+SKIP_SILENCE = os.environ.get('DSU_SKIP_SILENCE', '0') not in ('0', 'false', 'no')
+SILENCE = JOBS / 'silence'
+
+# Progressive results: a quick pass is published to out/<id>/preview/ first,
+# then replaced by the full-quality stems ("preview": true or DSU_PREVIEW=1)
+PREVIEW = os.environ.get('DSU_PREVIEW', '0') not in ('0', 'false', 'no')
+PREVIEW_MODEL = os.environ.get('DSU_PREVIEW_MODEL', 'htdemucs')
+
+def compact_silence(inp, dest, threshold_db=SILENCE_DB):
+    """silence.compact() with the compacted path relative to ROOT, like a job's input_path."""
+    m = silence.compact(inp, dest, threshold_db)
+    if m is not None:
+        m['path'] = str(pathlib.Path(m['path']).relative_to(ROOT))
+    return m
+
+def read_silence_manifest(jid):
+    try:
+        return json.loads((OUT / jid / 'silence.json').read_text())
+    except (OSError, ValueError):
+        return None
+
+# Zero-config defaults: quality-focused, 2 stems (vocals + instrumental)
+ZERO_CONFIG_DEFAULTS = {
+    'model': 'htdemucs_ft',
+    'two_stems': 'vocals',
+    'jobs': 4,
+    'shifts': 4,
+    'segments': 0,
+    'clip_mode': 'rescale',
+}
+
+def _is_auto(job, field):
+    return job.get('auto') is True or str(job.get(field, '')).strip().lower() == 'auto'
+
+def job_params(job: dict) -> dict:
+    """Separation parameters of a job JSON, with the watcher's defaults.
+
+    Fields set to "auto" keep their default here; apply_autotune() fills them.
+    """
+    def num(field, default, cast):
+        return default if _is_auto(job, field) else cast(job.get(field, default) or 0)
+
+    return {
+        'model': job.get('model', 'htdemucs'),
+        'two_stems': job.get('two_stems', ''),
+        'jobs': num('jobs', 2, int),
+        'shifts': num('shifts', 0, int),
+        'segments': num('segments', 0.0, float),
+        'clip_mode': job.get('clip_mode', 'rescale'),
+        'chunk_s': float(job.get('chunk_s', CHUNK_S) or 0),
+        # Chunk jobs keep unclipped float stems for stitching
+        'float32': bool(job.get('float32', False)),
+        'output_format': normalize_format(job.get('output_format', OUTPUT_FORMAT)),
+        'skip_silence': bool(job.get('skip_silence', SKIP_SILENCE)),
+        'silence_db': float(job['silence_db'] if job.get('silence_db') is not None else SILENCE_DB),
+        'preview': bool(job.get('preview', PREVIEW)),
+    }
+
+def apply_autotune(params, fields, target):
+    """Overwrite `fields` of params from AUTOTUNER.plan(); returns the plan."""
+    plan = AUTOTUNER.plan(params['model'], target)
+    for field in fields:
+        params[field] = plan[field]
+    params['device'] = plan['device']
+    params['threads'] = plan['threads']
+    return plan
+
+def demucs_args(params):
+    """run_demucs() keyword arguments for a job's params."""
+    args = {k: v for k, v in params.items()
+            if k not in ('chunk_s', 'output_format', 'skip_silence', 'silence_db', 'preview')}
+    args['int24'] = params.get('output_format') in HIRES
+    return args
+
+class JobTask:
+    """One job moving through fetch -> separate -> post."""
+
+    def __init__(self, jid, in_path, params, label, job=None):
+        self.jid = jid
+        self.in_path = pathlib.Path(in_path)
+        self.params = params
+        self.label = label
+        self.job = job or {}
+        self.st = StatusWriter(jid)
+        self.key = None
+        self.hit = None
+        self.split = None
+        self.stitch = read_chunk_manifest(jid)
+        self.plan = None
+        self.sep_s = None
+        # Timings of a chunked job run from the parent's pickup
+        self.t0 = (self.stitch or {}).get('t0') or time.time()
+        self.first_stem_s = (self.stitch or {}).get('first_stem_s')
+        # When the task was handed to its next pipeline stage (wait_* spans)
+        self.queued_at = None
+
+def job_task(job_path: pathlib.Path) -> JobTask:
+    job = json.loads(job_path.read_text())
+    jid = job['id']
+    # Chunk jobs point at their slice under jobs/chunks/ (relative to ROOT)
+    in_path = ROOT / job['input_path'] if job.get('input_path') else AUDIO / f'{jid}.wav'
+    task = JobTask(jid, in_path, job_params(job), f'job {jid}', job=job)
+    fields = [f for f in ('jobs', 'segments', 'shifts') if _is_auto(job, f)]
+    if fields:
+        task.plan = apply_autotune(task.params, fields, str(job.get('target') or 'balanced').lower())
+    return task
+
+def audio_task(audio_path: pathlib.Path) -> JobTask:
+    params = dict(ZERO_CONFIG_DEFAULTS, chunk_s=CHUNK_S, output_format=normalize_format(OUTPUT_FORMAT),
+                  skip_silence=SKIP_SILENCE, silence_db=SILENCE_DB, preview=PREVIEW)
+    task = JobTask(audio_path.stem, audio_path, params, f'file {audio_path.name}')
+    if AUTOTUNE:
+        task.plan = apply_autotune(task.params, ('jobs', 'segments', 'shifts'), AUTOTUNE_TARGET)
+    return task
+
+def fetch_stage(task: JobTask):
+    """Network/Drive I/O: download the input and hash it for the cache."""
+    if task.stitch is not None:
+        # Every chunk is done; only stitching (in the post stage) is left
+        task.key = task.stitch.get('cache_key')
+        return
+    p = task.params
+    print(f"[Watcher] RUN {task.label} using model={p['model']} two_stems={p['two_stems']} jobs={p['jobs']}")
+    if task.plan is not None:
+        print(f"[Watcher] PLAN {task.label} {json.dumps({k: v for k, v in task.plan.items() if k != 'hw'})}")
+        task.st.update(plan=task.plan)
+    if task.job and not task.job.get('input_path'):
+        # Ensure input exists; if not, download using provided source_url/gdrive_id
+        task.st.update(status='running', phase='fetch')
+        with task.st.span('download'):
+            info = download_input_if_needed(task.jid, task.job)
+        if info:
+            task.st.update(download=info)
+            METRICS.inc('dsu_bytes_in_total', info.get('bytes') or 0)
+    # Usually already prefetched while the job was queued; waits if still copying
+    with task.st.span('model_fetch'):
+        try:
+            MODELS.ensure(p['model'])
+        except Exception as e:
+            # Only an optimisation: Demucs can still resolve the model itself
+            MODELS.stats['failed'] += 1
+            MODELS.link_drive()
+            print(f"[Watcher] MODELS could not prepare {p['model']} for {task.jid}: {e}")
+    if CACHE_ENABLED and not task.job.get('parent'):
+        try:
+            with task.st.span('cache_lookup'):
+                task.key = cache_key(task.in_path, task.params)
+                task.hit = RESULT_CACHE.lookup(task.key)
+        except OSError as e:
+            print(f"[Watcher] CACHE lookup failed for {task.jid}: {e}")
+            task.key, task.hit = None, None
+        if task.key is not None:
+            state = 'hit' if task.hit is not None else 'miss'
+            print(f"[Watcher] CACHE {state} {task.jid} key={task.key[:12]} (hits={RESULT_CACHE.hits} misses={RESULT_CACHE.misses})")
+    if task.hit is None and p.get('skip_silence') and not task.job.get('parent'):
+        task.st.update(phase='silence')
+        with task.st.span('silence'):
+            m = compact_silence(task.in_path, SILENCE / task.jid, p.get('silence_db', SILENCE_DB))
+        if m is None:
+            shutil.rmtree(SILENCE / task.jid, ignore_errors=True)
+        else:
+            (OUT / task.jid).mkdir(parents=True, exist_ok=True)
+            atomic_write_json(OUT / task.jid / 'silence.json', m)
+            task.in_path = ROOT / m['path']
+            print(f"[Watcher] SILENCE {task.label} skipping {100 * m['skipped_frac']:.1f}% "
+                  f"({m['skipped_s']}s in {len(m['regions'])} regions)")
+    if task.hit is None and task.params.get('chunk_s'):
+        task.st.update(phase='split')
+        with task.st.span('split'):
+            task.split = split_job(task)
+
+def wants_preview(task: JobTask):
+    p = task.params
+    if not p.get('preview') or task.hit is not None or task.stitch is not None or task.job.get('parent'):
+        return False
+    # Nothing to gain when the full pass is already the quick one
+    return not (p['model'] == PREVIEW_MODEL and not p.get('shifts'))
+
+def preview_stage(task: JobTask):
+    """Quick pass (PREVIEW_MODEL, no shifts) published to out/<jid>/preview/.
+
+    Runs on the GPU right before the full-quality pass (or before the
+    chunks of a long track are picked up). A failed preview only costs the
+    preview; the job carries on.
+    """
+    work = OUT / task.jid / '.preview'
+    dest = OUT / task.jid / 'preview'
+    t0 = time.time()
+    task.st.update(status='running', phase='preview')
+    args = dict(demucs_args(task.params), model=PREVIEW_MODEL, shifts=0, float32=False, int24=False)
+    try:
+        for ev in run_demucs(task.in_path, work, **args):
+            if ev.get('progress') is not None:
+                task.st.update(preview_progress=round(float(ev['progress']), 4))
+        flatten_stems(work, PREVIEW_MODEL, task.in_path.stem)
+        dest.mkdir(parents=True, exist_ok=True)
+        for f in work.iterdir():
+            if f.is_file():
+                os.replace(f, dest / f.name)
+        m = read_silence_manifest(task.jid) if task.params.get('skip_silence') else None
+        if m is not None:
+            expand_silence(dest, m)
     except Exception as e:
-        err = f'{type(e).__name__}: {e}'
-        (stem_dir / 'done.json').write_text(json.dumps({'status': 'error', 'error': err}))
-        print(f"[Watcher] ERROR job {jid}: {err}")
-        write_status(jid, status='error', error=err, trace=traceback.format_exc())
+        print(f"[Watcher] PREVIEW {task.label} failed, waiting for the full pass: {e}")
+        shutil.rmtree(dest, ignore_errors=True)
+        task.st.update(preview={'ready': False, 'error': f'{type(e).__name__}: {e}'})
+        return
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    stems = sorted(f.name for f in dest.iterdir() if f.is_file())
+    task.first_stem_s = round(time.time() - task.t0, 3)
+    print(f"[Watcher] PREVIEW {task.label} {len(stems)} stems after {task.first_stem_s}s ({PREVIEW_MODEL}, {time.time() - t0:.1f}s)")
+    task.st.update(preview={'ready': True, 'path': f'out/{task.jid}/preview', 'stems': stems, 'model': PREVIEW_MODEL,
+                            'seconds': round(time.time() - t0, 3)}, time_to_first_stem_s=task.first_stem_s)
+    task.st.flush()  # publish now, not at the next coalesced write
+    if task.split is not None:
+        # The stitching task is a new JobTask; it reads this back from chunks.json
+        task.split['first_stem_s'] = task.first_stem_s
+        atomic_write_json(OUT / task.jid / 'chunks.json', task.split)
+
+def separate_stage(task: JobTask):
+    """GPU work only; everything else happens in the other stages."""
+    if wants_preview(task):
+        with task.st.span('preview'):
+            preview_stage(task)
+    if task.hit is not None or task.split is not None or task.stitch is not None:
+        return
+    task.st.update(status='running', phase='prepare')
+    t0 = time.time()
+    audio_s = infer_s = None
+    for ev in run_demucs(task.in_path, OUT / task.jid, **demucs_args(task.params)):
+        audio_s = ev.get('audio_s', audio_s)
+        infer_s = ev.get('infer_s', infer_s)
+        if ev.get('load_s'):
+            METRICS.observe('dsu_model_load_seconds', ev['load_s'], model=task.params['model'])
+        task.st.event(ev)
+    task.sep_s = time.time() - t0
+    task.st.add_span('separate', t0, t0 + task.sep_s)
+    # Measured speed feeds later autotune plans for this model
+    p = task.params
+    AUTOTUNER.observe(p['model'], audio_s, infer_s or time.time() - t0, p['shifts'], p.get('device'))
+
+def post_stage(task: JobTask):
+    """Flatten/restore stems, fill the cache and publish done.json."""
+    stem_dir = OUT / task.jid
+    if task.split is not None:
+        # Chunk jobs are queued; whichever worker sees them all done stitches
+        n = len(task.split['ids'])
+        LEDGER.set(task.jid, 'split')
+        task.st.update(status='running', phase='chunks', progress=0.0, chunks={'done': 0, 'total': n})
+        print(f"[Watcher] WAITING {task.label} for {n} chunks")
+        return
+    task.st.update(phase='finalize')
+    done_extra = {}
+    if task.hit is not None:
+        with task.st.span('cache_restore'):
+            restore_cached(task.hit, stem_dir)
+    else:
+        if task.stitch is not None:
+            with task.st.span('stitch'):
+                stitch_job(task)
+        else:
+            # Flatten Demucs output: copy stems from separated/<model>/<track>/ into out/<jid>/
+            with task.st.span('flatten'):
+                flatten_stems(stem_dir, task.params['model'], task.in_path.stem)
+            # Keep checkpoints Demucs fetched itself (custom models, failed ensure)
+            MODELS.persist()
+        m = read_silence_manifest(task.jid) if task.params.get('skip_silence') else None
+        if m is not None:
+            with task.st.span('silence_expand'):
+                expand_silence(stem_dir, m)
+            done_extra['silence'] = silence_report(task, m)
+            task.st.update(silence=done_extra['silence'])
+            (stem_dir / 'silence.json').unlink(missing_ok=True)
+            shutil.rmtree(SILENCE / task.jid, ignore_errors=True)
+        if task.key is not None:
+            with task.st.span('cache_store'):
+                RESULT_CACHE.store(task.key, stem_dir, task.params)
+    # The cache keeps the PCM stems; only out/<jid>/ (what Drive syncs) is encoded
+    fmt = task.params.get('output_format', 'wav')
+    if FORMATS[fmt] is not None and not task.job.get('parent'):
+        t0 = time.time()
+        with task.st.span('encode'):
+            before, after = encode_stems(stem_dir, fmt)
+        print(f"[Watcher] ENCODE {task.label} {fmt}: {before} -> {after} bytes in {time.time() - t0:.1f}s")
+    # The full-quality stems replace the preview
+    timing = {'time_to_final_s': round(time.time() - task.t0, 3)}
+    if (stem_dir / 'preview').is_dir():
+        shutil.rmtree(stem_dir / 'preview', ignore_errors=True)
+        task.st.update(preview={'ready': False, 'replaced': True})
+    timing['time_to_first_stem_s'] = task.first_stem_s or timing['time_to_final_s']
+    if not task.job.get('parent'):
+        METRICS.inc('dsu_bytes_out_total', sum(f.stat().st_size for f in stem_dir.iterdir()
+                                               if f.is_file() and f.suffix in ('.wav', '.flac', '.opus')))
+    if task.hit is not None:
+        write_done(task.jid, status='done', cache='hit', format=fmt, **timing)
+    else:
+        write_done(task.jid, status='done', format=fmt, **done_extra, **timing)
+    print(f"[Watcher] DONE {task.label} first stem {timing['time_to_first_stem_s']}s, final {timing['time_to_final_s']}s")
+    task.st.update(status='done', phase='complete', progress=1.0, eta_s=0, **timing)
+
+def silence_report(task, m):
+    """Skipped share of the input and the separation time that saved."""
+    p = task.params
+    if task.sep_s:
+        per_s = task.sep_s / max(m['active_s'], 1e-3)
+    else:
+        # Stitched or batched: estimate from the measured model speed
+        cost = AUTOTUNER.costs.get(f"{p.get('device') or AUTOTUNER.device()}:{p['model']}")
+        bag = MODEL_SHAPES.get(p['model'], (1, 0))[0]
+        per_s = None if cost is None else cost * bag * max(1, int(p.get('shifts') or 0))
+    return {'skipped_frac': m['skipped_frac'], 'skipped_s': m['skipped_s'], 'active_s': m['active_s'],
+            'regions': len(m['regions']), 'saved_s': None if per_s is None else round(per_s * m['skipped_s'], 1)}
+
+def fail_task(task: JobTask, e: Exception):
+    err = f'{type(e).__name__}: {e}'
+    write_done(task.jid, status='error', error=err)
+    print(f"[Watcher] ERROR {task.label}: {err}")
+    task.st.update(status='error', error=err, last_log=task.st.last_log, trace=traceback.format_exc())
+
+def run_task(task: JobTask):
+    """All stages back to back on the calling thread."""
+    print(f"[Watcher] QUEUED {task.label}")
+    task.st.update(status='queued')
+    try:
+        fetch_stage(task)
+        separate_stage(task)
+        post_stage(task)
+    except Exception as e:
+        fail_task(task, e)
+
+def process_job(job_path: pathlib.Path):
+    run_task(job_task(job_path))
 
 def process_audio_file(audio_path: pathlib.Path):
     """Zero-config path: process a dropped audio file with defaults.
     Job id = filename stem. Writes status/done files into out/<id>/.
     """
-    jid = audio_path.stem
-    stem_dir = OUT / jid
-    print(f"[Watcher] QUEUED file {audio_path.name}")
-    write_status(jid, status='queued')
+    run_task(audio_task(audio_path))
+
+# Inputs fetched ahead of the GPU (downloads run while it separates)
+PREFETCH = max(1, int(os.environ.get('DSU_PREFETCH', '2')))
+FETCH_WORKERS = max(1, int(os.environ.get('DSU_FETCH_WORKERS', '2')))
+# Ready jobs with the same settings are separated together: one demucs run
+# (one interpreter start + model load) per group on the subprocess path.
+BATCH_MAX = max(1, int(os.environ.get('DSU_BATCH_MAX', '8')))
+BATCH_WAIT_S = float(os.environ.get('DSU_BATCH_WAIT_S', '1'))
+
+def batch_key(task: JobTask):
+    if task.hit is not None or task.split is not None or task.stitch is not None or wants_preview(task):
+        return ('solo', task.jid)  # nothing to separate, or a preview to publish first
+    p = task.params
+    return (p['model'], p['two_stems'], p['shifts'], p['segments'], p['clip_mode'], p.get('float32', False),
+            p.get('output_format') in HIRES, p.get('device'), p.get('threads'))
+
+def separate_group(tasks):
+    """Separate same-configuration tasks; returns {jid: exception or None}.
+
+    The in-process worker keeps the model loaded, so tasks just run back to
+    back. The subprocess path passes every track to one `demucs.separate`
+    run, then retries on its own any track the batch did not produce (the
+    CLI exits on the first unreadable file), so one bad input only fails itself.
+    The batch's wall time is shared among the tracks it produced in
+    proportion to their length, for each one's span, sep_s and autotune.
+    """
+    results = {}
+    if len(tasks) == 1 or engine_available():
+        for t in tasks:
+            try:
+                separate_stage(t)
+                results[t.jid] = None
+            except Exception as e:
+                results[t.jid] = e
+        return results
+    p = tasks[0].params
+    model = p['model']
+    print(f"[Watcher] BATCH {len(tasks)} jobs model={model} two_stems={p['two_stems']}: {', '.join(t.jid for t in tasks)}")
+    tmp = pathlib.Path(tempfile.mkdtemp(prefix='dsu-batch-'))
     try:
-        # Defaults: quality-focused, 2 stems (vocals + instrumental)
-        defaults = {
-            'model': 'htdemucs_ft',
-            'two_stems': 'vocals',
-            'jobs': 4,
-            'shifts': 4,
-            'segments': 0,
-            'clip_mode': 'rescale',
-        }
-        print(f"[Watcher] RUN file {audio_path.name} model={defaults['model']} two_stems={defaults['two_stems']} jobs={defaults['jobs']}")
-        write_status(jid, status='running', phase='prepare')
-        for phase, logline in run_demucs(
-            audio_path,
-            stem_dir,
-            model=defaults['model'],
-            two_stems=defaults['two_stems'],
-            jobs=defaults['jobs'],
-            shifts=defaults['shifts'],
-            segments=defaults['segments'],
-            clip_mode=defaults['clip_mode'],
-        ):
-            write_status(jid, status='running', phase=phase, log=logline)
-        # Flatten Demucs output into out/<jid>/
-        try:
-            src_dir = stem_dir / 'separated' / defaults['model'] / jid
-            if src_dir.exists():
-                for name in os.listdir(src_dir):
-                    src = src_dir / name
-                    if src.is_file():
-                        shutil.copy2(src, stem_dir / name)
-        except Exception as _e:
+        # Track names must be unique (chunk inputs are all cNNN.wav): link inputs as <jid><ext>
+        (tmp / 'in').mkdir()
+        by_track = {}
+        for t in tasks:
+            link = tmp / 'in' / f'{t.jid}{t.in_path.suffix}'
+            try:
+                link.symlink_to(t.in_path.resolve())
+            except OSError:
+                shutil.copy2(t.in_path, link)
+            by_track[t.jid] = t
+            t.st.update(status='running', phase='prepare', batch=len(tasks))
+        args = demucs_args(p)
+        args['jobs'] = max(int(t.params.get('jobs') or 0) for t in tasks)
+        batch_err = None
+        current = None
+        audio_s = {}
+        t0 = time.time()
+        try:
+            for ev in run_demucs_subprocess(sorted((tmp / 'in').iterdir()), tmp / 'out', **args):
+                if ev.get('track'):
+                    current = by_track.get(ev['track'])
+                if current is not None:
+                    if ev.get('audio_s'):
+                        audio_s[current.jid] = ev['audio_s']
+                    current.st.event(ev)
+        except RuntimeError as e:
+            batch_err = e
+        t1 = time.time()
+        produced = [t for t in tasks if any((tmp / 'out' / model / t.jid).glob('*'))]
+        _share_batch_time(produced, audio_s, t0, t1)
+        for t in tasks:
+            src = tmp / 'out' / model / t.jid
+            stems = [f for f in src.glob('*') if f.is_file()] if src.is_dir() else []
+            if stems:
+                dest = OUT / t.jid
+                dest.mkdir(parents=True, exist_ok=True)
+                for f in stems:
+                    shutil.copy2(f, dest / f.name)
+                results[t.jid] = None
+                continue
+            if batch_err is None:
+                results[t.jid] = RuntimeError('Demucs produced no stems')
+                continue
+            print(f"[Watcher] BATCH retrying {t.jid} alone after: {batch_err}")
+            try:
+                separate_stage(t)
+                results[t.jid] = None
+            except Exception as e:
+                results[t.jid] = e
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return results
+
+def _share_batch_time(tasks, audio_s, t0, t1):
+    """Split one batch run [t0, t1] among tasks by audio length, as consecutive spans."""
+    if not tasks:
+        return
+    import soundfile as sf
+    lengths = []
+    for t in tasks:
+        n = audio_s.get(t.jid)
+        if not n:
+            try:
+                info = sf.info(str(t.in_path))
+                n = info.frames / info.samplerate
+            except Exception:
+                n = 0.0
+        lengths.append(n)
+    total = sum(lengths)
+    start = t0
+    for t, n in zip(tasks, lengths):
+        # Unknown lengths fall back to an even split
+        share = (t1 - t0) * (n / total if total > 0 else 1 / len(tasks))
+        t.sep_s = share
+        t.st.add_span('separate', start, start + share)
+        start += share
+        p = t.params
+        AUTOTUNER.observe(p['model'], n, share, p['shifts'], p.get('device'))
+
+class Pipeline:
+    """fetch (thread pool) -> separate (single GPU consumer) -> post (one thread).
+
+    At most PREFETCH jobs are admitted ahead of the one being separated, and
+    post-processing of a job overlaps separation of the next. Per-stage busy
+    time is tracked so utilization can be reported.
+    """
+
+    def __init__(self, waker=None):
+        self.waker = waker
+        # jid -> JobTask
+        self.in_flight = {}
+        self._ahead = 0
+        self._last_submit = 0.0
+        self._lock = threading.Lock()
+        self._ready = []
+        self._cond = threading.Condition(self._lock)
+        self._fetch = ThreadPoolExecutor(FETCH_WORKERS, thread_name_prefix='dsu-fetch')
+        self._post = ThreadPoolExecutor(1, thread_name_prefix='dsu-post')
+        self._t0 = time.time()
+        self.stats = {name: {'busy_s': 0.0, 'jobs': 0, 'workers': n}
+                      for name, n in (('fetch', FETCH_WORKERS), ('separate', 1), ('post', 1))}
+
+    def start(self):
+        threading.Thread(target=self._separate_loop, name='dsu-separate', daemon=True).start()
+        return self
+
+    def has_capacity(self):
+        # Admit enough jobs to fill a batch when batching can save model loads
+        limit = PREFETCH if engine_available() else max(PREFETCH, BATCH_MAX)
+        return self._ahead < limit
+
+    def busy(self, jid):
+        return jid in self.in_flight
+
+    def tasks(self):
+        with self._lock:
+            return list(self.in_flight.values())
+
+    def submit(self, task: JobTask):
+        with self._lock:
+            self.in_flight[task.jid] = task
+            self._ahead += 1
+            self._last_submit = time.time()
+        print(f"[Watcher] QUEUED {task.label}")
+        task.st.update(status='queued')
+        task.queued_at = time.time()
+        self._fetch.submit(self._timed, 'fetch', self._do_fetch, task)
+
+    def _timed(self, stage, fn, task, n=1):
+        t0 = time.time()
+        # Time spent waiting for this stage shows where jobs pile up under load
+        for t in task if isinstance(task, list) else [task]:
+            if t.queued_at is not None:
+                t.st.add_span(f'wait_{stage}', t.queued_at, t0)
+        try:
+            return fn(task)
+        finally:
+            with self._lock:
+                self.stats[stage]['busy_s'] += time.time() - t0
+                self.stats[stage]['jobs'] += n
+
+    def _do_fetch(self, task):
+        try:
+            fetch_stage(task)
+        except Exception as e:
+            self._fail(task, e, ahead=True)
+            return
+        with self._cond:
+            task.queued_at = time.time()
+            self._ready.append(task)
+            self._cond.notify_all()
+
+    def _next_group(self):
+        """Oldest ready task plus ready tasks sharing its batch key (up to BATCH_MAX).
+
+        If more jobs are still being fetched, waits up to BATCH_WAIT_S for
+        them so a dropped folder of files becomes one batch.
+        """
+        with self._cond:
+            while not self._ready:
+                self._cond.wait()
+            key = batch_key(self._ready[0])
+            if key[0] != 'solo' and not engine_available():
+                deadline = time.time() + BATCH_WAIT_S
+                while True:
+                    same = sum(1 for t in self._ready if batch_key(t) == key)
+                    left = deadline - time.time()
+                    # Everything admitted is ready and the scan has stopped adding jobs
+                    settled = self._ahead <= len(self._ready) and time.time() - self._last_submit > 0.25
+                    if same >= BATCH_MAX or settled or left <= 0:
+                        break
+                    self._cond.wait(min(left, 0.1))
+            group = [t for t in self._ready if batch_key(t) == key][:BATCH_MAX]
+            self._ready = [t for t in self._ready if t not in group]
+            self._ahead -= len(group)
+        return group
+
+    def _separate_loop(self):
+        while True:
+            group = self._next_group()
+            self._wake()
+            try:
+                results = self._timed('separate', separate_group, group, n=len(group))
+            except Exception as e:
+                results = {t.jid: e for t in group}
+            for task in group:
+                if results.get(task.jid) is not None:
+                    self._fail(task, results[task.jid])
+                else:
+                    task.queued_at = time.time()
+                    self._post.submit(self._timed, 'post', self._do_post, task)
+
+    def _do_post(self, task):
+        try:
+            post_stage(task)
+        except Exception as e:
+            self._fail(task, e)
+            return
+        # A split parent is not finished yet: whoever sees its chunks done stitches it
+        self._release(task, done=LEDGER.state(task.jid) == 'done')
+
+    def _fail(self, task, e, ahead=False):
+        fail_task(task, e)
+        with self._lock:
+            if ahead:
+                self._ahead -= 1
+        self._release(task)
+
+    def _release(self, task, done=False):
+        LEASES.release(task.jid, done=done)
+        with self._lock:
+            self.in_flight.pop(task.jid, None)
+        self._wake()
+
+    def _wake(self):
+        if self.waker is not None:
+            self.waker.wake()
+
+    def utilization(self):
+        wall = max(1e-6, time.time() - self._t0)
+        with self._lock:
+            return {name: {'busy_s': round(s['busy_s'], 1), 'jobs': s['jobs'],
+                           'util': round(s['busy_s'] / (wall * s['workers']), 3)}
+                    for name, s in self.stats.items()}
+
+PIPELINE = None
+
+class JobLedger:
+    """Append-only record of job states (ROOT/ledger.jsonl).
+
+    Replaces stat-ing out/<id>/done.json for every historical job on every
+    scan: once an id reaches 'done' or 'error' it is never looked at again.
+    The first run migrates existing done.json files once.
+    """
+    FINAL = ('done', 'error')
+
+    def __init__(self, path):
+        self.path = pathlib.Path(path)
+        self.states = {}
+        self._lines = 0
+        self._lock = threading.Lock()
+
+    def load(self):
+        if not self.path.exists():
+            self._bootstrap()
+            return self
+        for line in self.path.read_text().splitlines():
+            try:
+                rec = json.loads(line)
+                self.states[rec['id']] = rec['state']
+                self._lines += 1
+            except Exception:
+                continue
+        if self._lines > 2 * len(self.states) + 100:
+            self.compact()
+        return self
+
+    def _bootstrap(self):
+        t0 = time.time()
+        recs = []
+        try:
+            for d in os.scandir(OUT):
+                done = os.path.join(d.path, 'done.json')
+                if d.is_dir() and os.path.exists(done):
+                    try:
+                        state = json.loads(pathlib.Path(done).read_text()).get('status', 'done')
+                    except Exception:
+                        state = 'done'
+                    recs.append({'id': d.name, 'state': 'error' if state == 'error' else 'done', 'ts': time.time()})
+        except OSError:
             pass
-        (stem_dir / 'done.json').write_text(json.dumps({'status': 'done'}))
-        print(f"[Watcher] DONE file {audio_path.name}")
-        write_status(jid, status='done', phase='complete')
-    except Exception as e:
-        err = f'{type(e).__name__}: {e}'
-        (stem_dir / 'done.json').write_text(json.dumps({'status': 'error', 'error': err}))
-        print(f"[Watcher] ERROR file {audio_path.name}: {err}")
-        write_status(jid, status='error', error=err, trace=traceback.format_exc())
+        self.path.write_text(''.join(json.dumps(r) + '\n' for r in recs))
+        for r in recs:
+            self.states[r['id']] = r['state']
+        self._lines = len(recs)
+        print(f"[Watcher] LEDGER bootstrapped {len(recs)} finished jobs in {time.time() - t0:.1f}s")
 
-def watch_loop():
-    print(f'Watching {JOBS} ...')
-    while True:
+    def set(self, jid, state, **extra):
+        rec = {'id': jid, 'state': state, 'ts': time.time(), **extra}
+        with self._lock:
+            self.states[jid] = state
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(rec) + '\n')
+            self._lines += 1
+
+    def state(self, jid):
+        return self.states.get(jid)
+
+    def is_final(self, jid):
+        return self.states.get(jid) in self.FINAL
+
+    def compact(self):
+        with self._lock:
+            tmp = self.path.with_suffix('.tmp')
+            now = time.time()
+            tmp.write_text(''.join(json.dumps({'id': k, 'state': v, 'ts': now}) + '\n'
+                                   for k, v in self.states.items()))
+            os.replace(tmp, self.path)
+            self._lines = len(self.states)
+
+LEDGER = JobLedger(ROOT / 'ledger.jsonl')
+
+# Several watchers may share one queue (a Drive jobs/ folder, or one
+# remote_jobs.jsonl). A job is only run by the worker holding its lease.
+WORKER_ID = os.environ.get('DSU_WORKER_ID') or f'{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}'
+LEASE_TTL_S = float(os.environ.get('DSU_LEASE_TTL_S', '120'))
+# A finished job's lease becomes a tombstone for this long, so workers with
+# their own roots (sharing only remote_jobs.jsonl) do not run it again
+LEASE_DONE_TTL_S = float(os.environ.get('DSU_LEASE_DONE_TTL_S', str(7 * 24 * 3600)))
+# claim() result for a job another worker already finished
+ALREADY_DONE = 'already_done'
+LEASE_DIR = ROOT / 'leases'
+COORDINATOR_URL = os.environ.get('DSU_COORDINATOR_URL')
+
+class _Leases:
+    """Shared bookkeeping: held ids, a renewal thread and counters."""
+
+    def __init__(self, ttl_s=LEASE_TTL_S, worker=None, done_ttl_s=LEASE_DONE_TTL_S):
+        self.worker = worker or WORKER_ID
+        self.ttl_s = ttl_s
+        self.done_ttl_s = done_ttl_s
+        self.held = set()
+        self._lock = threading.Lock()
+        self.stats = {'worker': self.worker, 'backend': self.backend, 'held': 0,
+                      'claimed': 0, 'contended': 0, 'reclaimed': 0, 'lost': 0, 'already_done': 0}
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._renew_loop, name='dsu-lease', daemon=True)
+            self._thread.start()
+        return self
+
+    def claim(self, jid):
+        """True if this worker now holds the job, False if another one does,
+        ALREADY_DONE if some worker finished it (a done tombstone)."""
+        ok = self._claim(jid)
+        with self._lock:
+            if ok is ALREADY_DONE:
+                self.stats['already_done'] += 1
+            elif ok:
+                self.held.add(jid)
+                self.stats['claimed'] += 1
+            else:
+                self.stats['contended'] += 1
+            self.stats['held'] = len(self.held)
+        return ok
+
+    def release(self, jid, done=False):
+        """done=True leaves a tombstone; otherwise (error) the job is free to retry."""
+        with self._lock:
+            if jid not in self.held:
+                return
+            self.held.discard(jid)
+            self.stats['held'] = len(self.held)
         try:
-            # Pull remote jobs if configured
-            if REMOTE_JOBS_URL:
+            self._release(jid, done)
+        except Exception as e:
+            print(f"[Watcher] LEASE release failed {jid}: {e}")
+
+    def _renew_loop(self):
+        while True:
+            time.sleep(max(1.0, self.ttl_s / 3))
+            with self._lock:
+                held = list(self.held)
+            for jid in held:
                 try:
-                    ts = int(time.time())
-                    url = REMOTE_JOBS_URL + ('&' if '?' in REMOTE_JOBS_URL else '?') + f'_ts={ts}'
-                    with urllib.request.urlopen(url, timeout=5) as resp:
-                        payload = resp.read().decode('utf-8')
-                    print(f"[Watcher] REMOTE poll url={url} bytes={len(payload or '')}")
-                    items = []
-                    txt = (payload or '').strip()
-                    if txt.startswith('['):
-                        items = json.loads(txt)
-                    else:
-                        for line in txt.splitlines():
-                            line = line.strip()
-                            if not line:
-                                continue
-                            try:
-                                items.append(json.loads(line))
-                            except Exception:
-                                continue
-                    print(f"[Watcher] REMOTE items={len(items)}")
-                    for job in items:
-                        jid = str(job.get('id') or '').strip()
-                        if not jid:
-                            continue
-                        stem_dir = OUT / jid
-                        if (stem_dir / 'done.json').exists():
-                            # Already done; skip
-                            continue
-                        job_path = JOBS / f'{jid}.json'
-                        if not job_path.exists():
-                            try:
-                                job_path.write_text(json.dumps(job))
-                                print(f"[Watcher] REMOTE wrote job {jid} -> {job_path}")
-                            except Exception:
-                                pass
-                except Exception:
+                    ok = self._renew(jid)
+                except Exception as e:
+                    print(f"[Watcher] LEASE renew failed {jid}: {e}")
+                    continue
+                if not ok:
+                    # Someone reclaimed it (we stalled past the TTL); the work may be duplicated
+                    print(f"[Watcher] LEASE lost {jid}")
+                    with self._lock:
+                        self.held.discard(jid)
+                        self.stats['lost'] += 1
+                        self.stats['held'] = len(self.held)
+
+class DirLeases(_Leases):
+    """Lease files in a shared folder: leases/<jid>.lease = {worker, expires}.
+
+    A new lease is an O_CREAT|O_EXCL create. Renewing, releasing or
+    reclaiming an expired lease happens under an O_EXCL <jid>.lease.lock and
+    rewrites the lease with an atomic rename. Drive's sync is only eventually
+    consistent across machines, so use DSU_COORDINATOR_URL when workers do
+    not share a local filesystem.
+    """
+    backend = 'dir'
+
+    def __init__(self, root=LEASE_DIR, ttl_s=LEASE_TTL_S, worker=None, done_ttl_s=LEASE_DONE_TTL_S):
+        super().__init__(ttl_s, worker, done_ttl_s)
+        self.root = pathlib.Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, jid):
+        return self.root / f'{jid}.lease'
+
+    def _read(self, path):
+        try:
+            return json.loads(path.read_text())
+        except (OSError, ValueError):
+            return None
+
+    def _record(self, done=False):
+        now = time.time()
+        if done:
+            return json.dumps({'worker': self.worker, 'done': True, 'finished': now, 'expires': now + self.done_ttl_s})
+        return json.dumps({'worker': self.worker, 'claimed': now, 'expires': now + self.ttl_s})
+
+    def _create(self, path):
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w') as f:
+            f.write(self._record())
+        return True
+
+    def _write(self, path, done=False):
+        tmp = path.with_name(f'.{path.name}.{uuid.uuid4().hex[:8]}.tmp')
+        tmp.write_text(self._record(done))
+        os.replace(tmp, path)
+
+    def _guard(self, path, tries=1):
+        """Exclusive <jid>.lease.lock for read-modify-write of an existing lease."""
+        guard = path.with_name(path.name + '.lock')
+        for i in range(tries):
+            try:
+                os.close(os.open(guard, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644))
+                return guard
+            except FileExistsError:
+                try:
+                    if time.time() - guard.stat().st_mtime > self.ttl_s:
+                        guard.unlink()  # left behind by a crashed worker
+                except OSError:
                     pass
-            # Read config (zero-config default enabled for simplicity)
-            zero_config = True
+            if i + 1 < tries:
+                time.sleep(0.05)
+        return None
+
+    def _claim(self, jid):
+        path = self._path(jid)
+        if self._create(path):
+            return True
+        guard = self._guard(path)
+        if guard is None:
+            return False
+        try:
+            cur = self._read(path)
+            if cur is None:
+                try:
+                    if time.time() - path.stat().st_mtime < self.ttl_s:
+                        return False  # being written right now
+                except FileNotFoundError:
+                    return self._create(path)
+            elif cur.get('done') and float(cur.get('expires') or 0) >= time.time():
+                return ALREADY_DONE
+            elif cur.get('worker') == self.worker and not cur.get('done'):
+                self._write(path)
+                return True
+            elif float(cur.get('expires') or 0) >= time.time():
+                return False
+            # Expired: overwrite in place so the lease file never disappears
+            self._write(path)
+        finally:
+            guard.unlink(missing_ok=True)
+        print(f"[Watcher] LEASE reclaimed {jid} from {(cur or {}).get('worker', '?')}")
+        with self._lock:
+            self.stats['reclaimed'] += 1
+        return True
+
+    def _renew(self, jid):
+        path = self._path(jid)
+        guard = self._guard(path, tries=20)
+        if guard is None:
+            return True  # contended; try again next round
+        try:
+            cur = self._read(path)
+            if cur is None or cur.get('worker') != self.worker or cur.get('done'):
+                return False
+            self._write(path)
+            return True
+        finally:
+            guard.unlink(missing_ok=True)
+
+    def _release(self, jid, done=False):
+        path = self._path(jid)
+        guard = self._guard(path, tries=20)
+        try:
+            cur = self._read(path)
+            if cur is not None and cur.get('worker') == self.worker and not cur.get('done'):
+                if done:
+                    self._write(path, done=True)
+                else:
+                    path.unlink(missing_ok=True)
+        finally:
+            if guard is not None:
+                guard.unlink(missing_ok=True)
+
+class HttpLeases(_Leases):
+    """Same protocol against a coordinator: POST {url}/claim|renew|release
+    with {"job", "worker", "ttl_s"} -> {"granted": bool}. A release may add
+    {"done": true, "done_ttl_s"} to leave a tombstone; claiming a tombstoned
+    job answers {"granted": false, "already_done": true}.
+    tools/dsu_coordinator.py is a minimal stand-in implementation.
+    """
+    backend = 'http'
+
+    def __init__(self, url, ttl_s=LEASE_TTL_S, worker=None, done_ttl_s=LEASE_DONE_TTL_S):
+        super().__init__(ttl_s, worker, done_ttl_s)
+        self.url = url.rstrip('/')
+
+    def _call(self, op, jid, **extra):
+        body = json.dumps({'job': jid, 'worker': self.worker, 'ttl_s': self.ttl_s, **extra}).encode('utf-8')
+        req = urllib.request.Request(f'{self.url}/{op}', data=body, method='POST',
+                                     headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(req, timeout=5) as resp:
+            return json.loads(resp.read() or b'{}')
+
+    def _claim(self, jid):
+        try:
+            res = self._call('claim', jid)
+        except Exception as e:
+            # Unreachable coordinator: do not run the job rather than risk running it twice
+            print(f"[Watcher] LEASE coordinator unavailable: {e}")
+            return False
+        if res.get('already_done'):
+            return ALREADY_DONE
+        return bool(res.get('granted'))
+
+    def _renew(self, jid):
+        return bool(self._call('renew', jid).get('granted'))
+
+    def _release(self, jid, done=False):
+        if done:
+            self._call('release', jid, done=True, done_ttl_s=self.done_ttl_s)
+        else:
+            self._call('release', jid)
+
+LEASES = HttpLeases(COORDINATOR_URL) if COORDINATOR_URL else DirLeases()
+
+class Waker:
+    """Sleeps until the jobs folders change or the timeout passes.
+
+    Uses inotify where the filesystem delivers it (local disk on Kaggle);
+    Drive's FUSE mount generally does not, so callers keep a polling timeout.
+    wake() lets other threads cut the wait short.
+    """
+    # Only completed writes/renames; IN_CREATE would fire on half-copied files
+    IN_CLOSE_WRITE, IN_MOVED_TO = 0x8, 0x80
+
+    def __init__(self, paths):
+        self.mode = 'poll'
+        self._ino = None
+        self._event = threading.Event()
+        self._pipe = None
+        if os.name != 'posix':
+            return
+        self._pipe = os.pipe()
+        os.set_blocking(self._pipe[0], False)
+        if os.environ.get('DSU_INOTIFY', '1') in ('0', 'false', 'no'):
+            return
+        try:
+            import ctypes, ctypes.util
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if fd < 0:
+                raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+            mask = self.IN_CLOSE_WRITE | self.IN_MOVED_TO
+            for p in paths:
+                if libc.inotify_add_watch(fd, str(p).encode(), mask) < 0:
+                    err = ctypes.get_errno()
+                    os.close(fd)
+                    raise OSError(err, f'inotify_add_watch failed for {p}')
+            self._ino = fd
+            self.mode = 'inotify'
+        except Exception as e:
+            print(f"[Watcher] inotify unavailable ({e}); polling with backoff")
+
+    def wake(self):
+        if self._pipe:
+            os.write(self._pipe[1], b'.')
+        else:
+            self._event.set()
+
+    def wait(self, timeout):
+        """Return True if woken by an event, False on timeout."""
+        if not self._pipe:
+            woke = self._event.wait(timeout)
+            self._event.clear()
+            return woke
+        import select
+        fds = [self._pipe[0]] + ([self._ino] if self._ino is not None else [])
+        ready, _, _ = select.select(fds, [], [], timeout)
+        for fd in ready:
             try:
-                if CONFIG.exists():
-                    cfg = json.loads(CONFIG.read_text() or '{}')
-                    zero_config = bool(cfg.get('zero_config', False))
+                os.read(fd, 65536)
+            except OSError:
+                pass
+        return bool(ready)
+
+# Idle polling backs off from POLL_MIN_S to POLL_MAX_S; any work resets it.
+POLL_MIN_S = float(os.environ.get('DSU_POLL_MIN_S', '1'))
+POLL_MAX_S = float(os.environ.get('DSU_POLL_MAX_S', '10'))
+AUDIO_EXTS = {'.wav', '.flac', '.mp3', '.m4a', '.ogg'}
+# A file that cannot be read yet may still be syncing; it only fails once
+# its size and mtime stay the same for this many scans or seconds
+UNREADABLE_SCANS = int(os.environ.get('DSU_UNREADABLE_SCANS', '5'))
+UNREADABLE_S = float(os.environ.get('DSU_UNREADABLE_S', '60'))
+WATCH_STATS = {
+    'scans': 0, 'scan_ms': 0.0, 'scan_ms_avg': 0.0,
+    'pickups': 0, 'pickup_latency_s': None, 'pickup_latency_s_avg': None,
+    'poll_interval_s': POLL_MIN_S, 'wakeup': 'poll',
+}
+
+# Remote queue polling has its own schedule: REMOTE_POLL_MIN_S after new
+# items, doubling to REMOTE_POLL_MAX_S while nothing changes.
+REMOTE_POLL_MIN_S = float(os.environ.get('DSU_REMOTE_POLL_MIN_S', '2'))
+REMOTE_POLL_MAX_S = float(os.environ.get('DSU_REMOTE_POLL_MAX_S', '60'))
+REMOTE_CURSOR = ROOT / 'remote_cursor.json'
+
+class RemotePoller:
+    """Incremental reader for DSU_REMOTE_JOBS_URL.
+
+    Sends If-None-Match / If-Modified-Since so an unchanged file costs a 304,
+    and asks for `Range: bytes=<offset>-` so only lines appended since the
+    last poll are downloaded and parsed. The cursor (validators + offset)
+    persists in ROOT/remote_cursor.json across restarts. A JSON-array
+    payload cannot be read incrementally and is re-read whole when it changes.
+    """
+
+    def __init__(self, url, state_path=REMOTE_CURSOR):
+        self.url = url
+        self.state_path = pathlib.Path(state_path)
+        self.etag = None
+        self.last_modified = None
+        self.offset = 0
+        self.array = False
+        self.interval = REMOTE_POLL_MIN_S
+        self.next_at = 0.0
+        self.stats = {'polls': 0, 'not_modified': 0, 'bytes': 0, 'items': 0, 'offset': 0, 'interval_s': self.interval}
+        try:
+            st = json.loads(self.state_path.read_text())
+            if st.get('url') == url:
+                self.etag = st.get('etag')
+                self.last_modified = st.get('last_modified')
+                self.offset = int(st.get('offset') or 0)
+                self.array = bool(st.get('array'))
+        except Exception:
+            pass
+
+    def due(self):
+        return time.time() >= self.next_at
+
+    def _save(self):
+        try:
+            atomic_write_json(self.state_path, {'url': self.url, 'etag': self.etag,
+                                                'last_modified': self.last_modified, 'offset': self.offset,
+                                                'array': self.array})
+        except OSError:
+            pass
+
+    def _request(self, ranged=True):
+        # _ts keeps CDN caches (raw.githubusercontent.com) from serving a stale copy;
+        # the validators and Range still apply to the resource itself.
+        url = self.url + ('&' if '?' in self.url else '?') + f'_ts={int(time.time())}'
+        req = urllib.request.Request(url, headers={'User-Agent': 'dsu-watcher', 'Accept-Encoding': 'identity'})
+        if self.etag:
+            req.add_header('If-None-Match', self.etag)
+        if self.last_modified:
+            req.add_header('If-Modified-Since', self.last_modified)
+        if ranged and self.offset and not self.array:
+            req.add_header('Range', f'bytes={self.offset}-')
+        try:
+            with urllib.request.urlopen(req, timeout=5) as resp:
+                return resp.status, resp.headers, resp.read()
+        except urllib.error.HTTPError as e:
+            if e.code in (304, 416):
+                return e.code, e.headers, b''
+            raise
+
+    def poll(self):
+        """Fetch and enqueue new remote jobs; returns how many job files were written."""
+        self.stats['polls'] += 1
+        status, headers, body = self._request()
+        if status == 416:
+            # Nothing past our offset; if the file shrank it was rewritten, so start over
+            total = (headers.get('Content-Range') or '').rpartition('/')[2]
+            if total.isdigit() and int(total) < self.offset:
+                self.offset = 0
+                self.etag = self.last_modified = None
+                status, headers, body = self._request(ranged=False)
+            else:
+                status = 304
+        if status == 304:
+            self.stats['not_modified'] += 1
+            return self._reschedule(0)
+        self.etag = headers.get('ETag') or self.etag
+        self.last_modified = headers.get('Last-Modified') or self.last_modified
+        self.stats['bytes'] += len(body)
+        text = body.decode('utf-8', errors='replace')
+        if status == 206:
+            start = (headers.get('Content-Range') or '').replace('bytes ', '').split('-')[0]
+            if start.isdigit() and int(start) != self.offset:
+                # Server did not honour our offset; re-read the whole file
+                self.offset = 0
+                status, headers, body = self._request(ranged=False)
+                text = body.decode('utf-8', errors='replace')
+        if status != 206:
+            self.offset = 0
+        items, consumed = self._parse(text)
+        self.offset += consumed
+        written = self._enqueue(items)
+        print(f"[Watcher] REMOTE poll status={status} bytes={len(body)} items={len(items)} new={written} offset={self.offset}")
+        self._save()
+        return self._reschedule(written)
+
+    def _parse(self, text):
+        """Return (items, bytes consumed); a trailing partial line is left for the next poll."""
+        self.array = self.offset == 0 and text.lstrip().startswith('[')
+        if self.array:
+            try:
+                return json.loads(text), len(text.encode('utf-8'))
+            except ValueError:
+                return [], 0
+        head, sep, tail = text.rpartition('\n')
+        complete = head + sep
+        if tail.strip():
+            try:
+                json.loads(tail)
+                complete += tail
+            except ValueError:
+                pass
+        items = []
+        for line in complete.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                items.append(json.loads(line))
             except Exception:
-                zero_config = True
+                continue
+        return items, len(complete.encode('utf-8'))
 
-            # 1) Process explicit JSON jobs
-            for job_json in sorted(JOBS.glob('*.json')):
-                jid = job_json.stem
-                stem_dir = OUT / jid
-                if (stem_dir / 'done.json').exists():
+    def _enqueue(self, items):
+        written = 0
+        for job in items:
+            if not isinstance(job, dict):
+                continue
+            jid = str(job.get('id') or '').strip()
+            if not jid or LEDGER.is_final(jid):
+                # Already done; skip
+                continue
+            job_path = JOBS / f'{jid}.json'
+            if not job_path.exists():
+                try:
+                    atomic_write_json(job_path, job)
+                    written += 1
+                    print(f"[Watcher] REMOTE wrote job {jid} -> {job_path}")
+                except Exception:
+                    pass
+        self.stats['items'] += len(items)
+        return written
+
+    def _reschedule(self, written):
+        self.interval = REMOTE_POLL_MIN_S if written else min(REMOTE_POLL_MAX_S, self.interval * 2)
+        self.next_at = time.time() + self.interval
+        self.stats['offset'] = self.offset
+        self.stats['interval_s'] = self.interval
+        return written
+
+    def fail(self, e):
+        print(f"[Watcher] REMOTE poll failed: {type(e).__name__}: {e}")
+        self._reschedule(0)
+
+def read_zero_config():
+    # Read config (zero-config default enabled for simplicity)
+    try:
+        if CONFIG.exists():
+            cfg = json.loads(CONFIG.read_text() or '{}')
+            return bool(cfg.get('zero_config', False))
+    except Exception:
+        pass
+    return True
+
+def scan_pending(zero_config):
+    """List jobs the ledger does not know as finished.
+
+    One directory listing per folder; only unfinished entries are stat'ed.
+    Returns [(kind, path, jid, mtime)], JSON jobs first.
+    """
+    t0 = time.perf_counter()
+    json_ids = set()
+    pending = []
+    with os.scandir(JOBS) as it:
+        for entry in it:
+            if not entry.name.endswith('.json'):
+                continue
+            jid = entry.name[:-5]
+            json_ids.add(jid)
+            if not LEDGER.is_final(jid) and entry.is_file():
+                pending.append(('json', pathlib.Path(entry.path), jid, entry.stat().st_mtime))
+    if zero_config:
+        with os.scandir(AUDIO) as it:
+            for entry in it:
+                stem, ext = os.path.splitext(entry.name)
+                # Skip if a JSON job exists for this id
+                if ext.lower() not in AUDIO_EXTS or stem in json_ids or LEDGER.is_final(stem):
                     continue
-                process_job(job_json)
-                # optional: remove job_json after processing
-                # job_json.unlink(missing_ok=True)
-
-            # 2) Optional zero-config: process any new audio dropped without JSON
-            if zero_config:
-                for audio_path in sorted(AUDIO.glob('*')):
-                    if not audio_path.is_file():
-                        continue
-                    if audio_path.suffix.lower() not in {'.wav', '.flac', '.mp3', '.m4a', '.ogg'}:
-                        continue
-                    jid = audio_path.stem
-                    stem_dir = OUT / jid
-                    # Skip if already processed
-                    if (stem_dir / 'done.json').exists():
-                        continue
-                    # Skip if a JSON job exists for this id
-                    if (JOBS / f'{jid}.json').exists():
+                if entry.is_file():
+                    pending.append(('audio', pathlib.Path(entry.path), stem, entry.stat().st_mtime))
+    pending.sort(key=lambda item: (item[0] != 'json', item[1].name))
+    ms = (time.perf_counter() - t0) * 1000
+    WATCH_STATS['scans'] += 1
+    WATCH_STATS['pending'] = len(pending)
+    WATCH_STATS['scan_ms'] = round(ms, 2)
+    WATCH_STATS['scan_ms_avg'] = round(ms if WATCH_STATS['scans'] == 1 else 0.9 * WATCH_STATS['scan_ms_avg'] + 0.1 * ms, 2)
+    return pending
+
+def note_pickup(mtime):
+    latency = max(0.0, time.time() - mtime)
+    avg = WATCH_STATS['pickup_latency_s_avg']
+    WATCH_STATS['pickups'] += 1
+    WATCH_STATS['pickup_latency_s'] = round(latency, 3)
+    WATCH_STATS['pickup_latency_s_avg'] = round(latency if avg is None else 0.9 * avg + 0.1 * latency, 3)
+
+# jid -> {'sig': (mtime, size), 'since': first seen with that sig, 'scans': n}
+_UNREADABLE = {}
+
+def unreadable_settled(jid, path):
+    """Record a failed read; True once the file has stopped changing."""
+    try:
+        st = path.stat()
+        sig = (st.st_mtime, st.st_size)
+    except OSError:
+        sig = None
+    cur = _UNREADABLE.get(jid)
+    if cur is None or cur['sig'] != sig:
+        _UNREADABLE[jid] = {'sig': sig, 'since': time.time(), 'scans': 0}
+        return False
+    cur['scans'] += 1
+    if cur['scans'] >= UNREADABLE_SCANS or time.time() - cur['since'] >= UNREADABLE_S:
+        del _UNREADABLE[jid]
+        return True
+    return False
+
+_PENDING_MODELS = {}
+
+def pending_model(kind, path, mtime):
+    """Model a queued item will need, read once per (path, mtime)."""
+    if kind != 'json':
+        return ZERO_CONFIG_DEFAULTS['model']
+    key = (str(path), mtime)
+    if key not in _PENDING_MODELS:
+        if len(_PENDING_MODELS) > 1024:
+            _PENDING_MODELS.clear()
+        try:
+            _PENDING_MODELS[key] = json.loads(path.read_text()).get('model') or ZERO_CONFIG_DEFAULTS['model']
+        except Exception:
+            _PENDING_MODELS[key] = None
+    return _PENDING_MODELS[key]
+
+def watch_loop():
+    global PIPELINE
+    print(f'Watching {JOBS} ...')
+    LEDGER.load()
+    waker = Waker([JOBS, AUDIO])
+    WATCH_STATS['wakeup'] = waker.mode
+    PIPELINE = Pipeline(waker).start()
+    WATCH_STATS['leases'] = LEASES.start().stats
+    remote = RemotePoller(REMOTE_JOBS_URL) if REMOTE_JOBS_URL else None
+    if remote is not None:
+        WATCH_STATS['remote'] = remote.stats
+    WATCH_STATS['models'] = MODELS.stats
+    # The zero-config model is what an audio drop will need first
+    MODELS.prefetch(ZERO_CONFIG_DEFAULTS['model'])
+    interval = POLL_MIN_S
+    while True:
+        did_work = False
+        try:
+            # Pull remote jobs if configured
+            if remote is not None and remote.due():
+                try:
+                    remote.poll()
+                except Exception as e:
+                    remote.fail(e)
+            pending = scan_pending(read_zero_config())
+            for kind, path, jid, mtime in pending:
+                # Copy checkpoints while the job still waits for a slot
+                MODELS.prefetch(pending_model(kind, path, mtime))
+            for kind, path, jid, mtime in pending:
+                if PIPELINE.busy(jid):
+                    continue
+                manifest = read_chunk_manifest(jid)
+                if manifest is not None and not chunks_ready(jid, manifest):
+                    continue
+                if not PIPELINE.has_capacity():
+                    break
+                claimed = LEASES.claim(jid)
+                if claimed is ALREADY_DONE:
+                    # Finished by a worker with its own root; its out/ is not visible here
+                    print(f"[Watcher] LEASE {jid} already done by another worker")
+                    LEDGER.set(jid, 'done', by='lease')
+                    continue
+                if not claimed:
+                    # Another worker is running it
+                    continue
+                if (OUT / jid / 'done.json').exists():
+                    # Finished before the ledger knew about it (e.g. by another runtime)
+                    LEDGER.set(jid, 'done')
+                    LEASES.release(jid, done=True)
+                    continue
+                try:
+                    task = job_task(path) if kind == 'json' else audio_task(path)
+                except Exception as e:
+                    if not unreadable_settled(jid, path):
+                        # Probably still being written or synced; try again on a later scan
+                        if _UNREADABLE[jid]['scans'] == 0:
+                            print(f"[Watcher] NOT READY {path.name}: {e}")
+                        LEASES.release(jid)
                         continue
-                    process_audio_file(audio_path)
+                    print(f"[Watcher] ERROR reading {path.name}: {e}")
+                    write_done(jid, status='error', error=f'{type(e).__name__}: {e}')
+                    LEASES.release(jid)
+                    continue
+                _UNREADABLE.pop(jid, None)
+                note_pickup(mtime)
+                LEDGER.set(jid, 'running')
+                did_work = True
+                PIPELINE.submit(task)
         except Exception as e:
             print('Watcher error:', e)
-        time.sleep(2)
+        interval = POLL_MIN_S if did_work else min(POLL_MAX_S, interval * 2)
+        WATCH_STATS['poll_interval_s'] = interval
+        if not did_work:
+            wait = interval if remote is None else max(0.1, min(interval, remote.next_at - time.time()))
+            waker.wait(wait)
 
 def main():
+    # Log lines of the shared hf_space helpers (result cache, silence)
+    logging.basicConfig(level=logging.INFO, format='[Watcher] %(message)s')
     threading.Thread(target=beat, daemon=True).start()
+    if engine_available():
+        WORKER.start()
     watch_loop()
 
 if __name__ == '__main__':
     main()
-
-
@@ -1,27 +1,203 @@
-import io
 import os
 import shutil
-import tempfile
-import zipfile
 import pathlib
 import subprocess
 import logging
-from fastapi import FastAPI, UploadFile, File, Form, Request
-from fastapi.responses import FileResponse, JSONResponse
+import time
+import json
+import asyncio
+import threading
+from typing import Optional, Tuple
+from fastapi import FastAPI, UploadFile, File, Form, Request, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
+
+import autotune
+import silence
+from jobs import SCHEDULER, Job, JobCancelled, QueueFull
+from metrics import METRICS, record, span
+from output import HIRES, iter_encoded, normalize_format, stream_zip
+from result_cache import CACHE, CACHE_ENABLED, cache_key
+from workspace import WORKSPACES, WorkspaceFull
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("dsu")
 
 app = FastAPI()
 
+# "inprocess" keeps models warm in this interpreter (see engine.py);
+# "subprocess" runs `python -m demucs.separate` per request as before.
+ENGINE_MODE = os.environ.get("DSU_ENGINE_MODE", "inprocess").strip().lower()
+# demucs_int8: the in-process engine with Linear/LSTM layers quantized to int8
+ENGINES = ("demucs", "demucs_int8", "spleeter")
+# Quick first pass for preview=true jobs: a Demucs model run without shifts, or "spleeter"
+PREVIEW_ENGINE = os.environ.get("DSU_PREVIEW_ENGINE", "htdemucs").strip()
+# Share of the job's progress bar given to the preview pass
+PREVIEW_SHARE = 0.2
+
+
+METRICS.gauge("dsu_queue_depth", "Jobs waiting for a worker", lambda: SCHEDULER.depth())
+METRICS.gauge("dsu_jobs_running", "Jobs being separated", lambda: SCHEDULER.running())
+METRICS.gauge("dsu_cache_lookups_total", "Result cache lookups by result",
+              lambda: {"label": "result", "values": {"hit": CACHE.hits, "miss": CACHE.misses}}, kind="counter")
+METRICS.gauge("dsu_workspace_bytes", "Bytes in request scratch dirs", lambda: WORKSPACES.usage()["bytes"])
+
+
+def _resident_bytes():
+    if ENGINE_MODE != "inprocess":
+        return None
+    from engine import POOL
+    return POOL.resident_bytes()
+
+
+METRICS.gauge("dsu_models_resident_bytes", "Weights of the warm in-process models", _resident_bytes)
+
+
+@app.middleware("http")
+async def count_requests(request: Request, call_next):
+    t0 = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Route template, so /jobs/{job_id} is one series rather than one per id
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        METRICS.inc("dsu_requests_total", method=request.method, route=route, status=status)
+        METRICS.observe("dsu_request_seconds", time.perf_counter() - t0, route=route)
+
+
+@app.get("/metrics")
+def metrics():
+    return PlainTextResponse(METRICS.render(), media_type="text/plain; version=0.0.4")
+
 
 @app.get("/")
 def root():
-    return {"dsu": "ok", "device": "cpu"}
+    info = {
+        "dsu": "ok", "device": "cpu", "engine_mode": ENGINE_MODE,
+        "queue_depth": SCHEDULER.depth(), "running": SCHEDULER.running(), "max_concurrency": SCHEDULER.workers,
+        "cache_hits": CACHE.hits, "cache_misses": CACHE.misses,
+        "work_bytes": WORKSPACES.usage()["bytes"],
+    }
+    if ENGINE_MODE == "inprocess":
+        try:
+            from engine import POOL
+            info["models_loaded"] = POOL.loaded()
+            info["models_resident_bytes"] = POOL.resident_bytes()
+        except Exception:
+            pass
+    return info
+
+
+@app.on_event("startup")
+def start_scheduler():
+    SCHEDULER.start()
+
+
+@app.on_event("startup")
+def reclaim_workspaces():
+    # Nothing is running yet, so every scratch dir on disk is an orphan
+    WORKSPACES.reclaim_orphans()
+
+
+@app.on_event("startup")
+def preload_models():
+    # Optional warm-up, e.g. DSU_PRELOAD_MODELS=htdemucs,htdemucs_ft
+    names = [n.strip() for n in os.environ.get("DSU_PRELOAD_MODELS", "").split(",") if n.strip()]
+    if ENGINE_MODE != "inprocess" or not names:
+        return
+
+    def _warm():
+        try:
+            from engine import POOL
+            for name in names:
+                POOL.get(name)
+        except Exception as e:
+            logger.warning("[HF][engine] preload failed: %s", e)
+
+    threading.Thread(target=_warm, daemon=True).start()
+
+
+@app.on_event("startup")
+def tune_threads():
+    # Concurrent separations share the cores instead of each grabbing all of them
+    if ENGINE_MODE != "inprocess":
+        return
+    try:
+        threads = autotune.apply_threads("htdemucs", SCHEDULER.workers)
+    except ImportError:
+        return
+    logger.info("[HF][autotune] torch threads=%s workers=%s", threads, SCHEDULER.workers)
+
+
+@app.get("/cache")
+def cache_stats():
+    return {"enabled": CACHE_ENABLED, **CACHE.stats()}
+
+
+@app.get("/autotune")
+def autotune_stats():
+    return {"hardware": autotune.probe(), "costs": autotune.costs(),
+            "plans": {t: autotune.plan("htdemucs", t, SCHEDULER.workers) for t in autotune.TARGETS}}
+
+
+@app.get("/capacity")
+def capacity():
+    """Load and speed of this Space, shaped like the watcher heartbeat's `capacity`.
+
+    speed is audio seconds per second for one pass of each measured model;
+    wait_s is how long a job submitted now would queue. Read by tools/dsu_router.py.
+    """
+    hw = autotune.probe()
+    typical_s = SCHEDULER.avg_s()
+    current = [{"id": j.id, "model": j.params.get("model"), "phase": j.phase, "progress": round(j.progress, 4),
+                "eta_s": round(j.eta_s(typical_s), 1)} for j in SCHEDULER.active()]
+    speed = {m: round(1 / (c * autotune.MODEL_SHAPES.get(m, (1, 0))[0]), 3)
+             for m, c in autotune.costs().items() if c > 0}
+    models = None
+    if ENGINE_MODE == "inprocess":
+        try:
+            from engine import POOL
+            models = POOL.loaded()
+        except Exception:
+            pass
+    return {
+        "kind": "space", "device": hw["device"], "gpu": None, "cores": hw["cores"], "slots": SCHEDULER.workers,
+        "queue_depth": SCHEDULER.depth(), "running": len(current), "current": current, "models_loaded": models,
+        "speed": speed, "job_s_avg": round(typical_s, 1), "wait_s": round(SCHEDULER.wait_s(), 1),
+    }
+
+
+@app.get("/workspaces")
+def workspace_stats():
+    return WORKSPACES.usage()
+
+
+def run_cmd(cmd: list, tag: str, env: Optional[dict] = None, job: Optional[Job] = None) -> None:
+    """Run a separator CLI, killing it if `job` gets cancelled."""
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, env=env)
+    while True:
+        try:
+            out, _ = proc.communicate(timeout=0.5)
+            break
+        except subprocess.TimeoutExpired:
+            if job is not None and job.cancel_event.is_set():
+                proc.kill()
+                proc.communicate()
+                raise JobCancelled(job.id)
+    logger.info("[HF][%s] exit=%s", tag, proc.returncode)
+    if out:
+        logger.info("[HF][%s] log\n%s", tag, out[-4000:])
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd, output=out)
 
 
 def run_demucs(inp: pathlib.Path, out_dir: pathlib.Path, model: str, two_stems: str,
-               jobs: int, shifts: int, segments: float, clip_mode: str) -> None:
+               jobs: int, shifts: int, segments: float, clip_mode: str, job: Optional[Job] = None,
+               int24: bool = False) -> None:
     cmd = [
         "python", "-m", "demucs.separate",
         "-n", model or "htdemucs",
@@ -38,18 +214,60 @@ def run_demucs(inp: pathlib.Path, out_dir: pathlib.Path, model: str, two_stems:
         cmd += ["--segment", str(float(segments))]
     if clip_mode in ("rescale", "clamp"):
         cmd += ["--clip-mode", clip_mode]
+    if int24:
+        cmd += ["--int24"]
     cmd += [str(inp)]
     env = os.environ.copy()
     env["TORCH_AUDIO_BACKEND"] = "soundfile"
-    res = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, env=env)
-    logger.info("[HF][demucs] exit=%s", res.returncode)
-    if res.stdout:
-        logger.info("[HF][demucs] log\n%s", res.stdout[-4000:])
-    if res.returncode != 0:
-        raise subprocess.CalledProcessError(res.returncode, cmd, output=res.stdout)
+    # -j workers each get their share of this request's cores
+    threads = max(1, autotune.threads_per_job(SCHEDULER.workers) // max(1, int(jobs or 0)))
+    env["OMP_NUM_THREADS"] = env["MKL_NUM_THREADS"] = str(threads)
+    run_cmd(cmd, "demucs", env=env, job=job)
+
+
+def separate_demucs(inp: pathlib.Path, out_dir: pathlib.Path, model: str, two_stems: str,
+                    jobs: int, shifts: int, segments: float, clip_mode: str, job: Optional[Job] = None,
+                    chunk_s: float = 0, int24: bool = False, phase: str = "separate",
+                    span: Tuple[float, float] = (0.0, 1.0), quantized: bool = False) -> dict:
+    """Run Demucs with the warm in-process engine, falling back to the subprocess.
+
+    With chunk_s > 0, long tracks are split and separated in the chunk
+    process pool instead. Returns per-request timings: load_s (None when
+    unknown), infer_s and the path that actually ran. int24 writes 24-bit
+    stems for the lossless output formats. Progress is reported as `phase`,
+    scaled into `span` of the job's progress. quantized (engine=demucs_int8)
+    only exists in-process; there is no subprocess fallback for it.
+    """
+    if ENGINE_MODE == "inprocess":
+        try:
+            import engine
+        except ImportError as e:
+            if quantized:
+                raise RuntimeError(f"engine demucs_int8 needs the in-process engine: {e}")
+            logger.warning("[HF][engine] in-process engine unavailable (%s); using subprocess", e)
+        else:
+            lo, hi = span
+            progress = (lambda frac: job.set_progress(lo + frac * (hi - lo), phase)) if job is not None else None
+            if chunk_s and chunk_s > 0:
+                import chunking
+                timings = chunking.separate_chunked(inp, out_dir, model, two_stems, jobs, shifts, segments,
+                                                    clip_mode, chunk_s, progress=progress, int24=int24,
+                                                    quantized=quantized)
+                if timings is not None:
+                    timings["path"] = "chunked"
+                    return timings
+            timings = engine.separate(inp, out_dir, model, two_stems, jobs, shifts, segments, clip_mode,
+                                      progress=progress, int24=int24, quantized=quantized)
+            timings["path"] = "inprocess"
+            return timings
+    if quantized:
+        raise RuntimeError("engine demucs_int8 needs DSU_ENGINE_MODE=inprocess")
+    t0 = time.perf_counter()
+    run_demucs(inp, out_dir, model, two_stems, jobs, shifts, segments, clip_mode, job=job, int24=int24)
+    return {"load_s": None, "infer_s": time.perf_counter() - t0, "path": "subprocess"}
 
 
-def run_spleeter(inp: pathlib.Path, out_dir: pathlib.Path, stems: int) -> None:
+def run_spleeter(inp: pathlib.Path, out_dir: pathlib.Path, stems: int, job: Optional[Job] = None) -> None:
     # stems: 2, 4, or 5 (5 includes piano)
     preset = f"spleeter:{int(stems)}stems"
     cmd = [
@@ -58,97 +276,351 @@ def run_spleeter(inp: pathlib.Path, out_dir: pathlib.Path, stems: int) -> None:
         "-o", str(out_dir),
         str(inp)
     ]
-    res = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
-    logger.info("[HF][spleeter] exit=%s", res.returncode)
-    if res.stdout:
-        logger.info("[HF][spleeter] log\n%s", res.stdout[-4000:])
-    if res.returncode != 0:
-        raise subprocess.CalledProcessError(res.returncode, cmd, output=res.stdout)
+    run_cmd(cmd, "spleeter", job=job)
 
 
-def zip_dir(src_dir: pathlib.Path, dst_zip: pathlib.Path) -> None:
-    with zipfile.ZipFile(dst_zip, "w", zipfile.ZIP_DEFLATED) as z:
-        for p in src_dir.rglob("*"):
-            if p.is_file():
-                z.write(p, arcname=p.relative_to(src_dir))
+def stems_response(tmp: pathlib.Path, stems: pathlib.Path, params: dict, headers: dict,
+                   background: Optional[BackgroundTask] = None, preview: bool = False,
+                   spans: Optional[dict] = None) -> StreamingResponse:
+    """Stream stems.zip, encoding stems in parallel and sending each as it is ready.
 
+    Encoded files are kept in tmp/encoded so fetching a job result twice
+    does not encode twice. `background` runs once the stream has ended.
+    Time spent producing chunks (encode + zip) and time the client takes to
+    accept them (send) are recorded separately.
+    """
+    fmt = params["output_format"]
+    # Preview and final stems share file names; keep their encodes apart
+    encoded = tmp / ("encoded-preview" if preview else "encoded") / fmt
 
-@app.post("/separate")
-def separate(
-    request: Request,
-    file: UploadFile = File(...),
-    engine: str = Form("demucs"),              # demucs | spleeter
+    def body():
+        n = 0
+        zip_s = send_s = 0.0
+        t0 = time.perf_counter()
+        chunks = stream_zip(iter_encoded(stems, encoded, fmt), fmt)
+        try:
+            while True:
+                t = time.perf_counter()
+                chunk = next(chunks, None)
+                zip_s += time.perf_counter() - t
+                if chunk is None:
+                    break
+                n += len(chunk)
+                t = time.perf_counter()
+                yield chunk
+                send_s += time.perf_counter() - t
+        except Exception as e:
+            # Headers are already sent; all we can do is cut the stream short
+            logger.exception("[HF][output] streaming %s failed after %s bytes: %s", fmt, n, e)
+            raise
+        finally:
+            record("zip", zip_s, spans)
+            record("send", send_s, spans)
+            METRICS.inc("dsu_bytes_out_total", n)
+        logger.info("[HF][output] streamed zip format=%s bytes=%s in %.2fs", fmt, n, time.perf_counter() - t0)
+
+    name = "preview.zip" if preview else "stems.zip"
+    headers = {**headers, "X-DSU-Format": fmt, "X-DSU-Preview": "1" if preview else "0",
+               "Content-Disposition": f'attachment; filename="{name}"'}
+    return StreamingResponse(body(), media_type="application/zip", headers=headers, background=background)
+
+
+def link_or_copy(src: str, dst: str) -> None:
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def separation_params(
+    engine: str = Form("demucs"),              # demucs | demucs_int8 | spleeter
     model: str = Form("htdemucs"),             # demucs model (e.g., htdemucs, htdemucs_ft, htdemucs_6s)
     two_stems: str = Form(""),                 # vocals | drums | bass | other
     jobs: int = Form(1),
     shifts: int = Form(0),
     segments: float = Form(0),
     clip_mode: str = Form("rescale"),
-    spleeter_stems: int = Form(5)               # 2 | 4 | 5 (5 adds piano)
-):
-    client_host = getattr(getattr(request, "client", None), "host", "-")
-    logger.info(
-        "[HF] /separate received filename=%s engine=%s model=%s two_stems=%s jobs=%s shifts=%s segments=%s clip_mode=%s from=%s",
-        getattr(file, "filename", "(none)"), engine, model, two_stems, jobs, shifts, segments, clip_mode, client_host,
-    )
-    tmp = pathlib.Path(tempfile.mkdtemp(prefix="dsu_"))
+    spleeter_stems: int = Form(5),              # 2 | 4 | 5 (5 adds piano)
+    chunk_s: float = Form(0),                   # >0: separate overlapping chunks of this length in parallel
+    output_format: str = Form("wav"),           # wav (as separated) | wav16 | wav24 | flac | opus
+    target: str = Form(""),                     # latency | balanced | quality: pick jobs/segments/shifts for this Space
+    skip_silence: bool = Form(False),           # separate only the non-silent regions
+    silence_db: float = Form(silence.SILENCE_DB),
+    preview: bool = Form(False),                # /jobs: publish quick stems at /jobs/{id}/preview first
+) -> dict:
+    try:
+        output_format = normalize_format(output_format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    engine = engine.strip().lower()
+    if engine not in ENGINES:
+        raise HTTPException(status_code=400, detail=f"unknown engine {engine!r} (choose from {', '.join(ENGINES)})")
+    target = target.strip().lower()
+    if target and target not in autotune.TARGETS:
+        raise HTTPException(status_code=400, detail=f"unknown target {target!r} (choose from {', '.join(autotune.TARGETS)})")
+    return {
+        "engine": engine, "model": model, "two_stems": two_stems, "jobs": jobs, "shifts": shifts,
+        "segments": segments, "clip_mode": clip_mode, "spleeter_stems": spleeter_stems, "chunk_s": chunk_s,
+        "output_format": output_format, "target": target, "skip_silence": skip_silence, "silence_db": silence_db,
+        "preview": preview,
+    }
+
+
+def audio_seconds(path: pathlib.Path) -> Optional[float]:
+    try:
+        import soundfile as sf
+
+        return sf.info(str(path)).duration
+    except Exception:
+        return None
+
+
+def save_upload(file: UploadFile, tmp: pathlib.Path) -> pathlib.Path:
+    inp = tmp / os.path.basename(file.filename or "audio.wav")
+    with open(inp, "wb") as f:
+        shutil.copyfileobj(file.file, f)
     try:
-        inp = tmp / (file.filename or "audio.wav")
-        with open(inp, "wb") as f:
-            shutil.copyfileobj(file.file, f)
+        size_bytes = inp.stat().st_size
+    except Exception:
+        size_bytes = -1
+    logger.info("[HF] saved upload path=%s bytes=%s", inp, size_bytes)
+    METRICS.inc("dsu_bytes_in_total", max(0, size_bytes))
+    return inp
+
+
+def find_stems(out_root: pathlib.Path, model: str) -> pathlib.Path:
+    """The directory Demucs wrote the stems to under out_root."""
+    # Demucs may write either out/<model>/<name>/ or out/separated/<model>/<name>/
+    candidates = [out_root / "separated", out_root / (model or "htdemucs")]
+    existing = [p for p in candidates if p.exists()]
+    search_root = existing[0] if existing else out_root
+    # Find the deepest leaf containing files
+    leaf = None
+    for p in search_root.rglob("*"):
+        if p.is_dir() and any(x.is_file() for x in p.iterdir()):
+            leaf = p
+    if leaf is None:
         try:
-            size_bytes = inp.stat().st_size
+            listing = [str(p) for p in out_root.rglob("*")][:100]
         except Exception:
-            size_bytes = -1
-        logger.info("[HF] saved upload path=%s bytes=%s", inp, size_bytes)
-
-        out_root = tmp / "out"
-        out_root.mkdir(parents=True, exist_ok=True)
-
-        if engine == "spleeter":
-            logger.info("[HF] running spleeter stems=%s", spleeter_stems)
-            run_spleeter(inp, out_root, spleeter_stems)
-            # Spleeter writes out_root/<name>/
-            # Zip that folder
-            first = next(out_root.iterdir())
-            zip_path = tmp / "stems.zip"
-            zip_dir(first, zip_path)
+            listing = []
+        logger.error("[HF] error: no stems found under %s (out_root=%s, list sample=%s)", search_root, out_root, listing)
+        raise RuntimeError("no stems found")
+    return leaf
+
+
+def wants_preview(params: dict, job: Optional[Job]) -> bool:
+    # Only /jobs can hand out stems before the result; Spleeter is already the quick path
+    if job is None or not params.get("preview") or params["engine"] == "spleeter":
+        return False
+    return not (params["model"] == PREVIEW_ENGINE and not params["shifts"])
+
+
+def run_preview(tmp: pathlib.Path, src: pathlib.Path, params: dict, skipped: Optional[dict], job: Job) -> None:
+    """Quick pass whose stems are served at /jobs/{id}/preview until the result is ready.
+
+    A failed preview is logged and skipped; the full pass still runs.
+    """
+    out_root = tmp / "preview"
+    t0 = time.perf_counter()
+    try:
+        if PREVIEW_ENGINE == "spleeter":
+            run_spleeter(src, out_root, 2 if params["two_stems"] == "vocals" else 4, job=job)
+            stems = next(out_root.iterdir())
         else:
-            logger.info(
-                "[HF] running demucs model=%s two_stems=%s jobs=%s shifts=%s segments=%s clip_mode=%s",
-                model, two_stems, jobs, shifts, segments, clip_mode,
-            )
-            run_demucs(inp, out_root, model, two_stems, jobs, shifts, segments, clip_mode)
-            # Demucs may write either out/<model>/<name>/ or out/separated/<model>/<name>/
-            candidates = [out_root / "separated", out_root / (model or "htdemucs")]
-            existing = [p for p in candidates if p.exists()]
-            search_root = existing[0] if existing else out_root
-            # Find the deepest leaf containing files
-            leaf = None
-            for p in search_root.rglob("*"):
-                if p.is_dir() and any(x.is_file() for x in p.iterdir()):
-                    leaf = p
-            if leaf is None:
-                try:
-                    listing = [str(p) for p in out_root.rglob("*")][:100]
-                except Exception:
-                    listing = []
-                logger.error("[HF] error: no stems found under %s (out_root=%s, list sample=%s)", search_root, out_root, listing)
-                return JSONResponse({"error": "no stems found"}, status_code=500)
-            zip_path = tmp / "stems.zip"
-            zip_dir(leaf, zip_path)
+            separate_demucs(src, out_root, PREVIEW_ENGINE, params["two_stems"], params["jobs"], 0, params["segments"],
+                            params["clip_mode"], job=job, chunk_s=params["chunk_s"], phase="preview",
+                            span=(0.0, PREVIEW_SHARE))
+            stems = find_stems(out_root, PREVIEW_ENGINE)
+        if skipped is not None:
+            silence.expand(stems, skipped)
+    except JobCancelled:
+        raise
+    except Exception as e:
+        logger.warning("[HF][preview] failed, waiting for the full pass: %s", e)
+        shutil.rmtree(out_root, ignore_errors=True)
+        return
+    job.publish_preview(stems, {"X-DSU-Preview-Engine": PREVIEW_ENGINE})
+    logger.info("[HF][preview] %s stems ready in %.2fs (%.2fs after submit)", PREVIEW_ENGINE,
+                time.perf_counter() - t0, job.first_stem - job.created)
+
+
+def run_separation(tmp: pathlib.Path, inp: pathlib.Path, params: dict, job: Optional[Job] = None):
+    """Separate `inp`; returns (stems dir, response headers).
+
+    Runs on a scheduler worker thread for both /separate and /jobs. The
+    stems are encoded and zipped while streaming the response.
+    """
+    headers = {}
+    out_root = tmp / "out"
+    out_root.mkdir(parents=True, exist_ok=True)
+    model = params["model"]
+    spans = job.spans if job is not None else None
+
+    if params.get("target") and params["engine"] != "spleeter":
+        plan = autotune.plan(model, params["target"], SCHEDULER.workers)
+        params.update(jobs=plan["jobs"], segments=plan["segments"], shifts=plan["shifts"], plan=plan)
+        headers["X-DSU-Plan"] = json.dumps(plan, separators=(",", ":"))
+        logger.info("[HF][autotune] plan %s", plan)
+
+    with span("cache_lookup", spans):
+        key = cache_key(inp, params) if CACHE_ENABLED else None
+        hit = CACHE.lookup(key) if key is not None else None
+    if key is not None:
+        if hit is not None:
+            logger.info("[HF][cache] hit key=%s hits=%s misses=%s", key[:12], CACHE.hits, CACHE.misses)
+            # Own links survive the entry being evicted before the result is fetched
+            stems = out_root / "cached"
+            shutil.copytree(hit, stems, copy_function=link_or_copy)
+            return stems, {"X-DSU-Cache": "hit"}
+        logger.info("[HF][cache] miss key=%s hits=%s misses=%s", key[:12], CACHE.hits, CACHE.misses)
+        headers["X-DSU-Cache"] = "miss"
+
+    # Sparse material: separate only the active regions, splice back afterwards
+    src = inp
+    skipped = None
+    if params.get("skip_silence"):
+        with span("silence", spans):
+            skipped = silence.compact(inp, tmp / "silence", params["silence_db"])
+    if skipped is not None:
+        src = pathlib.Path(skipped["path"])
+        headers["X-DSU-Silence-Skipped"] = f"{skipped['skipped_frac']:.4f}"
+
+    progress_span = (0.0, 1.0)
+    if wants_preview(params, job):
+        with span("preview", spans):
+            run_preview(tmp, src, params, skipped, job)
+        progress_span = (PREVIEW_SHARE, 1.0)
+
+    t0 = time.perf_counter()
+    if params["engine"] == "spleeter":
+        logger.info("[HF] running spleeter stems=%s", params["spleeter_stems"])
+        run_spleeter(src, out_root, params["spleeter_stems"], job=job)
+        # Spleeter writes out_root/<name>/
+        stems = next(out_root.iterdir())
+    else:
+        logger.info(
+            "[HF] running %s model=%s two_stems=%s jobs=%s shifts=%s segments=%s clip_mode=%s",
+            params["engine"], model, params["two_stems"], params["jobs"], params["shifts"], params["segments"],
+            params["clip_mode"],
+        )
+        timings = separate_demucs(src, out_root, model, params["two_stems"], params["jobs"], params["shifts"],
+                                  params["segments"], params["clip_mode"], job=job, chunk_s=params["chunk_s"],
+                                  int24=params["output_format"] in HIRES, span=progress_span,
+                                  quantized=params["engine"] == "demucs_int8")
+        logger.info(
+            "[HF] demucs path=%s load_s=%s infer_s=%.2f",
+            timings["path"],
+            "-" if timings["load_s"] is None else f"{timings['load_s']:.2f}",
+            timings["infer_s"],
+        )
+        headers.update({
+            "X-DSU-Engine-Path": timings["path"],
+            "X-DSU-Infer-Seconds": f"{timings['infer_s']:.3f}",
+        })
+        if timings["load_s"] is not None:
+            headers["X-DSU-Load-Seconds"] = f"{timings['load_s']:.3f}"
+            if timings["load_s"] > 0:
+                METRICS.observe("dsu_model_load_seconds", timings["load_s"], model=model)
+                record("model_load", timings["load_s"], spans)
+        if timings.get("chunks"):
+            headers["X-DSU-Chunks"] = str(timings["chunks"])
+        if timings["path"] == "inprocess" and params["engine"] == "demucs":
+            # int8 speed says nothing about the fp32 model the plans are for
+            autotune.observe(model, audio_seconds(src), timings["infer_s"], params["shifts"])
+        stems = find_stems(out_root, model)
+        if job is not None:
+            job.check_cancelled()
+    sep_s = time.perf_counter() - t0
+    record("separate", sep_s, spans)
+
+    if skipped is not None:
+        with span("silence", spans):
+            silence.expand(stems, skipped)
+        # Separation time scales with audio length, so this is what the silence would have cost
+        saved_s = sep_s * skipped["skipped_s"] / max(skipped["active_s"], 1e-3)
+        headers["X-DSU-Silence-Saved-Seconds"] = f"{saved_s:.3f}"
+        params["silence"] = {"skipped_frac": skipped["skipped_frac"], "skipped_s": skipped["skipped_s"],
+                             "regions": len(skipped["regions"]), "saved_s": round(saved_s, 3)}
+        logger.info("[HF][silence] skipped %.1f%% (%.1fs), saved ~%.1fs", 100 * skipped["skipped_frac"],
+                    skipped["skipped_s"], saved_s)
+    if key is not None:
+        with span("cache_store", spans):
+            CACHE.store(key, stems, params)
+
+    logger.info("[HF] success: stems dir=%s files=%s", stems, sum(1 for p in stems.iterdir() if p.is_file()))
+    return stems, headers
+
+
+def queue_full_response(e: QueueFull) -> JSONResponse:
+    return JSONResponse(
+        {"error": "queue full", "retry_after": e.retry_after},
+        status_code=429,
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
+
+def disk_full_response(e: WorkspaceFull) -> JSONResponse:
+    return JSONResponse(
+        {"error": "scratch disk full", "retry_after": e.retry_after, **WORKSPACES.usage()},
+        status_code=503,
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
 
+def log_received(route: str, request: Request, file: UploadFile, params: dict) -> None:
+    client_host = getattr(getattr(request, "client", None), "host", "-")
+    logger.info(
+        "[HF] %s received filename=%s engine=%s model=%s two_stems=%s jobs=%s shifts=%s segments=%s clip_mode=%s from=%s",
+        route, getattr(file, "filename", "(none)"), params["engine"], params["model"], params["two_stems"],
+        params["jobs"], params["shifts"], params["segments"], params["clip_mode"], client_host,
+    )
+
+
+@app.post("/separate")
+async def separate(
+    request: Request,
+    file: UploadFile = File(...),
+    params: dict = Depends(separation_params),
+):
+    """Synchronous API: waits for the stems, but queues behind the scheduler."""
+    log_received("/separate", request, file, params)
+    try:
+        tmp = WORKSPACES.create()
+    except WorkspaceFull as e:
+        file.file.close()
+        return disk_full_response(e)
+    try:
+        t0 = time.perf_counter()
+        inp = await run_in_threadpool(save_upload, file, tmp)
+        upload_s = time.perf_counter() - t0
         try:
-            zip_size = zip_path.stat().st_size
-        except Exception:
-            zip_size = -1
-        logger.info("[HF] success: returning zip path=%s bytes=%s", zip_path, zip_size)
-        return FileResponse(str(zip_path), media_type="application/zip", filename="stems.zip")
+            job = SCHEDULER.submit(lambda j: run_separation(tmp, inp, params, j), tmp, params)
+        except QueueFull as e:
+            record("upload", upload_s)
+            WORKSPACES.release(tmp)
+            return queue_full_response(e)
+        record("upload", upload_s, job.spans)
+        # Pinned before it becomes evictable so another request's create() cannot
+        # delete it between the separation finishing and the response streaming
+        job.future.add_done_callback(lambda _f: (WORKSPACES.hold(tmp), WORKSPACES.finish(tmp)))
+        try:
+            stems, headers = await asyncio.wrap_future(job.future)
+        except asyncio.CancelledError:
+            # Client went away: unpin once the job ends so the space can be evicted
+            job.future.add_done_callback(lambda _f: WORKSPACES.unhold(tmp))
+            raise
+        logger.info("[HF] success: streaming %s stems from %s", params["output_format"], stems)
+        headers = {**headers, "X-DSU-Spans": json.dumps(job.spans, separators=(",", ":"))}
+        return stems_response(tmp, stems, params, headers, background=BackgroundTask(WORKSPACES.release, tmp),
+                              spans=job.spans)
     except subprocess.CalledProcessError as e:
         logger.exception("[HF] separation failed (proc): %s", e)
+        WORKSPACES.release(tmp)
         return JSONResponse({"error": f"separation failed: {e}"}, status_code=500)
     except Exception as e:
         logger.exception("[HF] separation failed (exception): %s", e)
+        WORKSPACES.release(tmp)
         return JSONResponse({"error": str(e)}, status_code=500)
     finally:
         try:
@@ -157,3 +629,97 @@ def separate(
             pass
 
 
+@app.post("/jobs", status_code=202)
+async def create_job(
+    request: Request,
+    file: UploadFile = File(...),
+    params: dict = Depends(separation_params),
+):
+    """Asynchronous API: returns a job id immediately; poll GET /jobs/{id}."""
+    log_received("/jobs", request, file, params)
+    try:
+        tmp = WORKSPACES.create()
+    except WorkspaceFull as e:
+        file.file.close()
+        return disk_full_response(e)
+    try:
+        t0 = time.perf_counter()
+        inp = await run_in_threadpool(save_upload, file, tmp)
+        upload_s = time.perf_counter() - t0
+    except Exception:
+        WORKSPACES.release(tmp)
+        raise
+    finally:
+        try:
+            file.file.close()
+        except Exception:
+            pass
+    try:
+        job = SCHEDULER.submit(lambda j: run_separation(tmp, inp, params, j), tmp, params)
+    except QueueFull as e:
+        record("upload", upload_s)
+        WORKSPACES.release(tmp)
+        return queue_full_response(e)
+    record("upload", upload_s, job.spans)
+    # Kept until downloaded and pruned (DSU_JOB_TTL_S), or evicted for space
+    job.future.add_done_callback(lambda _f: WORKSPACES.finish(tmp))
+    logger.info("[HF] job queued id=%s depth=%s", job.id, SCHEDULER.depth())
+    urls = {"status_url": f"/jobs/{job.id}", "result_url": f"/jobs/{job.id}/result"}
+    if params["preview"]:
+        urls["preview_url"] = f"/jobs/{job.id}/preview"
+    return JSONResponse({**job.to_dict(), **urls}, status_code=202)
+
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    job = SCHEDULER.get(job_id)
+    if job is None:
+        return JSONResponse({"error": "unknown job"}, status_code=404)
+    return {**job.to_dict(), "queue_depth": SCHEDULER.depth(), "plan": job.params.get("plan"),
+            "silence": job.params.get("silence")}
+
+
+@app.get("/jobs/{job_id}/result")
+def job_result(job_id: str):
+    job = SCHEDULER.get(job_id)
+    if job is None:
+        return JSONResponse({"error": "unknown job"}, status_code=404)
+    if job.status == "cancelled":
+        return JSONResponse(job.to_dict(), status_code=410)
+    if job.status == "error":
+        return JSONResponse(job.to_dict(), status_code=500)
+    if job.status != "done":
+        return JSONResponse(job.to_dict(), status_code=409)
+    if not WORKSPACES.hold(job.workdir):
+        return JSONResponse({**job.to_dict(), "error": "result evicted to free disk space"}, status_code=410)
+    stems, headers = job.result
+    return stems_response(job.workdir, stems, job.params, headers,
+                          background=BackgroundTask(WORKSPACES.unhold, job.workdir), spans=job.spans)
+
+
+@app.get("/jobs/{job_id}/preview")
+def job_preview(job_id: str):
+    """Best stems so far: the quick pass while the job runs, the full result once done."""
+    job = SCHEDULER.get(job_id)
+    if job is None:
+        return JSONResponse({"error": "unknown job"}, status_code=404)
+    if job.status == "done":
+        return job_result(job_id)
+    if job.status in ("cancelled", "error"):
+        return JSONResponse(job.to_dict(), status_code=410 if job.status == "cancelled" else 500)
+    if job.preview is None:
+        return JSONResponse(job.to_dict(), status_code=409)
+    if not WORKSPACES.hold(job.workdir):
+        return JSONResponse({**job.to_dict(), "error": "result evicted to free disk space"}, status_code=410)
+    stems, headers = job.preview
+    return stems_response(job.workdir, stems, job.params, headers, preview=True,
+                          background=BackgroundTask(WORKSPACES.unhold, job.workdir))
+
+
+@app.delete("/jobs/{job_id}")
+def cancel_job(job_id: str):
+    job = SCHEDULER.get(job_id)
+    if job is None:
+        return JSONResponse({"error": "unknown job"}, status_code=404)
+    cancelled = SCHEDULER.cancel(job_id)
+    return {**job.to_dict(), "cancel_requested": cancelled}
@@ -0,0 +1,118 @@
+import os
+import threading
+import logging
+from typing import Dict, Optional
+
+logger = logging.getLogger("dsu")
+
+TARGETS = ("latency", "balanced", "quality")
+# balanced: the most shifts that keep separation under this many seconds per audio second
+MAX_RTF = float(os.environ.get("DSU_AUTOTUNE_MAX_RTF", "1.0"))
+# model -> (models in bag, longest segment in whole seconds; 0 = model default)
+MODEL_SHAPES = {
+    "htdemucs": (1, 7), "htdemucs_ft": (4, 7), "htdemucs_6s": (1, 7), "hdemucs_mmi": (1, 0),
+    "mdx": (4, 0), "mdx_extra": (4, 0), "mdx_q": (4, 0), "mdx_extra_q": (4, 0),
+}
+# Rough working memory of one Demucs worker per second of segment (GB)
+SEGMENT_GB_PER_S = 0.25
+
+_HW: Optional[dict] = None
+# model -> seconds of compute per audio second per pass (EMA of finished requests)
+_COSTS: Dict[str, float] = {}
+_LOCK = threading.Lock()
+# torch's intra-op thread count is process-wide; fixed once by apply_threads()
+_THREADS: Optional[int] = None
+
+
+def meminfo_gb(field: str) -> Optional[float]:
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / (1024 * 1024)
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def probe() -> dict:
+    """Cores and available RAM of this Space, measured once."""
+    global _HW
+    with _LOCK:
+        if _HW is None:
+            try:
+                cores = len(os.sched_getaffinity(0))
+            except AttributeError:
+                cores = os.cpu_count() or 1
+            _HW = {"device": "cpu", "cores": cores, "ram_gb": round(meminfo_gb("MemAvailable") or 0, 1)}
+            logger.info("[HF][autotune] hardware %s", _HW)
+        return _HW
+
+
+def threads_per_job(concurrency: int) -> int:
+    """Cores one request may use so `concurrency` separations share them."""
+    forced = int(os.environ.get("DSU_TORCH_THREADS", "0") or 0)
+    return forced if forced > 0 else max(1, probe()["cores"] // max(1, concurrency))
+
+
+def observe(model: str, audio_s: Optional[float], infer_s: float, shifts: int) -> None:
+    if not audio_s or audio_s <= 0 or infer_s <= 0:
+        return
+    bag = MODEL_SHAPES.get(model, (1, 0))[0]
+    cost = infer_s / (audio_s * bag * max(1, int(shifts or 0)))
+    with _LOCK:
+        old = _COSTS.get(model)
+        _COSTS[model] = cost if old is None else 0.7 * old + 0.3 * cost
+
+
+def costs() -> Dict[str, float]:
+    with _LOCK:
+        return {m: round(c, 5) for m, c in _COSTS.items()}
+
+
+def plan(model: str, target: str, concurrency: int) -> dict:
+    """jobs/segments/shifts for one request, given how many run at once."""
+    hw = probe()
+    target = target if target in TARGETS else "balanced"
+    bag, max_seg = MODEL_SHAPES.get(model or "htdemucs", (1, 0))
+    # RAM is shared by every request that may run concurrently
+    mem_gb = (hw["ram_gb"] or 0) / max(1, concurrency)
+    segments = max_seg
+    if max_seg and mem_gb:
+        segments = max(2, min(max_seg, int(mem_gb * 0.6 / SEGMENT_GB_PER_S)))
+    budget = threads_per_job(concurrency)
+    fits = int(mem_gb * 0.6 / ((segments or 7) * SEGMENT_GB_PER_S)) if mem_gb else budget
+    jobs = max(1, min(budget, fits))
+    # Each of the `jobs` Demucs workers runs `threads` intra-op threads: keep
+    # jobs x threads within the budget (same rule as the watcher)
+    if _THREADS:
+        threads = _THREADS
+        jobs = max(1, min(jobs, budget // threads))
+    else:
+        threads = max(1, budget // jobs)
+    with _LOCK:
+        cost = _COSTS.get(model)
+    if target == "latency":
+        shifts = 0
+    elif target == "quality":
+        # Same rule as the watcher: the old default of 4 on any device
+        shifts = 4
+    elif cost is not None:
+        shifts = next((n for n in (2, 1, 0) if cost * bag * max(1, n) <= MAX_RTF), 0)
+    else:
+        shifts = 0
+    return {
+        "target": target, "device": hw["device"], "jobs": jobs, "segments": segments, "shifts": shifts,
+        "threads": threads, "est_rtf": None if cost is None else round(cost * bag * max(1, shifts), 3),
+    }
+
+
+def apply_threads(model: str, concurrency: int) -> int:
+    """Set torch's thread count once, from the plan for `model`; later plans size jobs to it."""
+    global _THREADS
+    import torch
+
+    threads = plan(model, "balanced", concurrency)["threads"]
+    torch.set_num_threads(threads)
+    _THREADS = threads
+    return threads
@@ -0,0 +1,234 @@
+import logging
+import math
+import multiprocessing
+import os
+import pathlib
+import shutil
+import subprocess
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("dsu")
+
+# Seconds shared by neighbouring chunks; they are crossfaded when stitching.
+CHUNK_OVERLAP_S = float(os.environ.get("DSU_CHUNK_OVERLAP_S", "5"))
+# Separation processes for chunked requests. Each one loads its own copy of
+# the model, so memory is roughly CHUNK_WORKERS x (model + one chunk).
+CHUNK_WORKERS = max(1, int(os.environ.get("DSU_CHUNK_WORKERS", "2")))
+
+_POOL: Optional[ProcessPoolExecutor] = None
+_POOL_LOCK = threading.Lock()
+
+
+def plan_chunks(frames: int, samplerate: int, chunk_s: float, overlap_s: float = CHUNK_OVERLAP_S) -> List[Tuple[int, int]]:
+    """Split [0, frames) into near-equal spans where neighbours overlap by overlap_s.
+
+    Returns a single span when the track is not much longer than one chunk.
+    """
+    chunk = int(chunk_s * samplerate)
+    overlap = int(overlap_s * samplerate)
+    if chunk <= 2 * overlap:
+        raise ValueError(f"chunk_s ({chunk_s}) must be more than twice the overlap ({overlap_s}s)")
+    if frames <= chunk + chunk // 2:
+        return [(0, frames)]
+    n = math.ceil((frames - overlap) / (chunk - overlap))
+    step = math.ceil((frames - overlap) / n)
+    return [(i * step, min(frames, i * step + step + overlap)) for i in range(n)]
+
+
+def decodable(inp: pathlib.Path, scratch: pathlib.Path) -> pathlib.Path:
+    """Return a file soundfile can seek in, transcoding with ffmpeg if needed."""
+    import soundfile as sf
+
+    try:
+        sf.info(str(inp))
+        return inp
+    except Exception:
+        out = scratch / "source.wav"
+        subprocess.run(["ffmpeg", "-nostdin", "-y", "-loglevel", "error", "-i", str(inp), "-vn",
+                        "-c:a", "pcm_f32le", str(out)], check=True)
+        return out
+
+
+def split_audio(inp: pathlib.Path, dest: pathlib.Path, chunk_s: float,
+                overlap_s: float = CHUNK_OVERLAP_S) -> Optional[dict]:
+    """Write the overlapping chunks of `inp` as dest/cNNN.wav (float32).
+
+    Returns the manifest needed by stitch_stems(), or None when the track
+    fits in one chunk. Only one chunk is held in memory at a time.
+    """
+    import soundfile as sf
+
+    dest.mkdir(parents=True, exist_ok=True)
+    src = decodable(inp, dest)
+    info = sf.info(str(src))
+    spans = plan_chunks(info.frames, info.samplerate, chunk_s, overlap_s)
+    if len(spans) == 1:
+        return None
+    names = []
+    with sf.SoundFile(str(src)) as f:
+        for i, (start, end) in enumerate(spans):
+            f.seek(start)
+            data = f.read(end - start, dtype="float32", always_2d=True)
+            name = f"c{i:03d}.wav"
+            sf.write(str(dest / name), data, info.samplerate, subtype="FLOAT")
+            names.append(name)
+    if src != inp:
+        src.unlink()
+    return {"samplerate": info.samplerate, "frames": info.frames, "spans": spans,
+            "overlap_s": overlap_s, "chunks": names}
+
+
+def stitch_stems(chunk_dirs: List[pathlib.Path], manifest: dict, out_dir: pathlib.Path, clip_mode: str,
+                 subtype: str = "PCM_16") -> List[str]:
+    """Overlap-add the per-chunk stems into out_dir/<stem>.wav (16-bit by default).
+
+    Neighbouring chunks are blended with a linear crossfade across their
+    shared region. Clipping is applied once over the whole track, as Demucs
+    does ('rescale' scales everything if the peak exceeds 1, 'clamp' clips,
+    'none' leaves the samples as they are), so the level never jumps at a seam.
+    """
+    import numpy as np
+    import soundfile as sf
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    stems = sorted(p.name for p in chunk_dirs[0].glob("*.wav"))
+    spans = manifest["spans"]
+    for stem in stems:
+        sr_out = sf.info(str(chunk_dirs[0] / stem)).samplerate
+        ratio = sr_out / manifest["samplerate"]
+        starts = [round(start * ratio) for start, _ in spans]
+        tmp = out_dir / f".{stem}.f32"
+        peak = 0.0
+        pending = None
+        with sf.SoundFile(str(tmp), "w", sr_out, sf.info(str(chunk_dirs[0] / stem)).channels,
+                          subtype="FLOAT", format="WAV") as out:
+            for i, d in enumerate(chunk_dirs):
+                data, _ = sf.read(str(d / stem), dtype="float32", always_2d=True)
+                if pending is not None:
+                    n = min(len(pending), len(data))
+                    fade = np.linspace(0.0, 1.0, n, endpoint=False, dtype=np.float32)[:, None]
+                    data[:n] = pending[:n] * (1.0 - fade) + data[:n] * fade
+                if i + 1 < len(chunk_dirs):
+                    cut = starts[i + 1] - starts[i]
+                    keep, pending = data[:cut], data[cut:]
+                else:
+                    keep, pending = data, None
+                if len(keep):
+                    peak = max(peak, float(np.abs(keep).max()))
+                out.write(keep)
+        scale = 1.0 / max(1.01 * peak, 1.0) if clip_mode == "rescale" else 1.0
+        with sf.SoundFile(str(tmp)) as src, sf.SoundFile(str(out_dir / stem), "w", src.samplerate, src.channels,
+                                                            subtype=subtype, format="WAV") as dst:
+            for block in src.blocks(blocksize=1 << 18, dtype="float32", always_2d=True):
+                dst.write(np.clip(block * scale, -0.99, 0.99) if clip_mode == "clamp" else block * scale)
+        tmp.unlink()
+    return stems
+
+
+def _init_worker(threads: int) -> None:
+    import engine
+
+    # The stub separator never touches torch, which may not even be installed
+    if engine.SEPARATOR != "stub":
+        import torch
+
+        torch.set_num_threads(threads)
+
+
+def _separate_chunk(chunk: str, out_dir: str, model: str, two_stems: str, jobs: int,
+                    shifts: int, segments: float, quantized: bool = False) -> Dict[str, float]:
+    import engine
+
+    return engine.separate(pathlib.Path(chunk), pathlib.Path(out_dir), model, two_stems, jobs, shifts,
+                           segments, "none", as_float=True, quantized=quantized)
+
+
+def pool() -> ProcessPoolExecutor:
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            threads = max(1, (os.cpu_count() or 1) // CHUNK_WORKERS)
+            # spawn: forking a process that already runs torch threads can deadlock
+            _POOL = ProcessPoolExecutor(CHUNK_WORKERS, mp_context=multiprocessing.get_context("spawn"),
+                                        initializer=_init_worker, initargs=(threads,))
+            logger.info("[HF][chunk] process pool workers=%s threads=%s", CHUNK_WORKERS, threads)
+        return _POOL
+
+
+def reset_pool(broken: ProcessPoolExecutor) -> None:
+    """Drop a pool whose child died (OOM kill, failed initializer); pool() builds a new one.
+
+    Concurrent requests that hit the same broken pool only replace it once.
+    """
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is broken:
+            _POOL = None
+    broken.shutdown(wait=False, cancel_futures=True)
+    logger.warning("[HF][chunk] process pool broken; rebuilding")
+
+
+def _run_chunks(work: pathlib.Path, manifest: dict, name: str, two_stems: str, jobs: int, shifts: int,
+                segments: float, quantized: bool, progress: Optional[Callable[[float], None]]) -> float:
+    """Separate every chunk in the pool; returns the longest model load."""
+    n = len(manifest["chunks"])
+    executor = pool()
+    futures = []
+    try:
+        futures = [executor.submit(_separate_chunk, str(work / c), str(work / "out"), name, two_stems,
+                                   jobs, shifts, segments, quantized) for c in manifest["chunks"]]
+        load_s = 0.0
+        for done, fut in enumerate(as_completed(futures), 1):
+            load_s = max(load_s, fut.result()["load_s"])
+            if progress is not None:
+                progress(done / n)
+        return load_s
+    except BrokenProcessPool:
+        reset_pool(executor)
+        raise
+    except BaseException:
+        for fut in futures:
+            fut.cancel()
+        raise
+
+
+def separate_chunked(inp: pathlib.Path, out_dir: pathlib.Path, model: str, two_stems: str,
+                     jobs: int, shifts: int, segments: float, clip_mode: str, chunk_s: float,
+                     progress: Optional[Callable[[float], None]] = None,
+                     int24: bool = False, quantized: bool = False) -> Optional[Dict[str, float]]:
+    """Separate overlapping chunks of `inp` in the process pool and stitch them.
+
+    Writes out_dir/<model>/<track>/<stem>.wav like engine.separate(); returns
+    None (nothing written) when the track fits in a single chunk.
+    """
+    name = model or "htdemucs"
+    work = out_dir / ".chunks"
+    manifest = split_audio(inp, work, chunk_s)
+    if manifest is None:
+        shutil.rmtree(work, ignore_errors=True)
+        return None
+    n = len(manifest["chunks"])
+    logger.info("[HF][chunk] %s -> %s chunks of %ss (overlap %ss)", inp.name, n, chunk_s, manifest["overlap_s"])
+    t0 = time.perf_counter()
+    try:
+        try:
+            load_s = _run_chunks(work, manifest, name, two_stems, jobs, shifts, segments, quantized, progress)
+        except BrokenProcessPool:
+            # One retry on a fresh pool; a second death means the request itself kills workers
+            logger.warning("[HF][chunk] retrying %s on a new process pool", inp.name)
+            shutil.rmtree(work / "out", ignore_errors=True)
+            load_s = _run_chunks(work, manifest, name, two_stems, jobs, shifts, segments, quantized, progress)
+    except BaseException:
+        shutil.rmtree(work, ignore_errors=True)
+        raise
+    infer_s = time.perf_counter() - t0
+    t1 = time.perf_counter()
+    chunk_dirs = [work / "out" / name / c.rsplit(".", 1)[0] for c in manifest["chunks"]]
+    stitch_stems(chunk_dirs, manifest, out_dir / name / inp.name.rsplit(".", 1)[0], clip_mode,
+                 "PCM_24" if int24 else "PCM_16")
+    shutil.rmtree(work, ignore_errors=True)
+    return {"load_s": load_s, "infer_s": infer_s, "write_s": time.perf_counter() - t1, "chunks": n}
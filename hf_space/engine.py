@@ -0,0 +1,264 @@
+import gc
+import os
+import pathlib
+import threading
+import time
+import logging
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("dsu")
+
+# Same backend the subprocess path forces on the child interpreter.
+os.environ.setdefault("TORCH_AUDIO_BACKEND", "soundfile")
+
+# Upper bound for resident model weights (MB). htdemucs is ~80 MB, htdemucs_ft
+# (bag of 4) ~320 MB, htdemucs_6s ~55 MB, so the default keeps all three warm.
+MODEL_MEM_MB = float(os.environ.get("DSU_MODEL_MEM_MB", "1024"))
+# Pool key suffix of the dynamically int8-quantized variant of a model
+INT8 = ":int8"
+# "stub" replaces the model with a deterministic split of the input, so
+# tools/bench_pipeline.py can time everything around the separation
+SEPARATOR = os.environ.get("DSU_SEPARATOR", "demucs").strip().lower()
+STUB_SOURCES = {"htdemucs_6s": ("drums", "bass", "other", "vocals", "guitar", "piano")}
+# Simulated compute for the stub, in seconds per audio second
+STUB_RTF = float(os.environ.get("DSU_STUB_RTF", "0"))
+
+
+class ModelPool:
+    """Warm pool of loaded Demucs models keyed by model name.
+
+    Models stay resident between requests and are evicted least-recently-used
+    once the summed parameter size exceeds `budget_mb`. The model that was just
+    requested is never evicted, so a single oversized model still loads.
+    "<name>:int8" loads <name> with its Linear/LSTM layers dynamically
+    quantized to int8 (the convolutions stay fp32).
+    """
+
+    def __init__(self, budget_mb: float = MODEL_MEM_MB, device: str = "cpu"):
+        self.budget_bytes = int(budget_mb * 1024 * 1024)
+        self.device = device
+        self._models: "OrderedDict[str, Tuple[object, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._loading: Dict[str, threading.Lock] = {}
+
+    def _load(self, name: str):
+        from demucs.pretrained import get_model
+
+        base, quantized = (name[:-len(INT8)], True) if name.endswith(INT8) else (name, False)
+        model = get_model(base)
+        model.to(self.device)
+        model.eval()
+        if quantized:
+            import torch
+
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear, torch.nn.LSTM}, dtype=torch.qint8)
+        return model
+
+    @staticmethod
+    def _size_bytes(model) -> int:
+        # state_dict rather than parameters(): quantized weights are packed, not Parameters
+        try:
+            import torch
+
+            total = 0
+            stack = list(model.state_dict().values())
+            while stack:
+                v = stack.pop()
+                if isinstance(v, (tuple, list)):
+                    stack.extend(v)
+                elif isinstance(v, torch.Tensor):
+                    total += v.numel() * v.element_size()
+            return total
+        except Exception:
+            return 0
+
+    def get(self, name: str) -> Tuple[object, float]:
+        """Return (model, load_seconds); load_seconds is 0.0 on a warm hit."""
+        with self._lock:
+            if name in self._models:
+                self._models.move_to_end(name)
+                return self._models[name][0], 0.0
+            load_lock = self._loading.setdefault(name, threading.Lock())
+        # Serialize loads of the same model without blocking hits on others
+        with load_lock:
+            with self._lock:
+                if name in self._models:
+                    self._models.move_to_end(name)
+                    return self._models[name][0], 0.0
+            t0 = time.perf_counter()
+            model = self._load(name)
+            load_s = time.perf_counter() - t0
+            size = self._size_bytes(model)
+            with self._lock:
+                self._models[name] = (model, size)
+                self._evict(keep=name)
+            logger.info("[HF][engine] loaded model=%s bytes=%s in %.2fs", name, size, load_s)
+            return model, load_s
+
+    def _evict(self, keep: str) -> None:
+        evicted = False
+        while self.resident_bytes() > self.budget_bytes and len(self._models) > 1:
+            oldest = next(iter(self._models))
+            if oldest == keep:
+                break
+            self._models.pop(oldest)
+            evicted = True
+            logger.info("[HF][engine] evicted model=%s (budget=%s bytes)", oldest, self.budget_bytes)
+        if evicted:
+            gc.collect()
+
+    def resident_bytes(self) -> int:
+        return sum(size for _, size in self._models.values())
+
+    def loaded(self) -> List[str]:
+        with self._lock:
+            return list(self._models.keys())
+
+
+POOL = ModelPool()
+
+
+class _ProgressHook:
+    """Stand-in for the `tqdm` module inside demucs.apply.
+
+    apply_model() opens one bar per (model in bag) x (shift) pass. The calling
+    thread registers a callback and gets an overall 0..1 fraction; threads
+    without a callback just iterate. The callback may raise to abort the run.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def begin(self, passes: int, callback: Optional[Callable[[float], None]]) -> None:
+        self._local.state = [max(1, passes), 0, callback]
+
+    def end(self) -> None:
+        self._local.state = None
+
+    def tqdm(self, iterable, **_kw):
+        state = getattr(self._local, "state", None)
+        if not state or state[2] is None:
+            yield from iterable
+            return
+        items = list(iterable)
+        total = max(1, len(items))
+        for i, item in enumerate(items):
+            yield item
+            state[2]((state[1] + (i + 1) / total) / state[0])
+        state[1] += 1
+
+
+_HOOK = _ProgressHook()
+
+
+def separate(inp: pathlib.Path, out_dir: pathlib.Path, model: str, two_stems: str,
+             jobs: int, shifts: int, segments: float, clip_mode: str,
+             progress: Optional[Callable[[float], None]] = None, as_float: bool = False,
+             int24: bool = False, quantized: bool = False) -> Dict[str, float]:
+    """In-process equivalent of `python -m demucs.separate`.
+
+    Writes stems to out_dir/<model>/<track>/<stem>.wav, the same layout the
+    CLI produces, and returns {'load_s', 'infer_s', 'write_s'}. `progress`
+    receives the separated fraction; raising from it cancels the run.
+    as_float writes 32-bit float stems (chunks that are stitched later);
+    int24 writes 24-bit PCM for the lossless output formats. quantized runs
+    the int8 variant of the model; stems still go under out_dir/<model>/.
+    """
+    if SEPARATOR == "stub":
+        return separate_stub(inp, out_dir, model, two_stems, progress=progress, as_float=as_float, int24=int24)
+    import torch
+    import demucs.apply
+    from demucs.apply import apply_model, BagOfModels
+    from demucs.audio import save_audio
+    from demucs.htdemucs import HTDemucs
+    from demucs.separate import load_track
+
+    name = model or "htdemucs"
+    net, load_s = POOL.get(name + INT8 if quantized else name)
+    if two_stems and two_stems not in net.sources:
+        raise ValueError(f"stem {two_stems!r} is not in model {name} (sources: {', '.join(net.sources)})")
+
+    segment = float(segments) if segments and float(segments) > 0 else None
+    if segment is not None:
+        if isinstance(net, HTDemucs):
+            segment = min(segment, float(net.segment))
+        elif isinstance(net, BagOfModels):
+            segment = min(segment, net.max_allowed_segment)
+
+    t0 = time.perf_counter()
+    try:
+        wav = load_track(inp, net.audio_channels, net.samplerate)
+    except SystemExit:
+        # load_track() exits the interpreter when no backend can decode the file
+        raise RuntimeError(f"could not load audio file {inp.name}")
+    ref = wav.mean(0)
+    wav = (wav - ref.mean()) / ref.std()
+    passes = (len(net.models) if isinstance(net, BagOfModels) else 1) * max(1, int(shifts or 0))
+    demucs.apply.tqdm = _HOOK
+    _HOOK.begin(passes, progress)
+    try:
+        with torch.no_grad():
+            sources = apply_model(net, wav[None], device=POOL.device, shifts=int(shifts or 0),
+                                  split=True, overlap=0.25, progress=True,
+                                  num_workers=int(jobs or 0), segment=segment)[0]
+    finally:
+        _HOOK.end()
+    sources = sources * ref.std() + ref.mean()
+    infer_s = time.perf_counter() - t0
+
+    t1 = time.perf_counter()
+    track_dir = out_dir / name / inp.name.rsplit(".", 1)[0]
+    track_dir.mkdir(parents=True, exist_ok=True)
+    clip = clip_mode if clip_mode in ("rescale", "clamp", "none") else "rescale"
+    kwargs = {"samplerate": net.samplerate, "clip": clip,
+              "bits_per_sample": 32 if as_float else (24 if int24 else 16), "as_float": as_float}
+    if two_stems:
+        rest = list(sources)
+        picked = rest.pop(net.sources.index(two_stems))
+        save_audio(picked, str(track_dir / f"{two_stems}.wav"), **kwargs)
+        save_audio(sum(rest), str(track_dir / f"no_{two_stems}.wav"), **kwargs)
+    else:
+        for source, stem in zip(sources, net.sources):
+            save_audio(source, str(track_dir / f"{stem}.wav"), **kwargs)
+    write_s = time.perf_counter() - t1
+    return {"load_s": load_s, "infer_s": infer_s, "write_s": write_s}
+
+
+def separate_stub(inp: pathlib.Path, out_dir: pathlib.Path, model: str, two_stems: str,
+                  progress: Optional[Callable[[float], None]] = None, as_float: bool = False,
+                  int24: bool = False) -> Dict[str, float]:
+    """separate() without a model: every stem is an equal share of the stereo input.
+
+    Same layout, sample format and output size as a real run, so the
+    benchmark measures the pipeline rather than Demucs.
+    """
+    import numpy as np
+    import soundfile as sf
+
+    name = model or "htdemucs"
+    sources = STUB_SOURCES.get(name, ("drums", "bass", "other", "vocals"))
+    names = (two_stems, f"no_{two_stems}") if two_stems else sources
+    subtype = "FLOAT" if as_float else ("PCM_24" if int24 else "PCM_16")
+    track_dir = out_dir / name / inp.name.rsplit(".", 1)[0]
+    track_dir.mkdir(parents=True, exist_ok=True)
+    t0 = time.perf_counter()
+    info = sf.info(str(inp))
+    outs = [sf.SoundFile(str(track_dir / f"{n}.wav"), "w", info.samplerate, 2, subtype=subtype, format="WAV")
+            for n in names]
+    try:
+        done = 0
+        with sf.SoundFile(str(inp)) as src:
+            for block in src.blocks(blocksize=1 << 18, dtype="float32", always_2d=True):
+                block = block[:, :2] if block.shape[1] >= 2 else np.repeat(block, 2, axis=1)
+                for out in outs:
+                    out.write(block / len(outs))
+                done += len(block)
+                if STUB_RTF > 0:
+                    time.sleep(STUB_RTF * len(block) / info.samplerate)
+                if progress is not None:
+                    progress(done / max(1, info.frames))
+    finally:
+        for out in outs:
+            out.close()
+    return {"load_s": 0.0, "infer_s": time.perf_counter() - t0, "write_s": 0.0}
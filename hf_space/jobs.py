@@ -0,0 +1,237 @@
+import os
+import queue
+import threading
+import time
+import uuid
+import logging
+import pathlib
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional
+
+from metrics import METRICS, record
+from workspace import WORKSPACES
+
+logger = logging.getLogger("dsu")
+
+CPU_COUNT = os.cpu_count() or 1
+# Demucs already spreads one separation over several cores, so running more
+# jobs than cores/4 at once only makes every job slower.
+MAX_CONCURRENCY = max(1, int(os.environ.get("DSU_MAX_CONCURRENCY", "0") or 0) or CPU_COUNT // 4)
+QUEUE_MAX = max(1, int(os.environ.get("DSU_QUEUE_MAX", "8")))
+JOB_TTL_S = float(os.environ.get("DSU_JOB_TTL_S", "3600"))
+
+
+class QueueFull(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__(f"queue full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, fn: Callable[["Job"], object], workdir: pathlib.Path, params: dict):
+        self.id = uuid.uuid4().hex[:12]
+        self.fn = fn
+        self.workdir = workdir
+        self.params = params
+        self.status = "queued"
+        self.progress = 0.0
+        self.phase = "queued"
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.error: Optional[str] = None
+        self.result = None
+        # (stems dir, headers) of the quick pass, published before the result
+        self.preview = None
+        self.first_stem: Optional[float] = None
+        # phase -> seconds (upload, queue, separate, zip, send, ...)
+        self.spans: Dict[str, float] = {}
+        self.cancel_event = threading.Event()
+        self.future: Future = Future()
+
+    def set_progress(self, progress: float, phase: Optional[str] = None) -> None:
+        """Progress callback for the separation; also the cancellation point."""
+        if self.cancel_event.is_set():
+            raise JobCancelled(self.id)
+        self.progress = max(self.progress, min(1.0, float(progress)))
+        if phase:
+            self.phase = phase
+
+    def publish_preview(self, stems: pathlib.Path, headers: dict) -> None:
+        self.preview = (stems, headers)
+        self.first_stem = time.time()
+
+    def eta_s(self, typical_s: float) -> float:
+        """Seconds left: extrapolated from progress, else what a typical job still needs."""
+        elapsed = time.time() - (self.started or time.time())
+        if self.progress > 0:
+            return elapsed * (1 - self.progress) / self.progress
+        return max(0.0, typical_s - elapsed)
+
+    def check_cancelled(self) -> None:
+        if self.cancel_event.is_set():
+            raise JobCancelled(self.id)
+
+    def to_dict(self) -> dict:
+        final = self.finished if self.status == "done" else None
+        return {
+            "id": self.id,
+            "status": self.status,
+            "phase": self.phase,
+            "progress": round(self.progress, 4),
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "error": self.error,
+            "preview_ready": self.preview is not None,
+            # Both measured from submission, so queueing counts as waiting
+            "time_to_first_stem_s": _since(self.created, self.first_stem or final),
+            "time_to_final_s": _since(self.created, final),
+            "spans": dict(self.spans),
+        }
+
+
+def _since(t0: float, t1: Optional[float]) -> Optional[float]:
+    return None if t1 is None else round(t1 - t0, 3)
+
+
+class JobScheduler:
+    """Fixed pool of worker threads behind a bounded FIFO queue.
+
+    submit() raises QueueFull (-> HTTP 429) instead of letting uploads pile up
+    and oversubscribe the CPU.
+    """
+
+    def __init__(self, workers: int = MAX_CONCURRENCY, max_queue: int = QUEUE_MAX, ttl_s: float = JOB_TTL_S):
+        self.workers = workers
+        self.ttl_s = ttl_s
+        self._queue: "queue.Queue[Job]" = queue.Queue(maxsize=max_queue)
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._running = 0
+        self._avg_s = 60.0
+        self._threads = []
+
+    def start(self) -> None:
+        if self._threads:
+            return
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker, name=f"dsu-job-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        logger.info("[HF][jobs] scheduler started workers=%s queue_max=%s", self.workers, self._queue.maxsize)
+
+    def submit(self, fn: Callable[[Job], object], workdir: pathlib.Path, params: dict) -> Job:
+        self.start()
+        self._prune()
+        job = Job(fn, workdir, params)
+        # Registered before a worker can dequeue it, unregistered if it never fit
+        with self._lock:
+            self._jobs[job.id] = job
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                self._jobs.pop(job.id, None)
+            raise QueueFull(self.retry_after())
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        job = self.get(job_id)
+        if job is None or job.status in ("done", "error", "cancelled"):
+            return False
+        job.cancel_event.set()
+        if job.status == "queued":
+            # The worker drops it when dequeued; report it cancelled right away
+            self._finish(job, "cancelled", error="cancelled")
+        return True
+
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def running(self) -> int:
+        return self._running
+
+    def avg_s(self) -> float:
+        return self._avg_s
+
+    def active(self) -> List[Job]:
+        with self._lock:
+            return [j for j in self._jobs.values() if j.status == "running"]
+
+    def wait_s(self) -> float:
+        """Estimated time until a job submitted now starts running."""
+        running = self.active()
+        queued = self._queue.qsize()
+        if len(running) + queued < self.workers:
+            return 0.0
+        # Work ahead of it, spread over the worker threads
+        ahead = sum(j.eta_s(self._avg_s) for j in running) + queued * self._avg_s
+        return ahead / self.workers
+
+    def retry_after(self) -> int:
+        backlog = self._queue.qsize() + self._running
+        return max(1, int(self._avg_s * backlog / self.workers))
+
+    def _finish(self, job: Job, status: str, result=None, error: Optional[str] = None) -> None:
+        job.status = status
+        job.phase = status
+        job.finished = time.time()
+        job.result = result
+        job.error = error
+        METRICS.inc("dsu_jobs_total", status=status)
+        if job.future.done():
+            return
+        if status == "done":
+            job.future.set_result(result)
+        elif status == "cancelled":
+            job.future.set_exception(JobCancelled(job.id))
+        else:
+            job.future.set_exception(RuntimeError(error or "failed"))
+
+    def _worker(self) -> None:
+        while True:
+            job = self._queue.get()
+            if job.cancel_event.is_set():
+                continue
+            job.status = "running"
+            job.phase = "running"
+            job.started = time.time()
+            record("queue", job.started - job.created, job.spans)
+            with self._lock:
+                self._running += 1
+            try:
+                result = job.fn(job)
+                job.progress = 1.0
+                self._finish(job, "done", result=result)
+            except JobCancelled:
+                logger.info("[HF][jobs] cancelled id=%s", job.id)
+                self._finish(job, "cancelled", error="cancelled")
+            except Exception as e:
+                logger.exception("[HF][jobs] failed id=%s: %s", job.id, e)
+                job.future.set_exception(e)
+                self._finish(job, "error", error=str(e))
+            finally:
+                with self._lock:
+                    self._running -= 1
+                self._avg_s = 0.8 * self._avg_s + 0.2 * (time.time() - job.started)
+
+    def _prune(self) -> None:
+        cutoff = time.time() - self.ttl_s
+        with self._lock:
+            stale = [j for j in self._jobs.values() if j.finished and j.finished < cutoff]
+            for j in stale:
+                self._jobs.pop(j.id, None)
+        for j in stale:
+            WORKSPACES.release(j.workdir)
+
+
+SCHEDULER = JobScheduler()
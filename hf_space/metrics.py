@@ -0,0 +1,125 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# Seconds; wide enough for a 1s upload and a 10min htdemucs_ft run
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, object]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _fmt(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    body = ",".join('{}="{}"'.format(k, v.replace("\\", "\\\\").replace('"', '\\"')) for k, v in items)
+    return "{" + body + "}"
+
+
+class Registry:
+    """Counters, histograms and callback gauges in the Prometheus text format.
+
+    Small on purpose: the Space has one process, so there is no multiprocess
+    collection and no dependency on prometheus_client.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help: Dict[str, Tuple[str, str]] = {}
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._hists: Dict[str, Dict[Labels, List[float]]] = {}
+        self._gauges: Dict[str, Callable[[], object]] = {}
+
+    def counter(self, name: str, doc: str) -> None:
+        self._help[name] = ("counter", doc)
+        self._counters.setdefault(name, {})
+
+    def histogram(self, name: str, doc: str) -> None:
+        self._help[name] = ("histogram", doc)
+        self._hists.setdefault(name, {})
+
+    def gauge(self, name: str, doc: str, fn: Callable[[], object], kind: str = "gauge") -> None:
+        """Value read from fn at scrape time: a number, or {"label": name, "values": {value: number}}.
+
+        kind="counter" for totals another component already keeps.
+        """
+        self._help[name] = (kind, doc)
+        self._gauges[name] = fn
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = _labels(labels)
+        with self._lock:
+            series = self._counters[name]
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = _labels(labels)
+        with self._lock:
+            # [bucket counts..., sum, count]
+            h = self._hists[name].setdefault(key, [0] * len(BUCKETS) + [0.0, 0])
+            for i, b in enumerate(BUCKETS):
+                if value <= b:
+                    h[i] += 1
+            h[-2] += value
+            h[-1] += 1
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            counters = {n: dict(s) for n, s in self._counters.items()}
+            hists = {n: {k: list(v) for k, v in s.items()} for n, s in self._hists.items()}
+        for name, (kind, doc) in sorted(self._help.items()):
+            lines += [f"# HELP {name} {doc}", f"# TYPE {name} {kind}"]
+            if name in self._counters:
+                for key, v in sorted(counters[name].items()):
+                    lines.append(f"{name}{_fmt(key)} {v:g}")
+            elif name in self._hists:
+                for key, h in sorted(hists[name].items()):
+                    for b, n in zip(BUCKETS, h):
+                        lines.append(f"{name}_bucket{_fmt(key, ('le', f'{b:g}'))} {n}")
+                    lines.append(f"{name}_bucket{_fmt(key, ('le', '+Inf'))} {h[-1]}")
+                    lines.append(f"{name}_sum{_fmt(key)} {h[-2]:.6f}")
+                    lines.append(f"{name}_count{_fmt(key)} {h[-1]}")
+            else:
+                try:
+                    value = self._gauges[name]()
+                except Exception:
+                    continue
+                if isinstance(value, dict):
+                    label, series = value.get("label", "name"), value.get("values", {})
+                    for k, v in sorted(series.items()):
+                        lines.append(f"{name}{_fmt(((label, str(k)),))} {float(v):g}")
+                elif value is not None:
+                    lines.append(f"{name} {float(value):g}")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Registry()
+METRICS.counter("dsu_requests_total", "HTTP requests by method, route and status code")
+METRICS.histogram("dsu_request_seconds", "Time until the response headers were sent, by route")
+METRICS.histogram("dsu_phase_seconds", "Duration of request phases (upload, queue, separate, zip, send, ...)")
+METRICS.histogram("dsu_model_load_seconds", "Cold model loads by model")
+METRICS.counter("dsu_bytes_in_total", "Uploaded audio bytes")
+METRICS.counter("dsu_bytes_out_total", "Bytes of stems.zip sent to clients")
+METRICS.counter("dsu_jobs_total", "Finished separations by status")
+
+
+@contextmanager
+def span(phase: str, spans: Optional[dict] = None) -> Iterator[None]:
+    """Time a phase into dsu_phase_seconds and, if given, a job's spans dict."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(phase, time.perf_counter() - t0, spans)
+
+
+def record(phase: str, seconds: float, spans: Optional[dict] = None) -> None:
+    METRICS.observe("dsu_phase_seconds", seconds, phase=phase)
+    if spans is not None:
+        spans[phase] = round(spans.get(phase, 0.0) + seconds, 4)
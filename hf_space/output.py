@@ -0,0 +1,123 @@
+import logging
+import os
+import pathlib
+import subprocess
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Iterable, Iterator, List
+
+logger = logging.getLogger("dsu")
+
+# output_format -> (extension, libsndfile format, subtype); None keeps the
+# stems exactly as separated (16-bit WAV), which is the historical output.
+FORMATS = {
+    "wav": None,
+    "wav16": ("wav", "WAV", "PCM_16"),
+    "wav24": ("wav", "WAV", "PCM_24"),
+    "flac": ("flac", "FLAC", None),   # lossless at the depth it was separated with
+    "opus": ("opus", None, None),     # lossy preview via ffmpeg/libopus
+}
+# Formats worth separating at 24-bit (Demucs --int24) instead of 16-bit
+HIRES = ("wav24", "flac")
+# Already compressed: deflating them again only burns CPU
+COMPRESSED = ("flac", "opus")
+OPUS_BITRATE = os.environ.get("DSU_OPUS_BITRATE", "160k")
+# Stems encoded at once; libsndfile and ffmpeg both run outside the GIL
+ENCODE_WORKERS = max(1, int(os.environ.get("DSU_ENCODE_WORKERS", str(min(4, os.cpu_count() or 1)))))
+
+
+def normalize_format(fmt: str) -> str:
+    name = str(fmt or "wav").strip().lower()
+    if name not in FORMATS:
+        raise ValueError(f"unknown output_format {fmt!r} (choose from {', '.join(FORMATS)})")
+    return name
+
+
+def encode_stem(src: pathlib.Path, dst_dir: pathlib.Path, fmt: str) -> pathlib.Path:
+    """Encode one stem into dst_dir; returns `src` itself when nothing changes."""
+    spec = FORMATS[fmt]
+    if spec is None:
+        return src
+    ext, container, subtype = spec
+    dst = dst_dir / f"{src.stem}.{ext}"
+    if dst.exists() and dst != src:
+        return dst  # encoded by an earlier download of the same result
+    tmp = dst_dir / f".{dst.name}.part"
+    if container is None:
+        subprocess.run(["ffmpeg", "-nostdin", "-y", "-loglevel", "error", "-i", str(src), "-vn",
+                        "-c:a", "libopus", "-b:a", OPUS_BITRATE, "-f", "opus", str(tmp)], check=True)
+    else:
+        import soundfile as sf
+
+        info = sf.info(str(src))
+        if subtype is None:
+            subtype = "PCM_16" if info.subtype in ("PCM_16", "PCM_U8", "PCM_S8") else "PCM_24"
+        if container == "WAV" and info.format == "WAV" and info.subtype == subtype:
+            return src
+        with sf.SoundFile(str(src)) as fin, sf.SoundFile(str(tmp), "w", fin.samplerate, fin.channels,
+                                                          subtype=subtype, format=container) as fout:
+            # int32 keeps PCM bit-exact; float sources must be read as float (libsndfile does not scale them to int)
+            dtype = "float32" if info.subtype in ("FLOAT", "DOUBLE") else "int32"
+            for block in fin.blocks(blocksize=1 << 18, dtype=dtype, always_2d=True):
+                fout.write(block)
+    os.replace(tmp, dst)
+    return dst
+
+
+def iter_encoded(src_dir: pathlib.Path, dst_dir: pathlib.Path, fmt: str) -> Iterator[pathlib.Path]:
+    """Encode every file of src_dir in parallel, yielding each as it finishes."""
+    sources: List[pathlib.Path] = sorted(p for p in src_dir.iterdir() if p.is_file())
+    if FORMATS[fmt] is None:
+        yield from sources
+        return
+    dst_dir.mkdir(parents=True, exist_ok=True)
+    pool = ThreadPoolExecutor(min(ENCODE_WORKERS, max(1, len(sources))), thread_name_prefix="dsu-encode")
+    try:
+        futures = [pool.submit(encode_stem, p, dst_dir, fmt) for p in sources]
+        for fut in as_completed(futures):
+            yield fut.result()
+    finally:
+        # Also reached when the client disconnects mid-download
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+class _Pipe:
+    """Write-only file object that hands zipfile's output to a generator."""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        out = b"".join(self.chunks)
+        self.chunks.clear()
+        return out
+
+
+def stream_zip(files: Iterable[pathlib.Path], fmt: str) -> Iterator[bytes]:
+    """Yield a zip archive of `files` while they are still being produced.
+
+    The sink is not seekable, so zipfile writes data descriptors after each
+    entry; compressed formats are STORED, PCM gets a cheap deflate.
+    """
+    pipe = _Pipe()
+    stored = fmt in COMPRESSED
+    with zipfile.ZipFile(pipe, "w", zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED,
+                         compresslevel=None if stored else 1) as z:
+        for path in files:
+            with open(path, "rb") as f, z.open(path.name, "w", force_zip64=True) as entry:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    entry.write(block)
+                    data = pipe.drain()
+                    if data:
+                        yield data
+            data = pipe.drain()
+            if data:
+                yield data
+    yield pipe.drain()
@@ -0,0 +1,168 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import logging
+import pathlib
+from typing import Optional
+
+from silence import SILENCE_DB
+
+logger = logging.getLogger("dsu")
+
+# Same layout as colab_watcher.py: <DSU_ROOT>/result-cache/<kk>/<key>/{entry.json,stems/}
+DSU_ROOT = pathlib.Path(os.environ.get("DSU_ROOT", os.path.join(tempfile.gettempdir(), "dsu")))
+CACHE_DIR = DSU_ROOT / "result-cache"
+CACHE_MAX_MB = float(os.environ.get("DSU_CACHE_MAX_MB", "2048"))
+CACHE_ENABLED = os.environ.get("DSU_RESULT_CACHE", "1") not in ("0", "false", "no")
+
+
+def file_sha256(path: pathlib.Path, chunk: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def cache_params(params: dict) -> dict:
+    """Only the fields that change the separated audio, normalized so the
+    watcher and the Space derive the same key for the same request."""
+    engine = str(params.get("engine") or "demucs").lower()
+    if engine == "spleeter":
+        return {"engine": engine, "spleeter_stems": int(params.get("spleeter_stems") or 5)}
+    out = {
+        "engine": engine,
+        "model": str(params.get("model") or "htdemucs"),
+        "two_stems": str(params.get("two_stems") or ""),
+        "shifts": int(params.get("shifts") or 0),
+        "segments": float(params.get("segments") or 0),
+        "clip_mode": str(params.get("clip_mode") or "rescale"),
+    }
+    if float(params.get("chunk_s") or 0) > 0:
+        # Stitched output differs slightly from a single pass; only keyed when used
+        out["chunk_s"] = float(params["chunk_s"])
+    if str(params.get("output_format") or "wav").lower() in ("wav24", "flac"):
+        # Separated at 24-bit; other formats are encoded from the 16-bit stems
+        out["bits"] = 24
+    if params.get("skip_silence"):
+        # Silent spans come back as digital silence
+        db = params.get("silence_db")
+        out["skip_silence"] = float(SILENCE_DB if db is None else db)
+    return out
+
+
+def cache_key(audio_path: pathlib.Path, params: dict) -> str:
+    blob = file_sha256(audio_path) + "\n" + json.dumps(cache_params(params), sort_keys=True)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """Content-addressed store of separated stems with a size cap.
+
+    Entries are evicted least-recently-used; a hit refreshes the mtime of the
+    entry's entry.json, which is what eviction orders by.
+    """
+
+    def __init__(self, root: pathlib.Path = CACHE_DIR, max_mb: float = CACHE_MAX_MB):
+        self.root = root
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _entry(self, key: str) -> pathlib.Path:
+        return self.root / key[:2] / key
+
+    def lookup(self, key: str) -> Optional[pathlib.Path]:
+        """Return the stems dir for `key`, or None on a miss."""
+        entry = self._entry(key)
+        meta = entry / "entry.json"
+        if meta.exists() and (entry / "stems").is_dir():
+            try:
+                os.utime(meta)
+            except OSError:
+                pass
+            with self._lock:
+                self.hits += 1
+            return entry / "stems"
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def store(self, key: str, src_dir: pathlib.Path, params: dict) -> Optional[pathlib.Path]:
+        """Copy the audio files of `src_dir` into the cache (atomic rename)."""
+        entry = self._entry(key)
+        if (entry / "entry.json").exists():
+            return entry / "stems"
+        files = [p for p in sorted(src_dir.iterdir()) if p.is_file() and p.name not in ("status.json", "done.json")]
+        if not files:
+            return None
+        staging = None
+        try:
+            entry.parent.mkdir(parents=True, exist_ok=True)
+            staging = pathlib.Path(tempfile.mkdtemp(prefix=f".{key[:8]}-", dir=entry.parent))
+            (staging / "stems").mkdir()
+            size = 0
+            for p in files:
+                shutil.copy2(p, staging / "stems" / p.name)
+                size += p.stat().st_size
+            (staging / "entry.json").write_text(json.dumps({
+                "key": key, "params": cache_params(params), "bytes": size, "created": time.time(),
+            }))
+            os.rename(staging, entry)
+        except OSError as e:
+            # Lost a race with another writer, or the disk is full
+            logger.warning("[cache] store failed key=%s: %s", key[:12], e)
+            if staging is not None:
+                shutil.rmtree(staging, ignore_errors=True)
+            return (entry / "stems") if (entry / "entry.json").exists() else None
+        self.evict()
+        return entry / "stems"
+
+    def _entries(self):
+        out = []
+        if not self.root.exists():
+            return out
+        for shard in self.root.iterdir():
+            if not shard.is_dir():
+                continue
+            for entry in shard.iterdir():
+                meta = entry / "entry.json"
+                try:
+                    st = meta.stat()
+                    size = int(json.loads(meta.read_text()).get("bytes", 0))
+                except (OSError, ValueError):
+                    continue
+                out.append((st.st_mtime, size, entry))
+        return out
+
+    def evict(self) -> int:
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, entry in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+            removed += 1
+        if removed:
+            logger.info("[cache] evicted %s entries, %s bytes remain", removed, total)
+        return removed
+
+    def stats(self) -> dict:
+        entries = self._entries()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes,
+        }
+
+
+CACHE = ResultCache()
@@ -0,0 +1,151 @@
+import logging
+import os
+import pathlib
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger("dsu")
+
+# Frames quieter than this (dBFS RMS over SILENCE_FRAME_S) count as silent
+SILENCE_DB = float(os.environ.get("DSU_SILENCE_DB", "-50"))
+# Only gaps at least this long are cut out
+SILENCE_MIN_S = float(os.environ.get("DSU_SILENCE_MIN_S", "1.0"))
+# Audio kept on both sides of every active region (reverb tails, breaths)
+SILENCE_PAD_S = float(os.environ.get("DSU_SILENCE_PAD_S", "0.25"))
+# Below this skipped fraction the input is separated as is
+SILENCE_MIN_SKIP = float(os.environ.get("DSU_SILENCE_MIN_SKIP", "0.1"))
+SILENCE_FRAME_S = 0.02
+
+
+def active_regions(path: pathlib.Path, threshold_db: float = SILENCE_DB, min_silence_s: float = SILENCE_MIN_S,
+                   pad_s: float = SILENCE_PAD_S) -> Tuple[List[Tuple[int, int]], int, int]:
+    """Return ([(start, end) frames of non-silent audio], total frames, samplerate).
+
+    One RMS value per SILENCE_FRAME_S frame, computed block by block, so
+    memory stays flat for long files.
+    """
+    import numpy as np
+    import soundfile as sf
+
+    info = sf.info(str(path))
+    hop = max(1, int(SILENCE_FRAME_S * info.samplerate))
+    loud = []
+    with sf.SoundFile(str(path)) as f:
+        for block in f.blocks(blocksize=hop * 4096, dtype="float32", always_2d=True):
+            n = len(block) // hop * hop
+            ms = np.square(block[:n]).mean(axis=1).reshape(-1, hop).mean(axis=1) if n else np.zeros(0)
+            if len(block) > n:
+                ms = np.append(ms, np.square(block[n:]).mean())
+            loud.append(10 * np.log10(ms + 1e-12) > threshold_db)
+    loud = np.concatenate(loud) if loud else np.zeros(0, dtype=bool)
+    # Run boundaries of the loud mask: starts at 0->1, ends at 1->0
+    edges = np.diff(np.concatenate(([0], loud.astype(np.int8), [0])))
+    starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    min_gap = int(round(min_silence_s / SILENCE_FRAME_S))
+    pad = int(pad_s * info.samplerate)
+    regions: List[Tuple[int, int]] = []
+    for s, e in zip(starts.tolist(), ends.tolist()):
+        if regions and s * hop - regions[-1][1] < min_gap * hop:
+            regions[-1] = (regions[-1][0], e * hop)  # gap too short to bother
+        else:
+            regions.append((s * hop, e * hop))
+    frames = info.frames
+    padded: List[Tuple[int, int]] = []
+    for s, e in regions:
+        s, e = max(0, s - pad), min(frames, e + pad)
+        if padded and s <= padded[-1][1]:
+            padded[-1] = (padded[-1][0], e)
+        else:
+            padded.append((s, e))
+    return padded, frames, info.samplerate
+
+
+def compact(inp: pathlib.Path, dest: pathlib.Path, threshold_db: float = SILENCE_DB) -> Optional[dict]:
+    """Write only the active regions of `inp`, back to back, as dest/<name>.wav.
+
+    Returns the manifest expand() needs, or None when too little would be
+    skipped (or nothing is loud at all) to be worth it.
+    """
+    import soundfile as sf
+    from chunking import decodable
+
+    dest.mkdir(parents=True, exist_ok=True)
+    readable = decodable(inp, dest)
+    regions, frames, sr = active_regions(readable, threshold_db)
+    active = sum(e - s for s, e in regions)
+    skipped = 1.0 - active / frames if frames else 0.0
+    if not regions or skipped < SILENCE_MIN_SKIP:
+        if readable != inp:
+            readable.unlink()
+        return None
+    out = dest / f"{inp.name.rsplit('.', 1)[0]}.wav"
+    with sf.SoundFile(str(readable)) as src, sf.SoundFile(str(out), "w", sr, src.channels, subtype="FLOAT",
+                                                     format="WAV") as dst:
+        for s, e in regions:
+            src.seek(s)
+            left = e - s
+            while left > 0:
+                block = src.read(min(left, 1 << 18), dtype="float32", always_2d=True)
+                if not len(block):
+                    break
+                dst.write(block)
+                left -= len(block)
+    if readable != inp:
+        readable.unlink()
+    logger.info("[silence] %s: %s regions, skipping %.1f%% of %.1fs", inp.name, len(regions),
+                100 * skipped, frames / sr)
+    return {"path": str(out), "samplerate": sr, "frames": frames, "regions": regions,
+            "active_s": round(active / sr, 3), "skipped_s": round((frames - active) / sr, 3),
+            "skipped_frac": round(skipped, 4)}
+
+
+def expand(stem_dir: pathlib.Path, manifest: dict) -> List[str]:
+    """Put the separated active regions back on the original timeline, in place.
+
+    Silent spans become digital silence. Positions are mapped through the
+    stem/input sample-rate ratio, and each region's length is the gap
+    between consecutive mapped offsets, so no drift builds up.
+    """
+    import soundfile as sf
+
+    regions = manifest["regions"]
+    stems = []
+    for stem in sorted(p for p in stem_dir.iterdir() if p.suffix == ".wav"):
+        info = sf.info(str(stem))
+        ratio = info.samplerate / manifest["samplerate"]
+        total = round(manifest["frames"] * ratio)
+        tmp = stem.with_name(f".{stem.name}.part")
+        with sf.SoundFile(str(stem)) as src, sf.SoundFile(str(tmp), "w", info.samplerate, info.channels,
+                                                          subtype=info.subtype, format="WAV") as dst:
+            pos = 0      # write position on the original timeline
+            cursor = 0   # input frames of compact audio consumed so far
+            for s, e in regions:
+                start = round(s * ratio)
+                length = round((cursor + e - s) * ratio) - round(cursor * ratio)
+                cursor += e - s
+                if start > pos:
+                    _write_zeros(dst, start - pos, info.channels)
+                    pos = start
+                left = length
+                while left > 0:
+                    block = src.read(min(left, 1 << 18), dtype="float32", always_2d=True)
+                    if not len(block):
+                        # Stem a few frames short of the mapped length: pad
+                        _write_zeros(dst, left, info.channels)
+                        break
+                    dst.write(block)
+                    left -= len(block)
+                pos += length
+            if total > pos:
+                _write_zeros(dst, total - pos, info.channels)
+        os.replace(tmp, stem)
+        stems.append(stem.name)
+    return stems
+
+
+def _write_zeros(dst, n: int, channels: int) -> None:
+    import numpy as np
+
+    block = np.zeros((min(n, 1 << 18), channels), np.float32)
+    while n > 0:
+        dst.write(block[:min(n, len(block))])
+        n -= len(block)
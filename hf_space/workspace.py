@@ -0,0 +1,214 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import logging
+import pathlib
+from typing import Dict, Optional
+
+logger = logging.getLogger("dsu")
+
+DSU_ROOT = pathlib.Path(os.environ.get("DSU_ROOT", os.path.join(tempfile.gettempdir(), "dsu")))
+WORK_DIR = pathlib.Path(os.environ.get("DSU_WORK_DIR", str(DSU_ROOT / "work")))
+# Upper bound for all request scratch dirs together (uploads, stems, encodes)
+WORK_MAX_MB = float(os.environ.get("DSU_WORK_MAX_MB", "4096"))
+# Also evict when the filesystem itself runs this low
+WORK_MIN_FREE_MB = float(os.environ.get("DSU_WORK_MIN_FREE_MB", "512"))
+
+
+class WorkspaceFull(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__(f"scratch disk full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+def dir_bytes(path: pathlib.Path) -> int:
+    total = 0
+    stack = [str(path)]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as it:
+                for e in it:
+                    try:
+                        if e.is_dir(follow_symlinks=False):
+                            stack.append(e.path)
+                        elif e.is_file(follow_symlinks=False):
+                            total += e.stat(follow_symlinks=False).st_size
+                    except OSError:
+                        pass
+        except OSError:
+            pass
+    return total
+
+
+class _Entry:
+    __slots__ = ("path", "created", "finished", "holds", "bytes")
+
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+        self.created = time.time()
+        self.finished: Optional[float] = None
+        self.holds = 0
+        self.bytes = 0
+
+
+class WorkspaceManager:
+    """Per-request scratch dirs under one root with a disk budget.
+
+    A workspace is active while its request runs, finished once its result
+    only waits to be downloaded, and released (deleted) after the response
+    has streamed. When a new workspace would not fit, finished ones are
+    evicted oldest first; workspaces being streamed are held and skipped.
+
+    Finished workspaces are measured once and kept in a running total;
+    active ones are estimated from the average finished size. The root is
+    only rescanned (outside the lock) when that estimate or the free disk
+    space says eviction may be needed.
+    """
+
+    def __init__(self, root: pathlib.Path = WORK_DIR, max_mb: float = WORK_MAX_MB,
+                 min_free_mb: float = WORK_MIN_FREE_MB):
+        self.root = root
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.min_free_bytes = int(min_free_mb * 1024 * 1024)
+        self.evicted = 0
+        self.reclaimed = 0
+        self._entries: Dict[str, _Entry] = {}
+        self._lock = threading.Lock()
+        self._bytes = 0  # finished workspaces
+        self._avg_bytes = 0.0
+
+    def create(self) -> pathlib.Path:
+        """New scratch dir; evicts finished workspaces or raises WorkspaceFull."""
+        self.root.mkdir(parents=True, exist_ok=True)
+        free = self._free_bytes()
+        with self._lock:
+            active = sum(1 for e in self._entries.values() if e.finished is None)
+            estimate = self._bytes + active * self._avg_bytes
+        total = None
+        if estimate > self.max_bytes or (free is not None and free < self.min_free_bytes):
+            total = dir_bytes(self.root)
+        doomed = []
+        try:
+            with self._lock:
+                if total is not None:
+                    ok, doomed = self._make_room(total, free)
+                    if not ok:
+                        active = sum(1 for e in self._entries.values() if e.finished is None)
+                        raise WorkspaceFull(max(5, 30 * active))
+                path = pathlib.Path(tempfile.mkdtemp(prefix="ws_", dir=self.root))
+                self._entries[path.name] = _Entry(path)
+        finally:
+            for e in doomed:
+                shutil.rmtree(e.path, ignore_errors=True)
+                logger.info("[HF][work] evicted %s (finished %.0fs ago)", e.path.name, time.time() - e.finished)
+        return path
+
+    def finish(self, path: pathlib.Path) -> None:
+        """The request is done with it; from now on it may be evicted."""
+        size = dir_bytes(path)
+        with self._lock:
+            e = self._entries.get(path.name)
+            if e is not None and e.finished is None:
+                e.finished = time.time()
+                e.bytes = size
+                self._bytes += size
+                self._avg_bytes = size if not self._avg_bytes else 0.8 * self._avg_bytes + 0.2 * size
+
+    def hold(self, path: pathlib.Path) -> bool:
+        """Pin a workspace while its result streams; False if it is gone."""
+        with self._lock:
+            e = self._entries.get(path.name)
+            if e is None or not e.path.exists():
+                return False
+            e.holds += 1
+            return True
+
+    def unhold(self, path: pathlib.Path) -> None:
+        with self._lock:
+            e = self._entries.get(path.name)
+            if e is not None:
+                e.holds = max(0, e.holds - 1)
+
+    def release(self, path: pathlib.Path) -> None:
+        with self._lock:
+            e = self._entries.pop(path.name, None)
+            if e is not None:
+                self._bytes -= e.bytes
+        shutil.rmtree(path, ignore_errors=True)
+
+    def _free_bytes(self) -> Optional[int]:
+        try:
+            return shutil.disk_usage(self.root).free
+        except OSError:
+            return None
+
+    def _make_room(self, total: int, free: Optional[int]):
+        """Pick finished workspaces to evict (deleted by the caller, outside the lock).
+
+        Returns (fits, evicted entries); total is a fresh scan of the root.
+        """
+        victims = sorted((e for e in self._entries.values() if e.finished is not None and e.holds == 0),
+                         key=lambda e: e.finished)
+        deficit = self.min_free_bytes - free if free is not None else 0
+        doomed = []
+        while total > self.max_bytes or deficit > 0:
+            if not victims:
+                return False, doomed
+            e = victims.pop(0)
+            total -= e.bytes
+            deficit -= e.bytes
+            self._entries.pop(e.path.name, None)
+            self._bytes -= e.bytes
+            self.evicted += 1
+            doomed.append(e)
+        return True, doomed
+
+    def reclaim_orphans(self) -> int:
+        """Delete scratch dirs left by a previous process (call at startup)."""
+        removed = 0
+        with self._lock:
+            live = set(self._entries)
+        if self.root.exists():
+            for p in self.root.iterdir():
+                if p.name not in live:
+                    if p.is_dir():
+                        shutil.rmtree(p, ignore_errors=True)
+                    else:
+                        p.unlink(missing_ok=True)
+                    removed += 1
+        # Older versions used tempfile.mkdtemp(prefix="dsu_") and never cleaned up
+        for p in pathlib.Path(tempfile.gettempdir()).glob("dsu_*"):
+            if p.is_dir():
+                shutil.rmtree(p, ignore_errors=True)
+                removed += 1
+        self.reclaimed += removed
+        with self._lock:
+            # Only tracked workspaces remain under the root
+            self._bytes = sum(e.bytes for e in self._entries.values())
+        if removed:
+            logger.info("[HF][work] reclaimed %s orphaned workspaces", removed)
+        return removed
+
+    def usage(self) -> dict:
+        with self._lock:
+            entries = list(self._entries.values())
+        info = {
+            "root": str(self.root),
+            "bytes": dir_bytes(self.root),
+            "max_bytes": self.max_bytes,
+            "active": sum(1 for e in entries if e.finished is None),
+            "finished": sum(1 for e in entries if e.finished is not None),
+            "evicted": self.evicted,
+            "reclaimed": self.reclaimed,
+        }
+        try:
+            du = shutil.disk_usage(self.root if self.root.exists() else self.root.parent)
+            info.update(disk_total_bytes=du.total, disk_free_bytes=du.free)
+        except OSError:
+            pass
+        return info
+
+
+WORKSPACES = WorkspaceManager()
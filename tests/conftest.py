@@ -0,0 +1,99 @@
+import email.utils
+import hashlib
+import os
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# colab_watcher and hf_space read their folders from the environment at import time
+os.environ["DSU_ROOT"] = tempfile.mkdtemp(prefix="dsu-tests-")
+os.environ.setdefault("DSU_SEPARATOR", "stub")
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO, "tools"))
+sys.path.insert(0, os.path.join(REPO, "hf_space"))
+sys.path.insert(0, REPO)
+
+
+class FileServer:
+    """Serves in-memory files with ETag/Last-Modified validators and byte ranges.
+
+    Every request is recorded as (path, Range header or None, status).
+    """
+
+    def __init__(self):
+        self.files = {}
+        self.requests = []
+        self.ranges = True
+        self.mtime = 1_700_000_000
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def url(self, path: str) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}/{path}"
+
+    def put(self, path: str, data: bytes) -> None:
+        self.files[path] = data
+        self.mtime += 1
+
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler(self):
+        srv = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                path = self.path.split("?", 1)[0].lstrip("/")
+                rng = self.headers.get("Range")
+                data = srv.files.get(path)
+                if data is None:
+                    return self._reply(path, rng, 404, b"")
+                etag = '"%s"' % hashlib.sha1(data).hexdigest()[:16]
+                headers = {"ETag": etag, "Last-Modified": email.utils.formatdate(srv.mtime, usegmt=True)}
+                if self.headers.get("If-None-Match") == etag:
+                    return self._reply(path, rng, 304, b"", headers)
+                if rng and srv.ranges and rng.startswith("bytes="):
+                    first, _, last = rng[len("bytes="):].partition("-")
+                    start = int(first)
+                    end = min(int(last), len(data) - 1) if last else len(data) - 1
+                    if start >= len(data):
+                        headers["Content-Range"] = f"bytes */{len(data)}"
+                        return self._reply(path, rng, 416, b"", headers)
+                    headers["Content-Range"] = f"bytes {start}-{end}/{len(data)}"
+                    return self._reply(path, rng, 206, data[start:end + 1], headers)
+                return self._reply(path, rng, 200, data, headers)
+
+            def _reply(self, path, rng, status, body, headers=None):
+                srv.requests.append((path, rng, status))
+                self.send_response(status)
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, fmt, *args):
+                pass
+
+        return Handler
+
+
+@pytest.fixture
+def file_server():
+    srv = FileServer()
+    yield srv
+    srv.close()
+
+
+@pytest.fixture(scope="session")
+def watcher():
+    import colab_watcher
+
+    return colab_watcher
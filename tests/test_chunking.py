@@ -0,0 +1,83 @@
+import shutil
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+import chunking
+
+SR = 8000
+
+
+def signal(seconds, channels=2, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * SR)) / SR
+    tone = 0.5 * np.sin(2 * np.pi * 220 * t)[:, None]
+    return (tone + 0.1 * rng.standard_normal((len(t), channels))).astype(np.float32)
+
+
+@pytest.mark.parametrize("frames", [SR * 31, SR * 61 + 17, SR * 300 + 1])
+def test_plan_covers_track_with_overlap(frames):
+    spans = chunking.plan_chunks(frames, SR, chunk_s=20, overlap_s=2)
+    assert spans[0][0] == 0 and spans[-1][1] == frames
+    for (s0, e0), (s1, e1) in zip(spans, spans[1:]):
+        assert e0 - s1 == 2 * SR
+        assert s1 > s0 and e1 > e0
+    # Every chunk but the last has the same length, none longer than chunk_s
+    assert len({e - s for s, e in spans[:-1]}) == 1
+    assert all(e - s <= 20 * SR for s, e in spans)
+
+
+def test_short_track_is_one_span():
+    assert chunking.plan_chunks(SR * 29, SR, chunk_s=20, overlap_s=2) == [(0, SR * 29)]
+
+
+def test_chunk_must_exceed_twice_overlap():
+    with pytest.raises(ValueError):
+        chunking.plan_chunks(SR * 100, SR, chunk_s=4, overlap_s=2)
+
+
+def fake_separate(chunk_dir, manifest, tmp_path, gain=1.0):
+    """One folder per chunk with its audio as both 'stems' (identity separation)."""
+    dirs = []
+    for name in manifest["chunks"]:
+        d = tmp_path / "sep" / name[:-4]
+        d.mkdir(parents=True)
+        data, sr = sf.read(str(chunk_dir / name), dtype="float32", always_2d=True)
+        sf.write(str(d / "vocals.wav"), data * gain, sr, subtype="FLOAT")
+        shutil.copy(d / "vocals.wav", d / "other.wav")
+        dirs.append(d)
+    return dirs
+
+
+def test_split_and_stitch_reconstructs(tmp_path):
+    x = signal(95)
+    sf.write(str(tmp_path / "in.wav"), x, SR, subtype="FLOAT")
+    manifest = chunking.split_audio(tmp_path / "in.wav", tmp_path / "chunks", chunk_s=20, overlap_s=2)
+    assert len(manifest["chunks"]) == len(manifest["spans"]) > 1
+    dirs = fake_separate(tmp_path / "chunks", manifest, tmp_path)
+    stems = chunking.stitch_stems(dirs, manifest, tmp_path / "out", "rescale", subtype="FLOAT")
+    assert stems == ["other.wav", "vocals.wav"]
+    for stem in stems:
+        y, sr = sf.read(str(tmp_path / "out" / stem), dtype="float32", always_2d=True)
+        assert sr == SR and y.shape == x.shape
+        np.testing.assert_allclose(y, x, atol=1e-5)
+    assert not list((tmp_path / "out").glob(".*"))
+
+
+@pytest.mark.parametrize("clip_mode, peak", [("rescale", 1.0), ("clamp", 0.99), ("none", None)])
+def test_stitch_clip_modes(tmp_path, clip_mode, peak):
+    x = signal(50)
+    sf.write(str(tmp_path / "in.wav"), x, SR, subtype="FLOAT")
+    manifest = chunking.split_audio(tmp_path / "in.wav", tmp_path / "chunks", chunk_s=20, overlap_s=2)
+    dirs = fake_separate(tmp_path / "chunks", manifest, tmp_path, gain=3.0)
+    chunking.stitch_stems(dirs, manifest, tmp_path / "out", clip_mode, subtype="FLOAT")
+    y, _ = sf.read(str(tmp_path / "out" / "vocals.wav"), dtype="float32", always_2d=True)
+    if peak is None:
+        np.testing.assert_allclose(y, 3.0 * x, atol=1e-5)
+    else:
+        assert np.abs(y).max() <= peak
+    if clip_mode == "rescale":
+        # One gain for the whole track, so no level change at the seams
+        i = np.argmax(np.abs(x[:, 0]))
+        np.testing.assert_allclose(y, x * (y[i, 0] / x[i, 0]), atol=1e-5)
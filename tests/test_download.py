@@ -0,0 +1,86 @@
+import hashlib
+import json
+import os
+
+import pytest
+
+
+@pytest.fixture
+def small_chunks(watcher, monkeypatch):
+    # 1 MB chunks, no retry delays
+    monkeypatch.setattr(watcher, "DOWNLOAD_CHUNK_MB", 1)
+    monkeypatch.setattr(watcher, "DOWNLOAD_RETRIES", 0)
+    return watcher
+
+
+def payload(size):
+    return os.urandom(size)
+
+
+def test_ranged_download(small_chunks, file_server, tmp_path):
+    data = payload(3 * 1024 * 1024 + 1234)
+    file_server.put("song.wav", data)
+    dest = tmp_path / "song.wav"
+    stats = small_chunks.download_file(file_server.url("song.wav"), dest, expected_size=len(data))
+    assert dest.read_bytes() == data
+    assert stats["size"] == len(data) and stats["resumed_bytes"] == 0
+    assert not (tmp_path / "song.wav.part").exists()
+    assert not (tmp_path / "song.wav.part.json").exists()
+    # Size probe, then one ranged request per 1 MB chunk
+    ranges = [r for _, r, s in file_server.requests if s == 206]
+    assert ranges[0] == "bytes=0-0" and len(ranges) == 1 + 4
+
+
+def test_resume_from_part(small_chunks, file_server, tmp_path):
+    mb = 1024 * 1024
+    data = payload(3 * mb + 1234)
+    file_server.put("song.wav", data)
+    url = file_server.url("song.wav")
+    dest = tmp_path / "song.wav"
+    # An earlier run finished chunks 0 and 2 before it was interrupted
+    part = bytearray(len(data))
+    part[0:mb] = data[0:mb]
+    part[2 * mb:3 * mb] = data[2 * mb:3 * mb]
+    (tmp_path / "song.wav.part").write_bytes(bytes(part))
+    etag = '"%s"' % hashlib.sha1(data).hexdigest()[:16]
+    (tmp_path / "song.wav.part.json").write_text(json.dumps({"url": url, "size": len(data), "etag": etag,
+                                                             "done": [0, 2]}))
+
+    stats = small_chunks.download_file(url, dest)
+
+    assert dest.read_bytes() == data
+    assert stats["resumed_bytes"] == 2 * mb
+    assert stats["bytes"] == len(data) - 2 * mb
+    fetched = sorted(r for _, r, s in file_server.requests if s == 206 and r != "bytes=0-0")
+    assert fetched == [f"bytes={mb}-{2 * mb - 1}", f"bytes={3 * mb}-{len(data) - 1}"]
+
+
+def test_changed_file_restarts(small_chunks, file_server, tmp_path):
+    mb = 1024 * 1024
+    data = payload(2 * mb)
+    file_server.put("song.wav", data)
+    url = file_server.url("song.wav")
+    # Leftover .part from a different version of the file (ETag differs)
+    (tmp_path / "song.wav.part").write_bytes(bytes(len(data)))
+    (tmp_path / "song.wav.part.json").write_text(json.dumps({"url": url, "size": len(data), "etag": '"old"',
+                                                             "done": [0]}))
+    stats = small_chunks.download_file(url, tmp_path / "song.wav")
+    assert (tmp_path / "song.wav").read_bytes() == data
+    assert stats["resumed_bytes"] == 0
+
+
+def test_server_without_ranges(small_chunks, file_server, tmp_path):
+    data = payload(100_000)
+    file_server.put("song.wav", data)
+    file_server.ranges = False
+    stats = small_chunks.download_file(file_server.url("song.wav"), tmp_path / "song.wav")
+    assert (tmp_path / "song.wav").read_bytes() == data
+    assert stats["parts"] == 1
+
+
+def test_sha256_mismatch(small_chunks, file_server, tmp_path):
+    file_server.put("song.wav", payload(1000))
+    with pytest.raises(RuntimeError, match="sha256"):
+        small_chunks.download_file(file_server.url("song.wav"), tmp_path / "song.wav", sha256="0" * 64)
+    assert not (tmp_path / "song.wav").exists()
+    assert not (tmp_path / "song.wav.part").exists()
@@ -0,0 +1,66 @@
+import json
+import time
+
+import pytest
+
+
+@pytest.fixture
+def leases(watcher, tmp_path):
+    def make(worker, **kw):
+        return watcher.DirLeases(tmp_path / "leases", worker=worker, **kw)
+
+    return make
+
+
+def test_claim_and_contention(leases):
+    a, b = leases("a"), leases("b")
+    assert a.claim("job") is True
+    assert b.claim("job") is False
+    assert a.held == {"job"} and not b.held
+    assert (a.stats["claimed"], b.stats["contended"]) == (1, 1)
+    # Claiming again while holding it is a renewal, not a conflict
+    assert a.claim("job") is True
+
+
+def test_renew_only_by_holder(leases):
+    a, b = leases("a"), leases("b")
+    a.claim("job")
+    assert a._renew("job") is True
+    assert b._renew("job") is False
+
+
+def test_expired_lease_is_reclaimed(leases, tmp_path):
+    a, b = leases("a", ttl_s=0.2), leases("b")
+    assert a.claim("job") is True
+    assert b.claim("job") is False
+    time.sleep(0.3)
+    assert b.claim("job") is True
+    assert b.stats["reclaimed"] == 1
+    assert json.loads((tmp_path / "leases" / "job.lease").read_text())["worker"] == "b"
+    # The old holder can no longer renew or release it
+    assert a._renew("job") is False
+    a.release("job")
+    assert leases("c").claim("job") is False
+
+
+def test_error_release_frees_the_job(leases):
+    a, b = leases("a"), leases("b")
+    a.claim("job")
+    a.release("job")
+    assert b.claim("job") is True
+
+
+def test_done_release_leaves_tombstone(watcher, leases):
+    a, b = leases("a"), leases("b")
+    a.claim("job")
+    a.release("job", done=True)
+    assert b.claim("job") == watcher.ALREADY_DONE
+    assert b.stats["already_done"] == 1 and not b.held
+
+
+def test_expired_tombstone_can_be_claimed(leases):
+    a = leases("a", done_ttl_s=0.1)
+    a.claim("job")
+    a.release("job", done=True)
+    time.sleep(0.2)
+    assert leases("b").claim("job") is True
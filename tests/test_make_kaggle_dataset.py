@@ -0,0 +1,36 @@
+import make_kaggle_dataset as mkd
+
+
+def wheel_sets(tmp_path, contents):
+    """contents: {set name: {file name: bytes}} -> {set name: folder}"""
+    sets = {}
+    for name, files in contents.items():
+        folder = tmp_path / "src" / name
+        folder.mkdir(parents=True)
+        for fname, data in files.items():
+            (folder / fname).write_bytes(data)
+        sets[name] = str(folder)
+    return sets
+
+
+def plan(tmp_path, contents):
+    hashes = mkd.HashCache(tmp_path / "hashes.json")
+    return mkd.plan_layout(wheel_sets(tmp_path, contents), {}, hashes, 2)
+
+
+def test_identical_wheel_is_stored_once(tmp_path):
+    layout, members = plan(tmp_path, {"a": {"x.whl": b"1", "a.whl": b"a"}, "b": {"x.whl": b"1"}})
+    assert sorted(members["a"]) == ["a/a.whl", "wheels_common/x.whl"]
+    assert members["b"] == ["wheels_common/x.whl"]
+    assert sorted(layout) == ["a/a.whl", "wheels_common/x.whl"]
+
+
+def test_same_name_different_content_is_not_shared(tmp_path):
+    layout, members = plan(tmp_path, {"a": {"x.whl": b"1"}, "b": {"x.whl": b"1"},
+                                      "c": {"x.whl": b"2"}, "d": {"x.whl": b"2"}})
+    assert "wheels_common/x.whl" not in layout
+    for name, data in (("a", b"1"), ("b", b"1"), ("c", b"2"), ("d", b"2")):
+        assert members[name] == [f"{name}/x.whl"]
+        src, digest, _size = layout[f"{name}/x.whl"]
+        assert src.read_bytes() == data
+        assert digest == mkd.file_sha256(src)
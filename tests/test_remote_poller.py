@@ -0,0 +1,75 @@
+import json
+
+import pytest
+
+
+def lines(*ids):
+    return "".join(json.dumps({"id": i, "model": "htdemucs"}) + "\n" for i in ids).encode()
+
+
+@pytest.fixture
+def poller(watcher, file_server, tmp_path, monkeypatch):
+    jobs = tmp_path / "jobs"
+    jobs.mkdir()
+    monkeypatch.setattr(watcher, "JOBS", jobs)
+    file_server.put("remote_jobs.jsonl", lines("a", "b"))
+    return watcher.RemotePoller(file_server.url("remote_jobs.jsonl"), tmp_path / "cursor.json")
+
+
+def job_files(p):
+    return sorted(f.name for f in p.state_path.parent.joinpath("jobs").glob("*.json"))
+
+
+def test_first_poll_reads_whole_file(poller, file_server):
+    assert poller.poll() == 2
+    assert job_files(poller) == ["a.json", "b.json"]
+    assert file_server.requests[-1][1:] == (None, 200)
+    assert poller.offset == len(lines("a", "b"))
+
+
+def test_unchanged_file_is_304(poller, file_server):
+    poller.poll()
+    assert poller.poll() == 0
+    assert file_server.requests[-1][2] == 304
+    assert poller.stats["not_modified"] == 1
+
+
+def test_appended_lines_are_206(poller, file_server):
+    poller.poll()
+    start = poller.offset
+    # A partial trailing line is left for the next poll
+    file_server.put("remote_jobs.jsonl", lines("a", "b", "c") + b'{"id": "d"')
+    assert poller.poll() == 1
+    assert file_server.requests[-1][1:] == (f"bytes={start}-", 206)
+    assert job_files(poller) == ["a.json", "b.json", "c.json"]
+    assert poller.offset == len(lines("a", "b", "c"))
+    file_server.put("remote_jobs.jsonl", lines("a", "b", "c", "d"))
+    assert poller.poll() == 1
+    assert "d.json" in job_files(poller)
+
+
+def test_nothing_past_offset_is_416(poller, file_server):
+    poller.poll()
+    # New validators but no new bytes: the ranged request is unsatisfiable
+    file_server.mtime += 1
+    poller.etag = None
+    assert poller.poll() == 0
+    assert file_server.requests[-1][2] == 416
+    assert poller.offset == len(lines("a", "b"))
+
+
+def test_rewritten_shorter_file_starts_over(poller, file_server):
+    poller.poll()
+    file_server.put("remote_jobs.jsonl", lines("z"))
+    assert poller.poll() == 1
+    assert [r[1:] for r in file_server.requests[-2:]] == [(f"bytes={len(lines('a', 'b'))}-", 416), (None, 200)]
+    assert "z.json" in job_files(poller)
+    assert poller.offset == len(lines("z"))
+
+
+def test_cursor_survives_restart(poller, watcher, file_server):
+    poller.poll()
+    again = watcher.RemotePoller(poller.url, poller.state_path)
+    assert (again.offset, again.etag) == (poller.offset, poller.etag)
+    assert again.poll() == 0
+    assert file_server.requests[-1][2] == 304
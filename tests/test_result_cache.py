@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+import soundfile as sf
+
+import result_cache
+
+BASE = {"engine": "demucs", "model": "htdemucs", "two_stems": "", "shifts": 0, "segments": 0,
+        "clip_mode": "rescale"}
+
+
+@pytest.fixture
+def audio(tmp_path):
+    path = tmp_path / "a.wav"
+    sf.write(str(path), np.zeros((800, 2), np.float32), 8000)
+    return path
+
+
+def test_key_depends_on_content_not_path(audio, tmp_path):
+    copy = tmp_path / "renamed.wav"
+    copy.write_bytes(audio.read_bytes())
+    assert result_cache.cache_key(audio, BASE) == result_cache.cache_key(copy, BASE)
+    copy.write_bytes(audio.read_bytes() + b"\0")
+    assert result_cache.cache_key(audio, BASE) != result_cache.cache_key(copy, BASE)
+
+
+def test_defaults_and_types_are_normalized(audio):
+    assert result_cache.cache_key(audio, BASE) == result_cache.cache_key(audio, {})
+    assert result_cache.cache_key(audio, {"shifts": "0", "segments": None, "engine": "DEMUCS"}) == \
+        result_cache.cache_key(audio, BASE)
+
+
+@pytest.mark.parametrize("field, value", [("jobs", 8), ("output_format", "mp3"), ("chunk_s", 0),
+                                          ("preview", True)])
+def test_fields_that_do_not_change_audio(audio, field, value):
+    assert result_cache.cache_key(audio, {**BASE, field: value}) == result_cache.cache_key(audio, BASE)
+
+
+@pytest.mark.parametrize("field, value", [("model", "htdemucs_ft"), ("two_stems", "vocals"), ("shifts", 2),
+                                          ("segments", 7.8), ("clip_mode", "clamp"), ("chunk_s", 120),
+                                          ("output_format", "flac"), ("skip_silence", True)])
+def test_fields_that_change_audio(audio, field, value):
+    assert result_cache.cache_key(audio, {**BASE, field: value}) != result_cache.cache_key(audio, BASE)
+
+
+def test_spleeter_ignores_demucs_fields(audio):
+    a = result_cache.cache_key(audio, {"engine": "spleeter", "model": "x", "shifts": 3})
+    assert a == result_cache.cache_key(audio, {"engine": "spleeter", "spleeter_stems": 5})
+    assert a != result_cache.cache_key(audio, {"engine": "spleeter", "spleeter_stems": 2})
+
+
+def test_silence_threshold_is_keyed_as_given(audio):
+    on = {**BASE, "skip_silence": True}
+    assert result_cache.cache_key(audio, {**on, "silence_db": 0}) != result_cache.cache_key(audio, {**on, "silence_db": -50})
+    assert result_cache.cache_key(audio, on) == \
+        result_cache.cache_key(audio, {**on, "silence_db": result_cache.SILENCE_DB})
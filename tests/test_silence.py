@@ -0,0 +1,83 @@
+import shutil
+
+import numpy as np
+import soundfile as sf
+
+import silence
+
+SR = 8000
+
+
+def gappy(tmp_path):
+    """Tone, 3s of silence, tone, 2s of silence, tone: returns (path, samples)."""
+    t = np.arange(2 * SR) / SR
+    tone = (0.5 * np.sin(2 * np.pi * 330 * t)).astype(np.float32)[:, None].repeat(2, axis=1)
+    gap = np.zeros((3 * SR, 2), np.float32)
+    x = np.concatenate([tone, gap, tone, gap[:2 * SR], tone])
+    path = tmp_path / "song.wav"
+    sf.write(str(path), x, SR, subtype="FLOAT")
+    return path, x
+
+
+def test_compact_drops_silence(tmp_path):
+    path, x = gappy(tmp_path)
+    m = silence.compact(path, tmp_path / "sil")
+    assert m is not None and m["frames"] == len(x) and m["samplerate"] == SR
+    assert len(m["regions"]) == 3
+    active = sum(e - s for s, e in m["regions"])
+    assert sf.info(m["path"]).frames == active < len(x)
+    assert m["skipped_frac"] > 0.3
+
+
+def test_nothing_to_skip(tmp_path):
+    t = np.arange(5 * SR) / SR
+    sf.write(str(tmp_path / "loud.wav"), 0.5 * np.sin(2 * np.pi * 330 * t), SR)
+    assert silence.compact(tmp_path / "loud.wav", tmp_path / "sil") is None
+
+
+def test_expand_restores_timeline(tmp_path):
+    path, x = gappy(tmp_path)
+    m = silence.compact(path, tmp_path / "sil")
+    stems = tmp_path / "stems"
+    stems.mkdir()
+    # Identity "separation" of the compacted audio
+    shutil.copy(m["path"], stems / "vocals.wav")
+    assert silence.expand(stems, m) == ["vocals.wav"]
+    y, sr = sf.read(str(stems / "vocals.wav"), dtype="float32", always_2d=True)
+    assert sr == SR and y.shape == x.shape
+    # Active regions line up sample for sample; the rest is digital silence
+    np.testing.assert_array_equal(y, x)
+
+
+def test_expand_at_another_samplerate(tmp_path):
+    path, x = gappy(tmp_path)
+    m = silence.compact(path, tmp_path / "sil")
+    stems = tmp_path / "stems"
+    stems.mkdir()
+    # A model that outputs at twice the input rate
+    data, _ = sf.read(m["path"], dtype="float32", always_2d=True)
+    sf.write(str(stems / "bass.wav"), data.repeat(2, axis=0), SR * 2, subtype="FLOAT")
+    silence.expand(stems, m)
+    y, _ = sf.read(str(stems / "bass.wav"), dtype="float32", always_2d=True)
+    assert len(y) == 2 * len(x)
+    np.testing.assert_array_equal(y[::2], x)
+
+
+def test_null_threshold_uses_default(watcher):
+    assert watcher.job_params({"silence_db": None})["silence_db"] == watcher.SILENCE_DB
+    assert watcher.job_params({"silence_db": 0})["silence_db"] == 0
+
+
+def test_flatten_leaves_only_expanded_stems(watcher, tmp_path):
+    path, x = gappy(tmp_path)
+    m = silence.compact(path, tmp_path / "sil")
+    out = tmp_path / "out"
+    nested = out / "htdemucs" / "song"
+    nested.mkdir(parents=True)
+    shutil.copy(m["path"], nested / "vocals.wav")
+    watcher.flatten_stems(out, "htdemucs", "song")
+    watcher.expand_silence(out, m)
+    # No compacted copy left behind in Demucs' nested layout
+    assert sorted(p.relative_to(out).as_posix() for p in out.rglob("*")) == ["vocals.wav"]
+    y, _ = sf.read(str(out / "vocals.wav"), dtype="float32", always_2d=True)
+    np.testing.assert_array_equal(y, x)
@@ -0,0 +1,404 @@
+#!/usr/bin/env python3
+"""Reproducible benchmark of the watcher and Space pipelines.
+
+Generates synthetic audio (fixed seed) of several lengths and channel
+layouts, pushes it through colab_watcher.py (job JSON + source_url served
+from a local HTTP server, so download, polling, status writes and
+flattening are all included) or hf_space/app.py (POST /separate, streamed
+stems.zip), and reports per case: p50/p95 latency, throughput (audio
+seconds per wall second), peak RSS of the whole process tree and bytes
+written.
+
+--separator stub sets DSU_SEPARATOR=stub, which replaces Demucs with a
+deterministic split of the input, so only orchestration is timed;
+--separator demucs runs real CPU separation end to end.
+
+    python tools/bench_pipeline.py --target watcher --separator stub --out bench.json
+    python tools/bench_pipeline.py --target watcher --separator stub --compare bench.json
+"""
+import argparse
+import functools
+import json
+import os
+import pathlib
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+REPO = pathlib.Path(__file__).resolve().parent.parent
+SR = 44100
+
+
+def make_audio(path: pathlib.Path, seconds: float, channels: int, seed: int) -> None:
+    """Tones, noise bursts and a silent gap; identical for a given seed."""
+    import numpy as np
+    import soundfile as sf
+
+    rng = np.random.default_rng(seed)
+    n = int(seconds * SR)
+    t = np.arange(n) / SR
+    mono = 0.2 * np.sin(2 * np.pi * 110 * t) + 0.1 * np.sin(2 * np.pi * 440 * t * (1 + 0.01 * np.sin(t)))
+    bursts = (np.sin(2 * np.pi * 2 * t) > 0.9) * rng.standard_normal(n) * 0.1
+    x = np.stack([mono + bursts * (1 + 0.1 * c) for c in range(channels)], axis=1)
+    x[n // 3:n // 3 + SR] = 0  # one second of silence
+    sf.write(str(path), x.astype("float32"), SR, subtype="PCM_16")
+
+
+def percentile(values, q: float):
+    if not values:
+        return None
+    s = sorted(values)
+    return round(s[min(len(s) - 1, max(0, int(round(q / 100 * len(s) + 0.5)) - 1))], 4)
+
+
+def dir_bytes(path: pathlib.Path) -> int:
+    return sum(p.stat().st_size for p in path.rglob("*") if p.is_file()) if path.exists() else 0
+
+
+class TreeSampler:
+    """Samples RSS and write_bytes of a process and all its descendants."""
+
+    def __init__(self, pid: int, interval: float = 0.05):
+        self.pid = pid
+        self.interval = interval
+        self.peak_rss = 0
+        self.writes = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @staticmethod
+    def _children():
+        kids = {}
+        for d in os.listdir("/proc"):
+            if d.isdigit():
+                try:
+                    with open(f"/proc/{d}/stat") as f:
+                        ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+                    kids.setdefault(ppid, []).append(int(d))
+                except (OSError, ValueError, IndexError):
+                    pass
+        return kids
+
+    def _tree(self):
+        kids, out, stack = self._children(), [], [self.pid]
+        while stack:
+            pid = stack.pop()
+            out.append(pid)
+            stack.extend(kids.get(pid, []))
+        return out
+
+    def sample(self) -> None:
+        rss = 0
+        for pid in self._tree():
+            try:
+                with open(f"/proc/{pid}/status") as f:
+                    for line in f:
+                        if line.startswith("VmRSS:"):
+                            rss += int(line.split()[1]) * 1024
+                with open(f"/proc/{pid}/io") as f:
+                    for line in f:
+                        if line.startswith("write_bytes:"):
+                            self.writes[pid] = max(self.writes.get(pid, 0), int(line.split()[1]))
+            except OSError:
+                pass
+        self.peak_rss = max(self.peak_rss, rss)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.sample()
+            self._stop.wait(self.interval)
+
+    def start(self) -> "TreeSampler":
+        if os.path.exists("/proc/self/status"):
+            self._thread.start()
+        return self
+
+    def reset(self) -> None:
+        self.peak_rss = 0
+        self.writes = {}
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def write_bytes(self) -> int:
+        return sum(self.writes.values())
+
+
+def serve_dir(path: pathlib.Path):
+    handler = functools.partial(QuietHandler, directory=str(path))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, fmt, *args):
+        pass
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def run_watcher_case(root: pathlib.Path, base_url: str, clip: pathlib.Path, args):
+    """Submit args.repeat jobs for one clip, args.parallel at a time; returns latencies."""
+    jobs_dir = root / "jobs"
+    out = root / "out"
+    latencies = []
+    for start in range(0, args.repeat, args.parallel):
+        batch = {}
+        for _ in range(min(args.parallel, args.repeat - start)):
+            jid = f"bench-{uuid.uuid4().hex[:8]}"
+            job = {"id": jid, "source_url": f"{base_url}/{clip.name}", "model": args.model,
+                   "two_stems": args.two_stems, "output_format": args.output_format}
+            tmp = jobs_dir / f".{jid}.json.tmp"
+            tmp.write_text(json.dumps(job))
+            batch[jid] = time.perf_counter()
+            os.replace(tmp, jobs_dir / f"{jid}.json")
+        deadline = time.time() + args.timeout
+        while batch and time.time() < deadline:
+            for jid in list(batch):
+                done = out / jid / "done.json"
+                if done.exists():
+                    latencies.append(time.perf_counter() - batch.pop(jid))
+                    try:
+                        if json.loads(done.read_text()).get("status") != "done":
+                            print(f"[Bench] job {jid} failed: {done.read_text()}")
+                    except ValueError:
+                        pass
+            time.sleep(0.02)
+        if batch:
+            raise RuntimeError(f"timed out waiting for {', '.join(batch)}")
+    return latencies
+
+
+def bench_watcher(clips, args, work: pathlib.Path):
+    root = work / "dsu"
+    (root / "jobs" / "audio").mkdir(parents=True)
+    (root / "out").mkdir(parents=True)
+    server = serve_dir(work / "clips")
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    env = dict(os.environ, DSU_ROOT=str(root), DSU_SEPARATOR=args.separator, PYTHONUNBUFFERED="1",
+               DSU_LOCAL_MODELS=str(work / "models"))
+    if not args.cache:
+        env["DSU_RESULT_CACHE"] = "0"
+    log = open(work / "watcher.log", "w")
+    proc = subprocess.Popen([sys.executable, str(REPO / "colab_watcher.py")], env=env, stdout=log,
+                            stderr=subprocess.STDOUT, cwd=str(work))
+    sampler = TreeSampler(proc.pid).start()
+    results = []
+    try:
+        time.sleep(0.5)
+        if proc.poll() is not None:
+            raise RuntimeError(f"watcher exited: {(work / 'watcher.log').read_text()[-2000:]}")
+        for case, clip, seconds, channels in clips:
+            sampler.reset()
+            before = dir_bytes(root)
+            t0 = time.perf_counter()
+            lat = run_watcher_case(root, base_url, clip, args)
+            wall = time.perf_counter() - t0
+            sampler.sample()
+            results.append(summarize("watcher", args, case, seconds, channels, lat, wall, sampler,
+                                     {"disk_bytes": dir_bytes(root) - before}))
+            print_row(results[-1])
+    finally:
+        sampler.stop()
+        proc.terminate()
+        try:
+            proc.wait(10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        server.shutdown()
+        log.close()
+    return results
+
+
+def post_separate(url: str, clip: pathlib.Path, fields: dict):
+    """POST /separate as multipart; returns (latency s, time to first byte s, response bytes)."""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for k, v in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{k}"\r\n\r\n{v}\r\n'.encode())
+    parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{clip.name}"\r\n'
+                 f'Content-Type: audio/wav\r\n\r\n'.encode() + clip.read_bytes() + b"\r\n")
+    parts.append(f"--{boundary}--\r\n".encode())
+    req = urllib.request.Request(url, data=b"".join(parts), method="POST",
+                                 headers={"Content-Type": f"multipart/form-data; boundary={boundary}"})
+    t0 = time.perf_counter()
+    ttfb = None
+    n = 0
+    with urllib.request.urlopen(req, timeout=3600) as resp:
+        while True:
+            block = resp.read(1 << 20)
+            if ttfb is None:
+                ttfb = time.perf_counter() - t0
+            if not block:
+                break
+            n += len(block)
+    return time.perf_counter() - t0, ttfb, n
+
+
+def bench_space(clips, args, work: pathlib.Path):
+    port = free_port()
+    root = work / "dsu"
+    env = dict(os.environ, DSU_ROOT=str(root), DSU_SEPARATOR=args.separator, PYTHONUNBUFFERED="1")
+    if not args.cache:
+        env["DSU_RESULT_CACHE"] = "0"
+    log = open(work / "space.log", "w")
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(port)],
+                            env=env, stdout=log, stderr=subprocess.STDOUT, cwd=str(REPO / "hf_space"))
+    sampler = TreeSampler(proc.pid).start()
+    base = f"http://127.0.0.1:{port}"
+    results = []
+    try:
+        deadline = time.time() + 60
+        while True:
+            try:
+                urllib.request.urlopen(base + "/", timeout=2).read()
+                break
+            except OSError:
+                if proc.poll() is not None or time.time() > deadline:
+                    raise RuntimeError(f"Space did not start: {(work / 'space.log').read_text()[-2000:]}")
+                time.sleep(0.2)
+        fields = {"engine": "demucs", "model": args.model, "two_stems": args.two_stems,
+                  "output_format": args.output_format}
+        for case, clip, seconds, channels in clips:
+            sampler.reset()
+            t0 = time.perf_counter()
+            with ThreadPoolExecutor(args.parallel) as pool:
+                runs = list(pool.map(lambda _: post_separate(base + "/separate", clip, fields), range(args.repeat)))
+            wall = time.perf_counter() - t0
+            sampler.sample()
+            results.append(summarize("space", args, case, seconds, channels, [r[0] for r in runs], wall, sampler, {
+                "ttfb_p50_s": percentile([r[1] for r in runs], 50),
+                "response_bytes": sum(r[2] for r in runs),
+            }))
+            print_row(results[-1])
+    finally:
+        sampler.stop()
+        proc.terminate()
+        try:
+            proc.wait(10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        log.close()
+    return results
+
+
+def summarize(target, args, case, seconds, channels, lat, wall, sampler, extra) -> dict:
+    return {
+        "target": target, "separator": args.separator, "case": case, "seconds": seconds, "channels": channels,
+        "jobs": len(lat), "parallel": args.parallel,
+        "p50_s": percentile(lat, 50), "p95_s": percentile(lat, 95),
+        "mean_s": round(sum(lat) / len(lat), 4) if lat else None,
+        "throughput_x": round(seconds * len(lat) / wall, 3) if wall > 0 else None,
+        "jobs_per_min": round(60 * len(lat) / wall, 2) if wall > 0 else None,
+        "peak_rss_mb": round(sampler.peak_rss / (1024 * 1024), 1),
+        "io_write_bytes": sampler.write_bytes(),
+        **extra,
+    }
+
+
+def print_row(r: dict) -> None:
+    print(f"[Bench] {r['target']}/{r['separator']} {r['case']}: p50={r['p50_s']}s p95={r['p95_s']}s "
+          f"x{r['throughput_x']} rss={r['peak_rss_mb']}MB io_write={r['io_write_bytes']}")
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=str(REPO), capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def compare(base: dict, cur: dict, tolerance: float) -> int:
+    """Print deltas per case; returns the number of latency/throughput regressions."""
+    key = lambda r: (r["target"], r["separator"], r["case"], f"x{r['parallel']}")  # noqa: E731
+    old = {key(r): r for r in base.get("results", [])}
+    regressions = 0
+    print(f"[Bench] compare {base.get('commit') or '?'} -> {cur.get('commit') or '?'} (tolerance {tolerance:.0%})")
+    for r in cur["results"]:
+        o = old.get(key(r))
+        if o is None:
+            print(f"[Bench]   {'/'.join(key(r))}: no baseline")
+            continue
+        cells = []
+        for field, worse_if_higher in (("p50_s", True), ("p95_s", True), ("throughput_x", False),
+                                       ("peak_rss_mb", True), ("io_write_bytes", True)):
+            a, b = o.get(field), r.get(field)
+            if not a or b is None:
+                continue
+            change = (b - a) / a
+            bad = change > tolerance if worse_if_higher else change < -tolerance
+            if bad and field in ("p50_s", "p95_s", "throughput_x"):
+                regressions += 1
+            cells.append(f"{field} {a}->{b} ({change:+.0%}){' !' if bad else ''}")
+        print(f"[Bench]   {'/'.join(key(r))}: " + ", ".join(cells))
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the DSU watcher / Space pipelines")
+    parser.add_argument("--target", choices=("watcher", "space"), default="watcher")
+    parser.add_argument("--separator", choices=("stub", "demucs"), default="stub",
+                        help="stub: orchestration only; demucs: real CPU separation")
+    parser.add_argument("--lengths", default="10,60", help="Comma-separated clip lengths in seconds")
+    parser.add_argument("--channels", default="1,2", help="Comma-separated channel counts")
+    parser.add_argument("--repeat", type=int, default=5, help="Jobs per case")
+    parser.add_argument("--parallel", type=int, default=1, help="Jobs in flight at once")
+    parser.add_argument("--model", default="htdemucs")
+    parser.add_argument("--two-stems", default="vocals")
+    parser.add_argument("--output-format", default="wav")
+    parser.add_argument("--cache", action="store_true", help="Leave the result cache on (repeats become hits)")
+    parser.add_argument("--timeout", type=float, default=1800, help="Seconds to wait for one batch")
+    parser.add_argument("--out", type=pathlib.Path, help="Write results as JSON")
+    parser.add_argument("--compare", type=pathlib.Path, help="Baseline JSON; exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative slowdown for --compare")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch directory")
+    args = parser.parse_args()
+
+    work = pathlib.Path(tempfile.mkdtemp(prefix="dsu-bench-"))
+    try:
+        (work / "clips").mkdir()
+        clips = []
+        for seconds in [float(x) for x in args.lengths.split(",") if x.strip()]:
+            for channels in [int(x) for x in args.channels.split(",") if x.strip()]:
+                case = f"{seconds:g}s-{'mono' if channels == 1 else f'{channels}ch'}"
+                clip = work / "clips" / f"{case}.wav"
+                make_audio(clip, seconds, channels, seed=int(seconds * 10) + channels)
+                clips.append((case, clip, seconds, channels))
+        print(f"[Bench] {len(clips)} cases x {args.repeat} jobs, target={args.target} separator={args.separator}")
+        run = bench_watcher if args.target == "watcher" else bench_space
+        report = {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"), "commit": git_commit(),
+            "python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(),
+            "args": {k: (str(v) if isinstance(v, pathlib.Path) else v) for k, v in vars(args).items()},
+            "results": run(clips, args, work),
+        }
+    finally:
+        if args.keep:
+            print(f"[Bench] scratch kept at {work}")
+        else:
+            shutil.rmtree(work, ignore_errors=True)
+    if args.out:
+        args.out.write_text(json.dumps(report, indent=2))
+        print(f"[Bench] results written to {args.out}")
+    if args.compare:
+        return 1 if compare(json.loads(args.compare.read_text()), report, args.tolerance) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""Minimal job-lease coordinator for several DSU watchers sharing one queue.
+
+Point every watcher at it with DSU_COORDINATOR_URL=http://host:port. Leases
+live in memory (optionally snapshotted to --state), so a restart of the
+coordinator at worst lets a running job be claimed again after its TTL.
+
+A successful release ({"done": true}) leaves a tombstone for done_ttl_s
+(default a week): claiming that job answers {"already_done": true} so no
+other watcher runs it again. An error release frees the job for a retry.
+"""
+import argparse
+import json
+import os
+import pathlib
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DONE_TTL_S = 7 * 24 * 3600
+
+
+class LeaseTable:
+    def __init__(self, state: pathlib.Path = None):
+        self.state = state
+        self.leases = {}
+        self.lock = threading.Lock()
+        if state is not None and state.exists():
+            try:
+                self.leases = json.loads(state.read_text())
+            except ValueError:
+                pass
+
+    def _save(self) -> None:
+        if self.state is None:
+            return
+        tmp = self.state.with_name(self.state.name + ".tmp")
+        tmp.write_text(json.dumps(self.leases))
+        os.replace(tmp, self.state)
+
+    def apply(self, op: str, job: str, worker: str, ttl_s: float, done: bool = False,
+              done_ttl_s: float = DONE_TTL_S):
+        """True/False for granted; "already_done" when claiming a finished job."""
+        now = time.time()
+        with self.lock:
+            cur = self.leases.get(job)
+            live = cur is not None and cur["expires"] > now
+            if op == "claim":
+                if live and cur.get("done"):
+                    return "already_done"
+                if live and cur["worker"] != worker:
+                    return False
+            elif op == "renew":
+                if cur is None or cur["worker"] != worker or cur.get("done"):
+                    return False
+            elif op == "release":
+                if cur is not None and cur["worker"] == worker and not cur.get("done"):
+                    if done:
+                        self.leases[job] = {"worker": worker, "done": True, "expires": now + done_ttl_s}
+                    else:
+                        del self.leases[job]
+                # Tombstones would otherwise pile up forever
+                for j in [j for j, l in self.leases.items() if l["expires"] <= now]:
+                    del self.leases[j]
+                self._save()
+                return True
+            else:
+                raise ValueError(op)
+            self.leases[job] = {"worker": worker, "expires": now + ttl_s}
+            self._save()
+            return True
+
+    def snapshot(self) -> dict:
+        now = time.time()
+        with self.lock:
+            return {j: dict(l, ttl_left=round(l["expires"] - now, 1)) for j, l in self.leases.items()}
+
+
+def make_handler(table: LeaseTable):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, code: int, payload: dict) -> None:
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path.rstrip("/") in ("", "/leases"):
+                self._send(200, {"leases": table.snapshot()})
+            else:
+                self._send(404, {"error": "not found"})
+
+        def do_POST(self):
+            op = self.path.strip("/")
+            try:
+                req = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+                result = table.apply(op, str(req["job"]), str(req["worker"]), float(req.get("ttl_s") or 120),
+                                     bool(req.get("done")), float(req.get("done_ttl_s") or DONE_TTL_S))
+            except (KeyError, ValueError) as e:
+                self._send(400, {"error": str(e)})
+                return
+            done = result == "already_done"
+            print(f"[Coordinator] {op} job={req['job']} worker={req['worker']} granted={result is True}"
+                  f"{' already_done' if done else ''}")
+            self._send(200, {"granted": result is True, "already_done": done})
+
+        def log_message(self, fmt, *args):
+            pass
+
+    return Handler
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Lease coordinator for DSU watchers (DSU_COORDINATOR_URL)")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--state", type=pathlib.Path, help="Optional JSON file to persist leases across restarts")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(LeaseTable(args.state)))
+    print(f"[Coordinator] listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""Send a job to the DSU worker expected to finish it first.
+
+Workers are Space URLs (read through GET /capacity) or watcher roots on a
+synced Drive (the `capacity` block of heartbeat.json). For each one the
+expected completion time is
+
+    wait_s + model load (unless the model is warm) + audio_s * max(1, shifts) / speed
+
+where speed is the worker's measured audio seconds per second for the model,
+or a rough per-device default until it has finished one. Watchers whose
+heartbeat is older than --stale-s are skipped.
+
+    python tools/dsu_router.py song.wav --model htdemucs_ft \\
+        --worker https://me-dsu.hf.space --worker /content/drive/MyDrive/DSU --submit
+"""
+import argparse
+import datetime
+import json
+import os
+import pathlib
+import re
+import shutil
+import time
+import urllib.request
+import uuid
+
+# model -> models in the bag (same table as the watcher's MODEL_SHAPES)
+MODEL_BAG = {
+    "htdemucs": 1, "htdemucs_ft": 4, "htdemucs_6s": 1, "hdemucs_mmi": 1,
+    "mdx": 4, "mdx_extra": 4, "mdx_q": 4, "mdx_extra_q": 4,
+}
+# Audio seconds per second of one htdemucs pass, used until a worker has measured its own
+DEFAULT_SPEED = {"cuda": 25.0, "cpu": 0.5}
+# Loading one model of a bag from local disk
+LOAD_S_PER_MODEL = 4.0
+
+
+def read_capacity(worker: str, stale_s: float, timeout: float = 10) -> dict:
+    """The worker's capacity block; raises if it is unreachable or stale."""
+    if re.match(r"https?://", worker):
+        with urllib.request.urlopen(worker.rstrip("/") + "/capacity", timeout=timeout) as resp:
+            return json.loads(resp.read())
+    beat = json.loads((pathlib.Path(worker) / "heartbeat.json").read_text())
+    age = time.time() - datetime.datetime.fromisoformat(beat["ts"]).timestamp()
+    if age > stale_s:
+        raise RuntimeError(f"heartbeat is {age:.0f}s old")
+    cap = beat.get("capacity")
+    if not cap or "error" in cap:
+        raise RuntimeError((cap or {}).get("error") or "watcher does not report capacity")
+    return cap
+
+
+def estimate(cap: dict, audio_s: float, model: str, shifts: int) -> dict:
+    bag = MODEL_BAG.get(model, 1)
+    speed = cap.get("speed", {}).get(model)
+    measured = speed is not None
+    if not measured:
+        speed = DEFAULT_SPEED.get(cap.get("device"), DEFAULT_SPEED["cpu"]) / bag
+    warm = cap.get("models_loaded")
+    # None: the worker loads the model for every run
+    load_s = 0.0 if warm is not None and model in warm else LOAD_S_PER_MODEL * bag
+    run_s = audio_s * max(1, shifts) / max(speed, 1e-6)
+    wait_s = float(cap.get("wait_s") or 0)
+    return {
+        "wait_s": round(wait_s, 1), "load_s": round(load_s, 1), "run_s": round(run_s, 1),
+        "total_s": round(wait_s + load_s + run_s, 1), "measured": measured,
+    }
+
+
+def rank(workers, audio_s: float, model: str, shifts: int, stale_s: float):
+    """[(worker, estimate or None, error or None)], best first; unusable workers last."""
+    rows = []
+    for w in workers:
+        try:
+            rows.append((w, estimate(read_capacity(w, stale_s), audio_s, model, shifts), None))
+        except Exception as e:
+            rows.append((w, None, f"{type(e).__name__}: {e}"))
+    return sorted(rows, key=lambda r: r[1]["total_s"] if r[1] else float("inf"))
+
+
+def audio_seconds(path: pathlib.Path) -> float:
+    import soundfile as sf
+
+    info = sf.info(str(path))
+    return info.frames / info.samplerate
+
+
+def submit_space(url: str, path: pathlib.Path, args) -> dict:
+    """POST /jobs; returns the Space's job document."""
+    fields = {"engine": "demucs", "model": args.model, "two_stems": args.two_stems, "shifts": args.shifts}
+    boundary = uuid.uuid4().hex
+    parts = [f'--{boundary}\r\nContent-Disposition: form-data; name="{k}"\r\n\r\n{v}\r\n'.encode()
+             for k, v in fields.items()]
+    parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{path.name}"\r\n'
+                 f"Content-Type: application/octet-stream\r\n\r\n".encode() + path.read_bytes() + b"\r\n")
+    parts.append(f"--{boundary}--\r\n".encode())
+    req = urllib.request.Request(url.rstrip("/") + "/jobs", data=b"".join(parts), method="POST",
+                                 headers={"Content-Type": f"multipart/form-data; boundary={boundary}"})
+    with urllib.request.urlopen(req, timeout=3600) as resp:
+        return json.loads(resp.read())
+
+
+def submit_watcher(root: pathlib.Path, path: pathlib.Path, args) -> dict:
+    """Drop the audio into jobs/audio/ with a job JSON next to it; returns the job."""
+    jid = f"{re.sub(r'[^A-Za-z0-9_-]+', '_', path.stem)}-{uuid.uuid4().hex[:6]}"
+    job = {"id": jid, "model": args.model, "two_stems": args.two_stems, "shifts": args.shifts}
+    jobs = root / "jobs"
+    # Audio first, then its job file (the manual Drive flow); both appear whole
+    part = jobs / "audio" / f".{jid}.wav.part"
+    shutil.copyfile(path, part)
+    tmp = jobs / f".{jid}.json.tmp"
+    tmp.write_text(json.dumps(job))
+    os.replace(part, jobs / "audio" / f"{jid}.wav")
+    os.replace(tmp, jobs / f"{jid}.json")
+    return job
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Rank DSU workers by expected completion time for one job")
+    parser.add_argument("audio", nargs="?", type=pathlib.Path, help="Input file (its length is read with soundfile)")
+    parser.add_argument("--worker", action="append", required=True,
+                        help="Space URL or watcher root (DSU_ROOT); repeat for each worker")
+    parser.add_argument("--audio-s", type=float, help="Audio length in seconds, instead of reading the file")
+    parser.add_argument("--model", default="htdemucs")
+    parser.add_argument("--two-stems", default="")
+    parser.add_argument("--shifts", type=int, default=0)
+    parser.add_argument("--stale-s", type=float, default=30, help="Skip watchers with an older heartbeat")
+    parser.add_argument("--submit", action="store_true", help="Send the file to the best worker")
+    parser.add_argument("--json", action="store_true", help="Print the ranking as JSON")
+    args = parser.parse_args()
+
+    audio_s = args.audio_s
+    if audio_s is None:
+        if args.audio is None:
+            parser.error("give an audio file or --audio-s")
+        audio_s = audio_seconds(args.audio)
+    if args.submit and args.audio is None:
+        parser.error("--submit needs an audio file")
+
+    rows = rank(args.worker, audio_s, args.model, args.shifts, args.stale_s)
+    if args.json:
+        print(json.dumps([{"worker": w, "estimate": e, "error": err} for w, e, err in rows], indent=2))
+    else:
+        print(f"[Router] {audio_s:.1f}s of audio, model={args.model} shifts={args.shifts}")
+        for w, e, err in rows:
+            if e is None:
+                print(f"[Router]   {w}: unavailable ({err})")
+            else:
+                print(f"[Router]   {w}: ~{e['total_s']}s (wait {e['wait_s']}s + load {e['load_s']}s + run "
+                      f"{e['run_s']}s{'' if e['measured'] else ', default speed'})")
+    best, est, _ = rows[0]
+    if est is None:
+        print("[Router] no worker available")
+        return 1
+    if args.submit:
+        if re.match(r"https?://", best):
+            doc = submit_space(best, args.audio, args)
+            print(f"[Router] submitted to {best}: job {doc.get('id')} -> {best.rstrip('/')}{doc.get('status_url', '')}")
+        else:
+            job = submit_watcher(pathlib.Path(best), args.audio, args)
+            print(f"[Router] submitted to {best}: job {job['id']} -> out/{job['id']}/")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,26 +1,154 @@
 #!/usr/bin/env python3
+"""Build and publish the DSU Kaggle cache dataset (wheels/models).
+
+The build is incremental. Every file is recorded with its SHA-256 in
+manifest.json, unchanged files are left in place and new ones are hardlinked
+from the source when possible. A wheel that is byte-identical in several sets
+(numpy, demucs, ... next to every CUDA flavor of torch) is stored once in
+wheels_common/. The manifest lists, per set, the files to install, so the
+worker notebook can verify them and pip needs `--find-links` on both folders.
+When the manifest and metadata match the last successful upload, nothing
+is uploaded.
+"""
 import argparse
+import hashlib
 import json
 import os
 import pathlib
 import shutil
 import subprocess
 import sys
+from concurrent.futures import ThreadPoolExecutor
+
+MANIFEST = "manifest.json"
+METADATA = "dataset-metadata.json"
+COMMON = "wheels_common"
+FLAVORS = ("cu126", "cu124", "cu121", "cu118")
+
+
+def file_sha256(path: pathlib.Path, chunk: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class HashCache:
+    """SHA-256 of source files keyed by (path, size, mtime), kept next to --out.
 
+    Outside the dataset folder so it is never uploaded; saves re-reading
+    gigabytes of unchanged wheels on every build.
+    """
 
-def copy_into(src: pathlib.Path, dst: pathlib.Path) -> None:
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+        try:
+            self.entries = json.loads(path.read_text())
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def sha256(self, src: pathlib.Path) -> str:
+        st = src.stat()
+        key = str(src.resolve())
+        cur = self.entries.get(key)
+        if cur and cur["size"] == st.st_size and cur["mtime"] == st.st_mtime:
+            return cur["sha256"]
+        digest = file_sha256(src)
+        self.entries[key] = {"size": st.st_size, "mtime": st.st_mtime, "sha256": digest}
+        return digest
+
+    def save(self) -> None:
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_text(json.dumps(self.entries))
+        os.replace(tmp, self.path)
+
+
+def list_files(src: pathlib.Path):
+    """[(path relative to src, path)] of every file under src (or src itself)."""
     if not src.exists():
-        return
+        print(f"WARNING: {src} does not exist; skipped", file=sys.stderr)
+        return []
+    if src.is_file():
+        return [(pathlib.PurePosixPath(src.name), src)]
+    return sorted((pathlib.PurePosixPath(p.relative_to(src).as_posix()), p) for p in src.rglob("*") if p.is_file())
+
+
+def plan_layout(sets: dict, extras: dict, hashes: HashCache, workers: int):
+    """Decide where each file goes.
+
+    sets: wheel set name -> source folder; extras: dataset folder -> source
+    (copied as is). Returns (layout {dataset path: (source, sha256, size)},
+    {set name: [dataset paths to install]}).
+    """
+    listed = {name: list_files(pathlib.Path(src)) for name, src in sets.items()}
+    extra = {name: list_files(pathlib.Path(src)) for name, src in extras.items()}
+    sources = [p for files in (*listed.values(), *extra.values()) for _, p in files]
+    with ThreadPoolExecutor(workers) as pool:
+        digests = dict(zip(sources, pool.map(hashes.sha256, sources)))
+
+    # (file name, sha256) present in more than one set is shared, unless the
+    # same name also has another hash: wheels_common/ is flat (pip
+    # --find-links does not recurse), so that name would collide there
+    seen, variants = {}, {}
+    for name, files in listed.items():
+        for rel, p in files:
+            seen.setdefault((rel.name, digests[p]), set()).add(name)
+            variants.setdefault(rel.name, set()).add(digests[p])
+    layout, members = {}, {}
+    for name, files in listed.items():
+        members[name] = []
+        for rel, p in files:
+            shared = len(seen[(rel.name, digests[p])]) > 1 and len(variants[rel.name]) == 1
+            dest = f"{COMMON}/{rel.name}" if shared else f"{name}/{rel}"
+            layout[dest] = (p, digests[p], p.stat().st_size)
+            members[name].append(dest)
+    for name, files in extra.items():
+        src = pathlib.Path(extras[name])
+        for rel, p in files:
+            dest = name if src.is_file() else f"{name}/{rel}"
+            layout[dest] = (p, digests[p], p.stat().st_size)
+    return layout, members
+
+
+def place(src: pathlib.Path, dst: pathlib.Path) -> str:
+    """Hardlink src to dst (no data copied), else copy; returns how."""
     dst.parent.mkdir(parents=True, exist_ok=True)
-    if src.is_dir():
-        if dst.exists():
-            # merge contents
-            for p in src.iterdir():
-                copy_into(p, dst / p.name)
-        else:
-            shutil.copytree(src, dst)
-    else:
-        shutil.copy2(src, dst)
+    tmp = dst.with_name(f".{dst.name}.tmp")
+    if tmp.exists():
+        tmp.unlink()
+    try:
+        os.link(src, tmp)
+        how = "linked"
+    except OSError:
+        shutil.copy2(src, tmp)
+        how = "copied"
+    os.replace(tmp, dst)
+    return how
+
+
+def sync(base: pathlib.Path, layout: dict, old: dict) -> dict:
+    """Make base match layout; files whose hash and size already match are kept."""
+    counts = {"kept": 0, "linked": 0, "copied": 0, "removed": 0}
+    for rel, (src, digest, size) in sorted(layout.items()):
+        dst = base / rel
+        prev = old.get(rel)
+        # A hardlink to the source is current by definition
+        linked = dst.is_file() and os.path.samefile(src, dst)
+        if linked or (prev and prev["sha256"] == digest and dst.is_file() and dst.stat().st_size == size):
+            counts["kept"] += 1
+            continue
+        counts[place(src, dst)] += 1
+    # Files from an earlier build that are no longer wanted
+    keep = set(layout) | {MANIFEST, METADATA}
+    for p in sorted(base.rglob("*"), reverse=True):
+        rel = p.relative_to(base).as_posix()
+        if p.is_file() and rel not in keep:
+            p.unlink()
+            counts["removed"] += 1
+        elif p.is_dir() and not any(p.iterdir()):
+            p.rmdir()
+    return counts
 
 
 def ensure_metadata(base: pathlib.Path, dataset_id: str, title: str, private: bool, subtitle: str, description: str) -> None:
@@ -34,7 +162,7 @@ def ensure_metadata(base: pathlib.Path, dataset_id: str, title: str, private: bo
         "keywords": ["audio", "demucs", "pytorch", "dsu"],
         "resources": [],
     }
-    (base / "dataset-metadata.json").write_text(json.dumps(meta, indent=2))
+    (base / METADATA).write_text(json.dumps(meta, indent=2))
 
 
 def kaggle_cli(*args: str) -> subprocess.CompletedProcess:
@@ -55,64 +183,77 @@ def main() -> int:
     parser.add_argument("--description", default="Pre-downloaded wheels for Torch/Torchaudio (multiple CUDA flavors) and Demucs, plus optional model checkpoints.")
     parser.add_argument("--private", action="store_true")
     parser.add_argument("--out", required=True, help="Output folder to assemble dataset (e.g. ./dsu-cache)")
-    parser.add_argument("--wheels-cu126", help="Folder with CUDA 12.6 wheels (torch+cu126, torchaudio+cu126)")
-    parser.add_argument("--wheels-cu124", help="Folder with CUDA 12.4 wheels")
-    parser.add_argument("--wheels-cu121", help="Folder with CUDA 12.1 wheels")
-    parser.add_argument("--wheels-cu118", help="Folder with CUDA 11.8 wheels")
+    for fl in FLAVORS:
+        parser.add_argument(f"--wheels-{fl}", help=f"Folder with CUDA {fl[2:-1]}.{fl[-1]} wheels (torch+{fl}, torchaudio+{fl})")
     parser.add_argument("--wheels", help="Generic wheels folder (fallback)")
     parser.add_argument("--models", help="Demucs models/checkpoints folder (optional)")
     parser.add_argument("--licenses", help="Folder with license texts to include (optional)")
     parser.add_argument("--readme", help="Optional README.md path to include")
     parser.add_argument("--message", default="Update DSU cache", help="Version message when updating existing dataset")
+    parser.add_argument("--hash-workers", type=int, default=4, help="Files hashed in parallel")
+    parser.add_argument("--force", action="store_true", help="Upload even if nothing changed")
+    parser.add_argument("--no-upload", action="store_true", help="Only assemble the folder")
 
     args = parser.parse_args()
 
     # Pre-flight: kaggle.json present?
     home = pathlib.Path.home()
     kg = home / ".kaggle" / "kaggle.json"
-    if not kg.exists():
+    if not args.no_upload and not kg.exists():
         print("ERROR: kaggle.json not found. Place it in ~/.kaggle/kaggle.json and chmod 600.", file=sys.stderr)
         return 2
 
     base = pathlib.Path(args.out).resolve()
-    if base.exists():
-        # keep structure but clear prior content to avoid stale files
-        shutil.rmtree(base)
     base.mkdir(parents=True, exist_ok=True)
+    try:
+        old = json.loads((base / MANIFEST).read_text())
+    except (OSError, ValueError):
+        old = {}
 
     # Assemble structure
-    if args.wheels_cu126 := getattr(args, "wheels_cu126"):
-        copy_into(pathlib.Path(args.wheels_cu126), base / "wheels_cu126")
-    if args.wheels_cu124 := getattr(args, "wheels_cu124"):
-        copy_into(pathlib.Path(args.wheels_cu124), base / "wheels_cu124")
-    if args.wheels_cu121 := getattr(args, "wheels_cu121"):
-        copy_into(pathlib.Path(args.wheels_cu121), base / "wheels_cu121")
-    if args.wheels_cu118 := getattr(args, "wheels_cu118"):
-        copy_into(pathlib.Path(args.wheels_cu118), base / "wheels_cu118")
+    sets = {f"wheels_{fl}": getattr(args, f"wheels_{fl}") for fl in FLAVORS if getattr(args, f"wheels_{fl}")}
     if args.wheels:
-        copy_into(pathlib.Path(args.wheels), base / "wheels")
-    if args.models:
-        copy_into(pathlib.Path(args.models), base / "models")
-    if args.licenses:
-        copy_into(pathlib.Path(args.licenses), base / "LICENSES")
-    if args.readme:
-        copy_into(pathlib.Path(args.readme), base / "README.md")
+        sets["wheels"] = args.wheels
+    extras = {name: src for name, src in (("models", args.models), ("LICENSES", args.licenses),
+                                          ("README.md", args.readme)) if src}
+    hashes = HashCache(base.with_name(f".{base.name}.hashes.json"))
+    layout, members = plan_layout(sets, extras, hashes, max(1, args.hash_workers))
+    hashes.save()
+    counts = sync(base, layout, old.get("files", {}))
+
+    files = {rel: {"sha256": digest, "size": size} for rel, (_src, digest, size) in sorted(layout.items())}
+    manifest = {"format": 1, "files": files, "sets": members}
+    (base / MANIFEST).write_text(json.dumps(manifest, indent=2))
+    shared = sum(1 for rel in files if rel.startswith(COMMON + "/"))
+    total = sum(f["size"] for f in files.values())
+    print(f"Assembled {len(files)} files ({total / 1e9:.2f} GB, {shared} shared in {COMMON}/): "
+          f"{counts['kept']} unchanged, {counts['linked']} linked, {counts['copied']} copied, {counts['removed']} removed")
 
     # Metadata
     ensure_metadata(base, args.dataset_id, args.title, args.private, args.subtitle, args.description)
+    if args.no_upload:
+        return 0
+    # Recorded only after an upload succeeds, so a failed one is retried next run
+    uploaded = base.with_name(f".{base.name}.uploaded")
+    digest = hashlib.sha256((base / MANIFEST).read_bytes() + (base / METADATA).read_bytes()).hexdigest()
+    changed = not uploaded.exists() or uploaded.read_text().strip() != digest
 
     # Create or version
     if dataset_exists(args.dataset_id):
+        if not changed and not args.force:
+            print("Dataset exists and nothing changed since the last build; skipping upload (--force to upload).")
+            return 0
         print("Dataset exists; creating new version…")
         r = kaggle_cli("datasets", "version", "-p", str(base), "-m", args.message, "-r", "zip")
     else:
         print("Creating dataset…")
         r = kaggle_cli("datasets", "create", "-p", str(base))
     sys.stdout.write(r.stdout)
-    return 0 if r.returncode == 0 else r.returncode
+    if r.returncode != 0:
+        return r.returncode
+    uploaded.write_text(digest)
+    return 0
 
 
 if __name__ == "__main__":
     sys.exit(main())
-
-
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""Quality-versus-speed report for the Space's engine=demucs_int8.
+
+Separates a fixed clip set with the fp32 model and its int8 variant through
+hf_space/engine.py (the code the Space runs) and writes a JSON report of
+inference time, speedup and SDR.
+
+Clips are either plain audio files, where the int8 stems are scored against
+the fp32 stems, or MUSDB-style folders holding mixture.wav plus one
+<stem>.wav per reference. For those, both engines are scored against the
+references and the report gives the SDR delta. Run it on the Space's hardware:
+
+    python tools/quant_report.py clips/ --models htdemucs,htdemucs_ft --out quant.json
+"""
+import argparse
+import json
+import pathlib
+import platform
+import sys
+import tempfile
+import time
+
+AUDIO_EXTS = {".wav", ".flac", ".mp3", ".ogg", ".m4a", ".aiff", ".aif"}
+
+
+def sdr(ref, est) -> float:
+    """Signal-to-distortion ratio in dB over the whole clip (Demucs' new_sdr)."""
+    import numpy as np
+
+    n = min(len(ref), len(est))
+    ref, est = ref[:n].astype(np.float64), est[:n].astype(np.float64)
+    num = np.sum(np.square(ref)) + 1e-8
+    den = np.sum(np.square(ref - est)) + 1e-8
+    return float(10 * np.log10(num / den))
+
+
+def read(path: pathlib.Path):
+    import soundfile as sf
+
+    data, _ = sf.read(str(path), dtype="float32", always_2d=True)
+    return data
+
+
+def find_clips(root: pathlib.Path):
+    """[(name, mixture path, {stem: reference path})], sorted by name."""
+    clips = []
+    for p in sorted(root.iterdir()):
+        if p.is_dir() and (p / "mixture.wav").exists():
+            refs = {r.stem: r for r in p.glob("*.wav") if r.name != "mixture.wav"}
+            clips.append((p.name, p / "mixture.wav", refs))
+        elif p.is_file() and p.suffix.lower() in AUDIO_EXTS:
+            clips.append((p.stem, p, {}))
+    return clips
+
+
+def separate(engine, mix: pathlib.Path, out: pathlib.Path, model: str, args, quantized: bool):
+    t = engine.separate(mix, out, model, "", args.jobs, args.shifts, args.segments, "rescale", quantized=quantized)
+    stem_dir = out / model / mix.name.rsplit(".", 1)[0]
+    return t, {p.stem: p for p in stem_dir.glob("*.wav")}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="SDR and speed of demucs_int8 against fp32 on a clip set")
+    parser.add_argument("clips", type=pathlib.Path, help="Folder of audio files or MUSDB-style track folders")
+    parser.add_argument("--models", default="htdemucs", help="Comma-separated Demucs models")
+    parser.add_argument("--jobs", type=int, default=0)
+    parser.add_argument("--shifts", type=int, default=0)
+    parser.add_argument("--segments", type=float, default=0)
+    parser.add_argument("--threads", type=int, default=0, help="torch threads (default: torch's own)")
+    parser.add_argument("--out", type=pathlib.Path, default=pathlib.Path("quant_report.json"))
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent / "hf_space"))
+    import numpy as np
+    import torch
+    import engine
+
+    if args.threads > 0:
+        torch.set_num_threads(args.threads)
+    clips = find_clips(args.clips)
+    if not clips:
+        print(f"[Quant] no clips under {args.clips}")
+        return 1
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"), "torch": torch.__version__, "cpu": platform.processor(),
+        "threads": torch.get_num_threads(), "shifts": args.shifts, "models": {},
+    }
+    for model in [m.strip() for m in args.models.split(",") if m.strip()]:
+        rows = []
+        for name, mix, refs in clips:
+            with tempfile.TemporaryDirectory(prefix="dsu-quant-") as tmp:
+                tmp = pathlib.Path(tmp)
+                # Warm both variants first so load time stays out of infer_s
+                engine.POOL.get(model)
+                engine.POOL.get(model + engine.INT8)
+                t32, s32 = separate(engine, mix, tmp / "fp32", model, args, False)
+                t8, s8 = separate(engine, mix, tmp / "int8", model, args, True)
+                row = {"clip": name, "fp32_infer_s": round(t32["infer_s"], 3), "int8_infer_s": round(t8["infer_s"], 3),
+                       "speedup": round(t32["infer_s"] / max(t8["infer_s"], 1e-6), 3), "stems": {}}
+                for stem in sorted(s32):
+                    if stem not in s8:
+                        continue
+                    a, b = read(s32[stem]), read(s8[stem])
+                    entry = {"int8_vs_fp32_sdr": round(sdr(a, b), 2)}
+                    if stem in refs:
+                        ref = read(refs[stem])
+                        entry["fp32_sdr"] = round(sdr(ref, a), 3)
+                        entry["int8_sdr"] = round(sdr(ref, b), 3)
+                        entry["sdr_delta"] = round(entry["int8_sdr"] - entry["fp32_sdr"], 3)
+                    row["stems"][stem] = entry
+            print(f"[Quant] {model} {name}: {row['fp32_infer_s']}s -> {row['int8_infer_s']}s "
+                  f"(x{row['speedup']}) {json.dumps(row['stems'])}")
+            rows.append(row)
+        deltas = [e["sdr_delta"] for r in rows for e in r["stems"].values() if "sdr_delta" in e]
+        agree = [e["int8_vs_fp32_sdr"] for r in rows for e in r["stems"].values()]
+        report["models"][model] = {
+            "clips": rows,
+            "speedup_mean": round(float(np.mean([r["speedup"] for r in rows])), 3),
+            "sdr_delta_mean": round(float(np.mean(deltas)), 3) if deltas else None,
+            "sdr_delta_min": round(float(np.min(deltas)), 3) if deltas else None,
+            "int8_vs_fp32_sdr_mean": round(float(np.mean(agree)), 2) if agree else None,
+        }
+    args.out.write_text(json.dumps(report, indent=2))
+    for model, summary in report["models"].items():
+        print(f"[Quant] {model}: speedup x{summary['speedup_mean']} sdr_delta={summary['sdr_delta_mean']} "
+              f"int8_vs_fp32={summary['int8_vs_fp32_sdr_mean']} dB")
+    print(f"[Quant] report written to {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())